@@ -18,6 +18,23 @@ import aiofiles
 import git
 from git.exc import GitCommandError
 
+# 每次嵌入请求的批量大小（与ChromaDB推荐的100-250批量写入保持一致）
+EMBEDDING_BATCH_SIZE = 100
+
+async def create_embeddings_batched(model_client, texts: List[str],
+                                    batch_size: int = EMBEDDING_BATCH_SIZE):
+    """按批量生成嵌入向量，返回 (N, dim) 的 float32 ndarray"""
+    import numpy as np
+    
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        result = await model_client.create_embeddings(texts[start:start + batch_size])
+        batches.append(np.asarray(result["embeddings"], dtype=np.float32))
+    
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate(batches, axis=0)
+
 @dataclass
 class ChromaDBMetadata:
     """ChromaDB元数据"""
@@ -38,7 +55,7 @@ class DocumentChunk:
     """文档块数据结构"""
     chunk_id: str
     content: str
-    embedding: List[float]
+    embedding: Union[List[float], "np.ndarray"]
     metadata: Dict
     source: str
     created_at: str
@@ -134,11 +151,12 @@ class LocalChromaDBManager:
             domain="credit_research"
         )
         
+        # 批量生成嵌入向量（ndarray行直接作为文档块的嵌入）
+        embeddings = await create_embeddings_batched(self.model_client, chunks_text)
+        
         chunks = []
         for i, chunk_text in enumerate(chunks_text):
-            # 生成嵌入向量
-            embedding_result = await self.model_client.create_embeddings([chunk_text])
-            embedding = embedding_result["embeddings"][0]
+            embedding = embeddings[i]
             
             # 计算质量评分
             quality_score = self._calculate_chunk_quality(chunk_text)
@@ -181,8 +199,8 @@ class LocalChromaDBManager:
         """保存文档块到本地数据库"""
         import numpy as np
         
-        # 保存嵌入向量
-        embeddings = np.array([chunk.embedding for chunk in chunks])
+        # 保存嵌入向量（ndarray行直接堆叠，无需列表往返）
+        embeddings = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
         np.save(self.embeddings_file, embeddings)
         
         # 保存文档块数据
@@ -418,11 +436,12 @@ class ServerChromaDBManager:
             domain="credit_research"
         )
         
+        # 批量生成嵌入向量
+        embeddings = await create_embeddings_batched(self.model_client, chunks_text)
+        
         chunks = []
         for i, chunk_text in enumerate(chunks_text):
-            # 生成嵌入向量
-            embedding_result = await self.model_client.create_embeddings([chunk_text])
-            embedding = embedding_result["embeddings"][0]
+            embedding = embeddings[i]
             
             # 计算质量评分（搜索结果通常质量较高）
             quality_score = self._calculate_search_result_quality(chunk_text, result)
@@ -10,6 +10,8 @@ import json
 from pathlib import Path
 from datetime import datetime
 
+import aiofiles
+
 # 模拟模型客户端（实际使用时替换为真实的千问API客户端）
 class MockQwenClient:
     """模拟千问API客户端"""
@@ -37,13 +39,10 @@ class MockQwenClient:
     
     async def create_embeddings(self, texts: list) -> dict:
         """模拟创建嵌入向量"""
-        import random
+        import numpy as np
         
-        embeddings = []
-        for text in texts:
-            # 生成1536维的随机向量（模拟千问API）
-            embedding = [random.random() for _ in range(1536)]
-            embeddings.append(embedding)
+        # 生成 (N, 1536) 的随机向量矩阵（模拟千问API），直接返回ndarray避免逐元素构造列表
+        embeddings = np.random.random((len(texts), 1536)).astype(np.float32)
         
         return {
             "embeddings": embeddings,
@@ -65,8 +64,11 @@ async def setup_demo_environment():
         "demo_downloads"
     ]
     
-    for dir_name in demo_dirs:
-        Path(dir_name).mkdir(exist_ok=True)
+    # 并行创建目录，避免在事件循环线程上串行执行mkdir系统调用
+    await asyncio.gather(*(
+        asyncio.to_thread(Path(dir_name).mkdir, exist_ok=True, parents=True)
+        for dir_name in demo_dirs
+    ))
     
     # 创建示例文档
     sample_documents = {
@@ -169,10 +171,15 @@ ESG评级体系的不断完善将推动企业更加关注可持续发展，实
 """
     }
     
-    # 写入示例文档
-    for file_path, content in sample_documents.items():
-        async with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+    # 并行写入示例文档
+    async def write_document(file_path: str, content: str):
+        async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
+            await f.write(content)
+    
+    await asyncio.gather(*(
+        write_document(file_path, content)
+        for file_path, content in sample_documents.items()
+    ))
     
     print(f"✅ 演示环境设置完成，创建了 {len(sample_documents)} 个示例文档")
 
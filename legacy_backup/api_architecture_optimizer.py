@@ -7,13 +7,28 @@ API架构优化器
 """
 
 import asyncio
+import bisect
+import heapq
 import json
+import sys
+import threading
 import time
+from collections import defaultdict, deque
 from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
+import dataclasses
+from dataclasses import dataclass
 from enum import Enum
+from types import MappingProxyType
 import logging
 
+import numpy as np
+
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
 from .unified_api_manager import UnifiedAPIManager, ModelProvider
 from .model_consistency_manager import consistency_manager
 from .progress_manager import ProgressManager, TaskType
@@ -22,6 +37,27 @@ from .progress_manager import ProgressManager, TaskType
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prometheus指标（可选依赖，未安装时跳过）
+try:
+    from prometheus_client import Counter, Histogram
+    SELECT_CACHE_HITS = Counter(
+        "api_opt_select_cache_hits_total", "提供商选择缓存命中次数", ["task_type"]
+    )
+    SELECT_CACHE_MISSES = Counter(
+        "api_opt_select_cache_misses_total", "提供商选择缓存未命中次数", ["task_type"]
+    )
+    SWITCH_DECISIONS = Counter(
+        "api_opt_switch_decisions_total", "提供商切换决策次数", ["from_provider", "to_provider"]
+    )
+    PROVIDER_LATENCY = Histogram(
+        "api_opt_provider_latency_seconds", "提供商请求延迟", ["provider", "task_type"]
+    )
+except ImportError:
+    SELECT_CACHE_HITS = SELECT_CACHE_MISSES = SWITCH_DECISIONS = PROVIDER_LATENCY = None
+
+# dataclass(slots=True) 需要 Python 3.10+
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
 class SwitchStrategy(Enum):
     """模型切换策略"""
     FAILOVER = "failover"           # 故障转移
@@ -36,7 +72,7 @@ class OptimizationLevel(Enum):
     STANDARD = "standard"   # 标准优化
     AGGRESSIVE = "aggressive" # 激进优化
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class APIEndpointConfig:
     """API端点配置"""
     provider: str
@@ -48,8 +84,9 @@ class APIEndpointConfig:
     cost_per_1k_tokens: float
     latency_ms: float
     reliability_score: float  # 0-1
+    task_type: str  # "chat", "embedding"
 
-@dataclass 
+@dataclass(**_DATACLASS_SLOTS)
 class SwitchDecision:
     """切换决策"""
     from_provider: str
@@ -57,76 +94,321 @@ class SwitchDecision:
     reason: str
     confidence: float
     expected_benefit: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "from_provider": self.from_provider,
+            "to_provider": self.to_provider,
+            "reason": self.reason,
+            "confidence": self.confidence,
+            "expected_benefit": self.expected_benefit
+        }
+
+# 单调时钟（纳秒整数），只用于内部时间窗口计算（EWMA、切换历史、指标窗口），对外的时间戳仍为 time.time()
+_now = time.monotonic_ns
+_NS_PER_SECOND = 1_000_000_000
+RECENT_SWITCH_WINDOW_NS = 3600 * _NS_PER_SECOND
+
+# 性能指标滑动窗口容量
+METRICS_WINDOW_SIZE = 1024
+# 切换历史保留条数
+SWITCH_HISTORY_SIZE = 10000
+
+class MetricsWindow:
+    """单个提供商/任务的性能指标环形缓冲区（SoA布局）
+    
+    窗口内的延迟和成功数以增量和维护，全量延迟的均值/方差用Welford算法在线更新。
+    """
+    
+    __slots__ = ("latency", "success", "tokens", "timestamps", "count",
+                 "window_latency_sum", "window_success_count",
+                 "latency_mean", "latency_m2")
+    
+    def __init__(self, capacity: int = METRICS_WINDOW_SIZE):
+        self.latency = np.zeros(capacity, dtype=np.float64)
+        self.success = np.zeros(capacity, dtype=bool)
+        self.tokens = np.zeros(capacity, dtype=np.int64)
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.window_latency_sum = 0.0
+        self.window_success_count = 0
+        self.latency_mean = 0.0
+        self.latency_m2 = 0.0
+    
+    def add(self, latency_ms: float, success: bool, tokens_used: int, timestamp: int):
+        """写入一条记录，覆盖窗口中最旧的记录"""
+        capacity = len(self.latency)
+        idx = self.count % capacity
+        if self.count >= capacity:
+            self.window_latency_sum -= self.latency[idx]
+            self.window_success_count -= int(self.success[idx])
+        
+        self.latency[idx] = latency_ms
+        self.success[idx] = success
+        self.tokens[idx] = tokens_used
+        self.timestamps[idx] = timestamp
+        self.count += 1
+        self.window_latency_sum += latency_ms
+        self.window_success_count += int(success)
+        
+        # Welford在线均值/方差
+        delta = latency_ms - self.latency_mean
+        self.latency_mean += delta / self.count
+        self.latency_m2 += delta * (latency_ms - self.latency_mean)
+    
+    @property
+    def window_size(self) -> int:
+        return min(self.count, len(self.latency))
+    
+    @property
+    def window_avg_latency(self) -> float:
+        return self.window_latency_sum / self.window_size if self.count else 0.0
+    
+    @property
+    def window_success_rate(self) -> float:
+        return self.window_success_count / self.window_size if self.count else 0.0
+    
+    @property
+    def latency_std(self) -> float:
+        return (self.latency_m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+# 策略特定评分函数：返回各端点在基础分数之上的加分数组
+def _score_failover(optimizer: "APIArchitectureOptimizer", arr: Dict[str, np.ndarray]) -> np.ndarray:
+    """故障转移：无额外加分"""
+    return np.zeros(len(arr["priority"]))
+
+def _score_cost(optimizer: "APIArchitectureOptimizer", arr: Dict[str, np.ndarray]) -> np.ndarray:
+    """成本优化：倾向于低成本"""
+    return np.maximum(0, 100 - arr["cost"] * 100) * 0.4
+
+def _score_performance(optimizer: "APIArchitectureOptimizer", arr: Dict[str, np.ndarray]) -> np.ndarray:
+    """性能优化：倾向于低延迟"""
+    return np.maximum(0, 100 - arr["latency"] / 20) * 0.4
+
+def _score_consistency(optimizer: "APIArchitectureOptimizer", arr: Dict[str, np.ndarray]) -> np.ndarray:
+    """一致性优化：倾向于高可靠性"""
+    return arr["reliability"] * 40
+
+def _score_load_balance(optimizer: "APIArchitectureOptimizer", arr: Dict[str, np.ndarray]) -> np.ndarray:
+    """负载均衡：考虑当前负载"""
+    return np.maximum(0, 100 - arr["load"]) * 0.3
+
+_STRATEGY_SCORE_FNS = {
+    SwitchStrategy.FAILOVER: _score_failover,
+    SwitchStrategy.COST_OPTIMIZE: _score_cost,
+    SwitchStrategy.PERFORMANCE: _score_performance,
+    SwitchStrategy.CONSISTENCY: _score_consistency,
+    SwitchStrategy.LOAD_BALANCE: _score_load_balance,
+}
+
+if _NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _score_all(priority, strategy_scores, max_tokens, mask, bonus_mask, input_tokens, out):
+        """
+        编译后的端点评分内核：写入各端点分数并返回最高分端点的下标
+        
+        策略加分由 _STRATEGY_SCORE_FNS 中的函数预先算好传入（与NumPy路径共用同一套公式），
+        内核只负责合并基础分、容量惩罚和一致性奖励
+        """
+        best = -1
+        best_score = -np.inf
+        for i in range(priority.shape[0]):
+            if not mask[i]:
+                out[i] = -np.inf
+                continue
+            
+            score = (3 - priority[i]) * 20.0 + strategy_scores[i]
+            if input_tokens > max_tokens[i]:
+                score *= 0.1
+            if bonus_mask[i]:
+                score += 30
+            
+            out[i] = score
+            if score > best_score:
+                best_score = score
+                best = i
+        return best
+
+# 默认端点配置表（模块加载时构建一次，各优化器实例共享，修改前写时复制）
+_DEFAULT_CONFIGS = MappingProxyType({
+    "qwen_chat": APIEndpointConfig(
+        provider="qwen",
+        model="qwen-plus",
+        endpoint="https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
+        priority=1,
+        max_requests_per_minute=60,
+        max_tokens_per_request=8000,
+        cost_per_1k_tokens=0.4,
+        latency_ms=1500,
+        reliability_score=0.95,
+        task_type="chat"
+    ),
+    "qwen_embedding": APIEndpointConfig(
+        provider="qwen",
+        model="text-embedding-v2",
+        endpoint="https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding",
+        priority=1,
+        max_requests_per_minute=120,
+        max_tokens_per_request=2000,
+        cost_per_1k_tokens=0.05,
+        latency_ms=800,
+        reliability_score=0.98,
+        task_type="embedding"
+    ),
+    # "deepseek_chat": APIEndpointConfig(  # 配置保留，便于将来扩展
+    #     provider="deepseek",
+    #     model="deepseek-chat",
+    #     endpoint="https://api.deepseek.com/chat/completions",
+    #     priority=2,
+    #     max_requests_per_minute=60,
+    #     max_tokens_per_request=4000,
+    #     cost_per_1k_tokens=0.14,
+    #     latency_ms=1200,
+    #     reliability_score=0.92,
+    #     task_type="chat"
+    # ),
+    # "deepseek_embedding": APIEndpointConfig(  # 配置保留，便于将来扩展
+    #     provider="deepseek",
+    #     model="deepseek-embedding",
+    #     endpoint="https://api.deepseek.com/embeddings",
+    #     priority=2,
+    #     max_requests_per_minute=100,
+    #     max_tokens_per_request=1500,
+    #     cost_per_1k_tokens=0.02,
+    #     latency_ms=600,
+    #     reliability_score=0.94,
+    #     task_type="embedding"
+    # )
+})
 
 class APIArchitectureOptimizer:
     """API架构优化器"""
     
+    __slots__ = (
+        "api_manager", "progress_manager", "endpoint_configs",
+        "_by_provider_task", "_by_task", "_endpoint_names", "_provider_names",
+        "_row_by_provider_task", "_arr", "_task_masks", "_token_thresholds",
+        "performance_metrics", "_metric_windows", "switch_history",
+        "current_strategy", "optimization_level", "_score_fn",
+        "_load_ewma", "_last_request_at", "_score_cache", "_metrics_version",
+        "_locks", "_index_lock",
+    )
+    
     def __init__(self):
         self.api_manager = None
         self.progress_manager = ProgressManager()
         self.endpoint_configs: Dict[str, APIEndpointConfig] = {}
+        self._by_provider_task: Dict[Tuple[str, str], APIEndpointConfig] = {}
+        self._by_task: Dict[str, List[APIEndpointConfig]] = {}
+        
+        # 端点评分用的SoA数组（与 _endpoint_names/_provider_names 按行对齐）
+        self._endpoint_names: List[str] = []
+        self._provider_names: List[str] = []
+        self._row_by_provider_task: Dict[Tuple[str, str], int] = {}
+        self._arr: Dict[str, np.ndarray] = {}
+        self._task_masks: Dict[str, np.ndarray] = {}
         self.performance_metrics: Dict[str, Dict] = {}
-        self.switch_history: List[SwitchDecision] = []
+        self._metric_windows: Dict[str, MetricsWindow] = {}
+        # 按指标键加锁，不同提供商/任务的指标窗口更新互不阻塞
+        self._locks: Dict[str, threading.Lock] = {}
+        # 端点索引、评分数组与按提供商的负载状态由同一把锁保护（写时复制时会在持锁状态下重建索引）
+        self._index_lock = threading.RLock()
+        # (单调时间戳, 决策)，超出容量自动淘汰最旧记录
+        self.switch_history: deque = deque(maxlen=SWITCH_HISTORY_SIZE)
         self.current_strategy = SwitchStrategy.CONSISTENCY
         self.optimization_level = OptimizationLevel.STANDARD
+        self._score_fn = _STRATEGY_SCORE_FNS[self.current_strategy]
+        
+        # 负载估计：按提供商的请求速率EWMA（占每分钟请求上限的百分比）
+        self._load_ewma: Dict[str, float] = defaultdict(float)
+        self._last_request_at: Dict[str, int] = {}
+        
+        # 评分缓存：指标或策略变化时整体失效
+        self._score_cache: Dict[Tuple, Tuple[str, float]] = {}
+        self._metrics_version: int = 0
         
         # 初始化默认配置
         self._init_default_configs()
     
     def _init_default_configs(self):
         """初始化默认配置"""
-        self.endpoint_configs = {
-            "qwen_chat": APIEndpointConfig(
-                provider="qwen",
-                model="qwen-plus",
-                endpoint="https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
-                priority=1,
-                max_requests_per_minute=60,
-                max_tokens_per_request=8000,
-                cost_per_1k_tokens=0.4,
-                latency_ms=1500,
-                reliability_score=0.95
-            ),
-            "qwen_embedding": APIEndpointConfig(
-                provider="qwen",
-                model="text-embedding-v2",
-                endpoint="https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding",
-                priority=1,
-                max_requests_per_minute=120,
-                max_tokens_per_request=2000,
-                cost_per_1k_tokens=0.05,
-                latency_ms=800,
-                reliability_score=0.98
-            ),
-            # "deepseek_chat": APIEndpointConfig(  # 配置保留，便于将来扩展
-            #     provider="deepseek",
-            #     model="deepseek-chat",
-            #     endpoint="https://api.deepseek.com/chat/completions",
-            #     priority=2,
-            #     max_requests_per_minute=60,
-            #     max_tokens_per_request=4000,
-            #     cost_per_1k_tokens=0.14,
-            #     latency_ms=1200,
-            #     reliability_score=0.92
-            # ),
-            # "deepseek_embedding": APIEndpointConfig(  # 配置保留，便于将来扩展
-            #     provider="deepseek",
-            #     model="deepseek-embedding",
-            #     endpoint="https://api.deepseek.com/embeddings",
-            #     priority=2,
-            #     max_requests_per_minute=100,
-            #     max_tokens_per_request=1500,
-            #     cost_per_1k_tokens=0.02,
-            #     latency_ms=600,
-            #     reliability_score=0.94
-            # )
+        self.endpoint_configs = dict(_DEFAULT_CONFIGS)
+        self._rebuild_endpoint_index()
+    
+    def _rebuild_endpoint_index(self):
+        """重建端点索引（端点配置变更后调用）"""
+        self._by_provider_task = {}
+        self._by_task = {}
+        self._row_by_provider_task = {}
+        for row, config in enumerate(self.endpoint_configs.values()):
+            self._by_provider_task[(config.provider, config.task_type)] = config
+            self._by_task.setdefault(config.task_type, []).append(config)
+            self._row_by_provider_task[(config.provider, config.task_type)] = row
+        
+        configs = list(self.endpoint_configs.values())
+        self._endpoint_names = list(self.endpoint_configs)
+        self._provider_names = [config.provider for config in configs]
+        self._arr = {
+            "provider": np.array(self._provider_names, dtype=object),
+            "priority": np.array([c.priority for c in configs], dtype=np.int8),
+            "cost": np.array([c.cost_per_1k_tokens for c in configs], dtype=np.float64),
+            "latency": np.array([c.latency_ms for c in configs], dtype=np.float64),
+            "reliability": np.array([c.reliability_score for c in configs], dtype=np.float64),
+            "max_tokens": np.array([c.max_tokens_per_request for c in configs], dtype=np.int64),
+            "load": np.array([self._get_current_load(c.provider) for c in configs], dtype=np.float64),
+        }
+        task_array = np.array([c.task_type for c in configs], dtype=object)
+        self._task_masks = {
+            task_type: task_array == task_type for task_type in self._by_task
         }
+        self._task_masks["general"] = np.ones(len(configs), dtype=bool)
+        
+        # 容量阈值（用于输入token分桶）
+        self._token_thresholds = sorted(
+            {config.max_tokens_per_request for config in self.endpoint_configs.values()}
+        )
+        self._invalidate_score_cache()
+    
+    def _own_config(self, provider: str, task_type: str) -> Optional[APIEndpointConfig]:
+        """获取可修改的端点配置：首次修改共享的默认配置前复制一份（写时复制）"""
+        row = self._row_by_provider_task.get((provider, task_type))
+        if row is None:
+            return None
+        
+        name = self._endpoint_names[row]
+        config = self.endpoint_configs[name]
+        if config is _DEFAULT_CONFIGS.get(name):
+            with self._index_lock:
+                config = self.endpoint_configs[name]
+                if config is _DEFAULT_CONFIGS.get(name):
+                    self.endpoint_configs[name] = config = dataclasses.replace(config)
+                    self._rebuild_endpoint_index()
+        return config
+    
+    def _lock_for(self, key: str) -> threading.Lock:
+        """指标键对应的锁（dict.setdefault 保证并发首次访问时只创建一把）"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+    
+    def _invalidate_score_cache(self):
+        """使评分缓存失效"""
+        self._metrics_version += 1
+        self._score_cache.clear()
+    
+    def _token_bucket(self, input_tokens: int) -> int:
+        """按端点容量阈值分桶，同一桶内的容量检查结果完全一致"""
+        return bisect.bisect_left(self._token_thresholds, input_tokens)
     
     def set_strategy(self, strategy: SwitchStrategy, optimization_level: OptimizationLevel = OptimizationLevel.STANDARD):
         """设置切换策略和优化级别"""
         self.current_strategy = strategy
         self.optimization_level = optimization_level
-        logger.info(f"🔧 API架构策略: {strategy.value}, 优化级别: {optimization_level.value}")
+        self._score_fn = _STRATEGY_SCORE_FNS[strategy]
+        self._invalidate_score_cache()
+        logger.info("🔧 API架构策略: %s, 优化级别: %s", strategy.value, optimization_level.value)
     
     def analyze_optimal_provider(self, task_type: str, input_tokens: int, 
                                 requirements: Dict[str, Any] = None) -> Tuple[str, float]:
@@ -134,69 +416,140 @@ class APIArchitectureOptimizer:
         if not requirements:
             requirements = {}
         
-        scores = {}
+        # 一致性奖励依赖推荐模型的提供商，每次请求只查询一次，并纳入缓存键
+        preferred_provider = self._get_preferred_provider(requirements)
         
-        # 过滤相关端点
-        relevant_endpoints = {
-            name: config for name, config in self.endpoint_configs.items()
-            if (task_type in name) or (task_type == "general")
-        }
+        try:
+            cache_key = (
+                "optimal_provider", self.current_strategy, self.optimization_level,
+                task_type, self._token_bucket(input_tokens),
+                frozenset(requirements.items()), preferred_provider, self._metrics_version
+            )
+        except TypeError:
+            cache_key = None  # requirements中含不可哈希的值，跳过缓存
         
-        for endpoint_name, config in relevant_endpoints.items():
-            score = 0.0
-            
-            # 基础分数 = 优先级权重
-            score += (3 - config.priority) * 20
-            
-            # 策略特定评分
-            if self.current_strategy == SwitchStrategy.COST_OPTIMIZE:
-                # 成本优化：倾向于低成本
-                cost_score = max(0, 100 - config.cost_per_1k_tokens * 100)
-                score += cost_score * 0.4
-                
-            elif self.current_strategy == SwitchStrategy.PERFORMANCE:
-                # 性能优化：倾向于低延迟
-                latency_score = max(0, 100 - config.latency_ms / 20)
-                score += latency_score * 0.4
-                
-            elif self.current_strategy == SwitchStrategy.CONSISTENCY:
-                # 一致性优化：倾向于高可靠性
-                score += config.reliability_score * 40
-                
-            elif self.current_strategy == SwitchStrategy.LOAD_BALANCE:
-                # 负载均衡：考虑当前负载
-                current_load = self._get_current_load(config.provider)
-                load_score = max(0, 100 - current_load)
-                score += load_score * 0.3
-            
-            # 容量检查
-            if input_tokens > config.max_tokens_per_request:
-                score *= 0.1  # 严重惩罚
-            
-            # 特殊要求检查
-            if requirements.get("consistency_required") and consistency_manager:
-                # 检查一致性哈希
-                current_hash = consistency_manager.get_recommended_model()
-                if current_hash:
-                    model_info = consistency_manager.get_model_info(current_hash)
-                    if model_info and model_info.provider == config.provider:
-                        score += 30  # 一致性奖励
-            
-            scores[config.provider] = score
+        if cache_key is not None:
+            cached = self._score_cache.get(cache_key)
+            if SELECT_CACHE_HITS is not None:
+                counter = SELECT_CACHE_HITS if cached is not None else SELECT_CACHE_MISSES
+                counter.labels(task_type).inc()
+            if cached is not None:
+                return cached
+        
+        result = self._compute_optimal_provider(task_type, input_tokens, preferred_provider)
+        if cache_key is not None:
+            self._score_cache[cache_key] = result
+        return result
+    
+    def _get_preferred_provider(self, requirements: Dict[str, Any]) -> Optional[str]:
+        """获取一致性要求下推荐模型的提供商（无要求时返回None）"""
+        if not (requirements.get("consistency_required") and consistency_manager):
+            return None
+        
+        current_hash = consistency_manager.get_recommended_model()
+        model_info = consistency_manager.get_model_info(current_hash) if current_hash else None
+        return model_info.provider if model_info else None
+    
+    def rank_providers(self, task_type: str, input_tokens: int,
+                       requirements: Dict[str, Any] = None, k: int = 3) -> List[Tuple[str, float]]:
+        """按分数返回前k个候选提供商（用于构建故障转移回退链）"""
+        if not requirements:
+            requirements = {}
+        
+        scores = self._score_endpoints(
+            task_type, input_tokens, self._get_preferred_provider(requirements)
+        )
+        if scores is None:
+            return []
+        
+        # 每个提供商取其最佳端点的分数
+        best_by_provider: Dict[str, float] = {}
+        for provider, score in zip(self._provider_names, scores.tolist()):
+            if score > best_by_provider.get(provider, -np.inf):
+                best_by_provider[provider] = score
+        
+        return heapq.nlargest(k, best_by_provider.items(), key=lambda item: item[1])
+    
+    def _compute_optimal_provider(self, task_type: str, input_tokens: int,
+                                  preferred_provider: Optional[str]) -> Tuple[str, float]:
+        """计算最优提供商（未缓存）"""
+        if _NUMBA_AVAILABLE:
+            scores, best = self._score_endpoints_jit(task_type, input_tokens, preferred_provider)
+        else:
+            scores = self._score_endpoints(task_type, input_tokens, preferred_provider)
+            # 选择最高分的端点（单次argmax，不构建中间字典）
+            best = int(scores.argmax()) if scores is not None else -1
         
-        # 选择最高分的提供商
-        if scores:
-            best_provider = max(scores.keys(), key=lambda k: scores[k])
-            return best_provider, scores[best_provider]
+        if scores is None:
+            return "qwen", 50.0  # 默认
         
-        return "qwen", 50.0  # 默认
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("端点评分 %s: %s", task_type, {
+                name: float(score)
+                for name, score in zip(self._endpoint_names, scores)
+                if score != -np.inf
+            })
+        return self._provider_names[best], float(scores[best])
+    
+    def _score_endpoints_jit(self, task_type: str, input_tokens: int,
+                             preferred_provider: Optional[str]) -> Tuple[Optional[np.ndarray], int]:
+        """使用Numba编译内核评分，返回(分数数组, 最高分下标)"""
+        mask = self._task_masks.get(task_type)
+        if mask is None or not mask.any():
+            return None, -1
+        
+        arr = self._arr
+        bonus_mask = (arr["provider"] == preferred_provider) if preferred_provider \
+            else np.zeros(len(mask), dtype=bool)
+        scores = np.empty(len(mask), dtype=np.float64)
+        strategy_scores = np.asarray(self._score_fn(self, arr), dtype=np.float64)
+        best = _score_all(
+            arr["priority"], strategy_scores, arr["max_tokens"],
+            mask, bonus_mask, input_tokens, scores
+        )
+        return scores, best
+    
+    def _score_endpoints(self, task_type: str, input_tokens: int,
+                         preferred_provider: Optional[str]) -> Optional[np.ndarray]:
+        """对所有端点做向量化评分，不相关端点记为-inf；无相关端点时返回None"""
+        mask = self._task_masks.get(task_type)
+        if mask is None or not mask.any():
+            return None
+        
+        arr = self._arr
+        
+        # 基础分数 = 优先级权重
+        scores = (3 - arr["priority"]).astype(np.float64) * 20
+        
+        # 策略特定评分（set_strategy 时绑定）
+        scores += self._score_fn(self, arr)
+        
+        # 容量检查：超出容量严重惩罚
+        scores *= np.where(input_tokens > arr["max_tokens"], 0.1, 1.0)
+        
+        # 特殊要求检查：一致性奖励
+        if preferred_provider:
+            scores += np.where(arr["provider"] == preferred_provider, 30, 0)
+        
+        return np.where(mask, scores, -np.inf)
     
     def _get_current_load(self, provider: str) -> float:
         """获取当前负载(0-100)"""
-        # 模拟负载计算
-        import random
-        random.seed(hash(provider) % 1000)
-        return random.uniform(10, 80)
+        return self._load_ewma.get(provider, 0.0)
+    
+    def _update_load(self, provider: str, config: Optional[APIEndpointConfig]):
+        """根据请求到达间隔更新负载EWMA（调用方需持有 _index_lock）"""
+        now = _now()
+        last = self._last_request_at.get(provider)
+        self._last_request_at[provider] = now
+        if last is None or not config:
+            return
+        
+        # 瞬时速率（请求/分钟）换算为占上限的百分比
+        instant_rate = 60 * _NS_PER_SECOND / max(now - last, 1_000_000)
+        instant_load = min(100.0, instant_rate / config.max_requests_per_minute * 100)
+        self._load_ewma[provider] = 0.8 * self._load_ewma[provider] + 0.2 * instant_load
+        self._arr["load"][self._arr["provider"] == provider] = self._load_ewma[provider]
     
     def should_switch_provider(self, current_provider: str, task_type: str, 
                              input_tokens: int, error_count: int = 0) -> Optional[SwitchDecision]:
@@ -246,18 +599,26 @@ class APIArchitectureOptimizer:
                 expected_benefit=expected_benefit
             )
             
-            self.switch_history.append(decision)
+            self.switch_history.append((_now(), decision))
+            if SWITCH_DECISIONS is not None:
+                SWITCH_DECISIONS.labels(current_provider, recommended_provider).inc()
             return decision
         
         return None
     
     def _calculate_provider_score(self, provider: str, task_type: str, input_tokens: int) -> float:
         """计算提供商分数"""
-        relevant_config = None
-        for name, config in self.endpoint_configs.items():
-            if config.provider == provider and task_type in name:
-                relevant_config = config
-                break
+        cache_key = ("provider_score", provider, task_type, self._metrics_version)
+        if cache_key in self._score_cache:
+            return self._score_cache[cache_key]
+        
+        score = self._compute_provider_score(provider, task_type)
+        self._score_cache[cache_key] = score
+        return score
+    
+    def _compute_provider_score(self, provider: str, task_type: str) -> float:
+        """计算提供商分数（未缓存）"""
+        relevant_config = self._by_provider_task.get((provider, task_type))
         
         if not relevant_config:
             return 0.0
@@ -311,40 +672,64 @@ class APIArchitectureOptimizer:
     
     def _get_provider_config(self, provider: str, task_type: str) -> Optional[APIEndpointConfig]:
         """获取提供商配置"""
-        for name, config in self.endpoint_configs.items():
-            if config.provider == provider and task_type in name:
-                return config
-        return None
+        return self._by_provider_task.get((provider, task_type))
     
     def update_performance_metrics(self, provider: str, task_type: str, 
                                  latency_ms: float, success: bool, tokens_used: int):
         """更新性能指标"""
         key = f"{provider}_{task_type}"
+        now = _now()
+        updated_at = time.time()  # 对外展示的更新时间保持墙上时间（秒），单调时钟只用于时间窗口
         
-        if key not in self.performance_metrics:
-            self.performance_metrics[key] = {
-                "total_requests": 0,
-                "successful_requests": 0,
-                "total_latency": 0,
-                "total_tokens": 0,
-                "last_updated": time.time()
-            }
+        with self._lock_for(key):
+            metrics = self.performance_metrics.get(key)
+            if metrics is None:
+                metrics = self.performance_metrics[key] = {
+                    "total_requests": 0,
+                    "successful_requests": 0,
+                    "total_latency": 0,
+                    "total_tokens": 0,
+                    "avg_latency_ms": 0.0,
+                    "success_rate": 0.0,
+                    "last_updated": updated_at
+                }
+            
+            metrics["total_requests"] += 1
+            if success:
+                metrics["successful_requests"] += 1
+            metrics["total_latency"] += latency_ms
+            metrics["total_tokens"] += tokens_used
+            metrics["avg_latency_ms"] = metrics["total_latency"] / metrics["total_requests"]
+            metrics["success_rate"] = metrics["successful_requests"] / metrics["total_requests"]
+            metrics["last_updated"] = updated_at
+            
+            window = self._metric_windows.get(key)
+            if window is None:
+                window = self._metric_windows[key] = MetricsWindow()
+            window.add(latency_ms, success, tokens_used, now)
+            window_latency = window.window_avg_latency
+            window_success_rate = window.window_success_rate
         
-        metrics = self.performance_metrics[key]
-        metrics["total_requests"] += 1
-        if success:
-            metrics["successful_requests"] += 1
-        metrics["total_latency"] += latency_ms
-        metrics["total_tokens"] += tokens_used
-        metrics["last_updated"] = time.time()
-        
-        # 更新端点配置中的实时指标
-        config = self._get_provider_config(provider, task_type)
-        if config:
-            # 更新平均延迟
-            config.latency_ms = metrics["total_latency"] / metrics["total_requests"]
-            # 更新可靠性分数
-            config.reliability_score = metrics["successful_requests"] / metrics["total_requests"]
+        # 端点配置、评分数组和负载EWMA按提供商共享，统一在索引锁内更新
+        with self._index_lock:
+            # 更新端点配置中的实时指标（最近窗口内）
+            config = self._own_config(provider, task_type)
+            if config:
+                # 更新平均延迟
+                config.latency_ms = window_latency
+                # 更新可靠性分数
+                config.reliability_score = window_success_rate
+                
+                # 同步评分数组
+                row = self._row_by_provider_task[(provider, task_type)]
+                self._arr["latency"][row] = config.latency_ms
+                self._arr["reliability"][row] = config.reliability_score
+            
+            self._update_load(provider, config)
+        
+        if PROVIDER_LATENCY is not None:
+            PROVIDER_LATENCY.labels(provider, task_type).observe(latency_ms / 1000)
+        self._invalidate_score_cache()
     
     def optimize_architecture(self) -> Dict[str, Any]:
         """执行架构优化"""
@@ -357,15 +742,20 @@ class APIArchitectureOptimizer:
             "switch_history_count": len(self.switch_history)
         }
         
-        # 分析性能指标
-        for key, metrics in self.performance_metrics.items():
+        # 分析性能指标（在锁内取快照，锁外计算）
+        for key in list(self.performance_metrics):
             provider, task_type = key.split("_", 1)
             
-            avg_latency = metrics["total_latency"] / metrics["total_requests"]
-            success_rate = metrics["successful_requests"] / metrics["total_requests"]
+            with self._lock_for(key):
+                metrics = dict(self.performance_metrics[key])
+                latency_std = self._metric_windows[key].latency_std
+            
+            avg_latency = metrics["avg_latency_ms"]
+            success_rate = metrics["success_rate"]
             
             optimization_report["performance_summary"][key] = {
                 "avg_latency_ms": round(avg_latency, 1),
+                "latency_std_ms": round(latency_std, 1),
                 "success_rate": round(success_rate, 3),
                 "total_requests": metrics["total_requests"],
                 "total_tokens": metrics["total_tokens"]
@@ -394,12 +784,13 @@ class APIArchitectureOptimizer:
     
     def get_architecture_status(self) -> Dict[str, Any]:
         """获取架构状态"""
+        now = _now()
         return {
             "current_strategy": self.current_strategy.value,
             "optimization_level": self.optimization_level.value,
             "endpoint_count": len(self.endpoint_configs),
             "performance_metrics_count": len(self.performance_metrics),
-            "recent_switches": len([s for s in self.switch_history if time.time() - s.confidence < 3600]),
+            "recent_switches": sum(1 for ts, _ in self.switch_history if now - ts < RECENT_SWITCH_WINDOW_NS),
             "total_switches": len(self.switch_history),
             "consistency_manager_active": consistency_manager is not None
         }
@@ -407,7 +798,13 @@ class APIArchitectureOptimizer:
     def reset_metrics(self):
         """重置性能指标"""
         self.performance_metrics.clear()
+        self._metric_windows.clear()
         self.switch_history.clear()
+        with self._index_lock:
+            self._load_ewma.clear()
+            self._last_request_at.clear()
+            self._arr["load"][:] = 0.0
+        self._invalidate_score_cache()
         logger.info("🔄 性能指标已重置")
 
 
@@ -417,9 +814,9 @@ api_optimizer = APIArchitectureOptimizer()
 def optimize_api_selection(task_type: str, input_tokens: int, 
                          current_provider: str = None, 
                          requirements: Dict[str, Any] = None) -> str:
-    """优化API选择（简化接口）"""
+    """优化API选择（简化接口，结果由优化器按token分桶缓存）"""
     recommended_provider, _ = api_optimizer.analyze_optimal_provider(
-        task_type, input_tokens, requirements
+        task_type, input_tokens, requirements or {}
     )
     return recommended_provider
 
@@ -429,7 +826,7 @@ def check_switch_recommendation(current_provider: str, task_type: str,
     decision = api_optimizer.should_switch_provider(
         current_provider, task_type, input_tokens, error_count
     )
-    return asdict(decision) if decision else None
+    return decision.to_dict() if decision else None
 
 
 # 演示函数
@@ -454,8 +851,12 @@ async def demo_api_optimization():
         # ("deepseek", "chat", 1100, True, 1200),  # 演示代码保留
     ]
     
+    # 并发提交指标更新（接入真实API管理器后这些调用是I/O密集型的）
+    await asyncio.gather(*[
+        asyncio.to_thread(optimizer.update_performance_metrics, *scenario)
+        for scenario in test_scenarios
+    ])
     for provider, task_type, latency, success, tokens in test_scenarios:
-        optimizer.update_performance_metrics(provider, task_type, latency, success, tokens)
         print(f"   📈 {provider}/{task_type}: {latency}ms, 成功: {success}")
     
     # 测试最优提供商选择
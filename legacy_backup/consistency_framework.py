@@ -9,27 +9,70 @@
 import json
 import hashlib
 import asyncio
-import numpy as np
-from typing import Dict, List, Any, Optional, Tuple, Set
+import itertools
+import sys
+from typing import Dict, List, Any, Optional, Tuple, Set, Deque, Union
+from collections import deque
 from dataclasses import dataclass, asdict
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 from enum import Enum
 import logging
 
-from .model_consistency_manager import consistency_manager, ModelConfig
+from .model_consistency_manager import consistency_manager, ModelConfig, ConsistencyRecord
 from .unified_api_manager import UnifiedAPIManager, ModelProvider
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置交由应用入口负责
 logger = logging.getLogger(__name__)
 
+# 规则导入导出的JSON编解码（优先使用orjson，未安装时回退标准库）
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(
+            obj, indent=2, ensure_ascii=False,
+            default=lambda o: o.value if isinstance(o, Enum) else str(o)
+        ).encode("utf-8")
+
+    _loads = json.loads
+
+# dataclass(slots=True) 需要 Python 3.10+
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@lru_cache(maxsize=1024)
+def _hash_model(provider: str, model_name: str, api_version: str, dimension: Union[int, str]) -> str:
+    """计算标准化模型描述的一致性哈希（相同模型描述直接命中缓存）"""
+    # 逐字段增量写入，不拼接中间字符串；结果与哈希 "p|m|v|d" 一致
+    h = hashlib.sha256()
+    h.update(provider.encode()); h.update(b"|")
+    h.update(model_name.encode()); h.update(b"|")
+    h.update(api_version.encode()); h.update(b"|")
+    h.update(str(dimension).encode())
+    return h.hexdigest()[:16]
+
 class ConsistencyLevel(Enum):
     """一致性级别"""
     STRICT = "strict"       # 严格模式：必须使用完全相同的模型
     COMPATIBLE = "compatible" # 兼容模式：允许同提供商不同版本
     FLEXIBLE = "flexible"   # 灵活模式：允许不同提供商但相同维度
 
+# 验证ID计数器，同一秒内的多次验证也不会重复
+_validation_counter = itertools.count()
+
+# 一致性级别的严格程度，数值越大越严格
+_LEVEL_ORDER = {
+    ConsistencyLevel.STRICT: 3,
+    ConsistencyLevel.COMPATIBLE: 2,
+    ConsistencyLevel.FLEXIBLE: 1
+}
+
 class ValidationResult(Enum):
     """验证结果"""
     VALID = "valid"
@@ -37,7 +80,7 @@ class ValidationResult(Enum):
     ERROR = "error"
     BLOCKED = "blocked"
 
-@dataclass
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class ConsistencyRule:
     """一致性规则"""
     rule_id: str
@@ -47,7 +90,7 @@ class ConsistencyRule:
     auto_fix: bool
     priority: int  # 1-5, 1最高
 
-@dataclass
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class ValidationReport:
     """验证报告"""
     validation_id: str
@@ -62,12 +105,26 @@ class ValidationReport:
 class ConsistencyFramework:
     """模型一致性框架"""
     
-    def __init__(self, consistency_level: ConsistencyLevel = ConsistencyLevel.STRICT):
+    def __init__(self, consistency_level: ConsistencyLevel = ConsistencyLevel.STRICT,
+                 max_history: int = 1000):
         self.consistency_level = consistency_level
         self.rules: List[ConsistencyRule] = []
-        self.validation_history: List[ValidationReport] = []
+        # 只保留最近的验证记录，避免长期运行时无限增长
+        self.validation_history: Deque[ValidationReport] = deque(maxlen=max_history)
+        self.total_validations = 0
         self.blocked_operations: Set[str] = set()
         self.auto_fix_enabled = True
+        # 规则ID -> 检查方法（api_version_check 目前没有检查逻辑）
+        self._rule_checkers = {
+            "exact_model_match": self._check_exact_match,
+            "provider_consistency": self._check_provider,
+            "dimension_compatibility": self._check_dimension,
+            "chromadb_version_match": self._check_chromadb
+        }
+        # 按一致性级别过滤并按优先级排序后的规则缓存
+        self._active_rules_cache: Optional[List[ConsistencyRule]] = None
+        # 规则对象 -> asdict结果缓存（规则不可变且可哈希，同ID的不同规则各自缓存）
+        self._rule_dict_cache: Dict[ConsistencyRule, dict] = {}
         
         # 初始化默认规则
         self._init_default_rules()
@@ -78,6 +135,11 @@ class ConsistencyFramework:
             768: ["bert", "sentence-transformers"],
             512: ["lightweight-models"]
         }
+        # 维度 -> 兼容提供商集合（统一小写），用于O(1)兼容性判断
+        self._dim_provider_set: Dict[int, frozenset] = {
+            dim: frozenset(p.lower() for p in providers)
+            for dim, providers in self.dimension_compatibility.items()
+        }
     
     def _init_default_rules(self):
         """初始化默认一致性规则"""
@@ -128,28 +190,41 @@ class ConsistencyFramework:
                                  operation_type: str = "embedding",
                                  chromadb_version: str = None) -> ValidationReport:
         """验证模型一致性"""
-        validation_id = f"validation_{int(datetime.now().timestamp())}"
+        now = datetime.now()
+        validation_id = f"validation_{next(_validation_counter)}"
         
         violations = []
         recommendations = []
         auto_fixes_applied = []
         result = ValidationResult.VALID
+        hash_dirty = False
         
         # 生成提议模型的一致性哈希
         proposed_hash = self._generate_consistency_hash(proposed_model)
         
-        # 获取当前推荐模型
-        current_hash = consistency_manager.get_recommended_model() if consistency_manager else None
+        # 获取当前推荐模型（一致性管理器及其记录表只查找一次）
+        cm = consistency_manager
+        records = cm.records if cm else None
+        current_hash = cm.get_recommended_model() if cm else None
         current_model = None
-        if current_hash and consistency_manager:
-            current_model = consistency_manager.get_model_info(current_hash)
+        current_record = None
+        if current_hash:
+            current_model = cm.get_model_info(current_hash)
+            current_record = records.get(current_hash)
+        
+        # 检查操作是否被阻止（被阻止时无需再执行规则检查）
+        if operation_type in self.blocked_operations:
+            result = ValidationResult.BLOCKED
+            violations.append({
+                "rule_id": "operation_blocked",
+                "message": f"操作类型 {operation_type} 当前被阻止",
+                "severity": "critical"
+            })
         
         # 执行规则验证
-        for rule in sorted(self.rules, key=lambda r: r.priority):
-            if not self._is_rule_applicable(rule, operation_type):
-                continue
-            
-            violation = self._check_rule(rule, proposed_model, current_model, chromadb_version)
+        active_rules = self._get_active_rules() if result != ValidationResult.BLOCKED else ()
+        for rule in active_rules:
+            violation = self._check_rule(rule, proposed_model, current_model, current_record, chromadb_version)
             if violation:
                 violations.append(violation)
                 
@@ -163,30 +238,24 @@ class ConsistencyFramework:
                 
                 # 尝试自动修复
                 if rule.auto_fix and self.auto_fix_enabled:
-                    fix_applied = self._apply_auto_fix(rule, violation, proposed_model)
+                    fix_applied, hash_changed = self._apply_auto_fix(rule, violation, proposed_model)
                     if fix_applied:
                         auto_fixes_applied.append(fix_applied)
-                        # 重新生成哈希
-                        proposed_hash = self._generate_consistency_hash(proposed_model)
+                    hash_dirty = hash_dirty or hash_changed
                 
                 # 生成建议
                 recommendation = self._generate_recommendation(rule, violation)
                 if recommendation:
                     recommendations.append(recommendation)
         
-        # 检查操作是否被阻止
-        if operation_type in self.blocked_operations:
-            result = ValidationResult.BLOCKED
-            violations.append({
-                "rule_id": "operation_blocked",
-                "message": f"操作类型 {operation_type} 当前被阻止",
-                "severity": "critical"
-            })
+        # 自动修复改动了哈希相关字段时才重新生成哈希
+        if hash_dirty:
+            proposed_hash = self._generate_consistency_hash(proposed_model)
         
         # 创建验证报告
         report = ValidationReport(
             validation_id=validation_id,
-            timestamp=datetime.now().isoformat(),
+            timestamp=now.isoformat(),
             result=result,
             consistency_hash=proposed_hash,
             model_info=proposed_model,
@@ -196,6 +265,7 @@ class ConsistencyFramework:
         )
         
         self.validation_history.append(report)
+        self.total_validations += 1
         
         # 如果验证通过，注册新模型
         if result in [ValidationResult.VALID, ValidationResult.WARNING] and consistency_manager:
@@ -214,106 +284,123 @@ class ConsistencyFramework:
     
     def _generate_consistency_hash(self, model_info: Dict[str, Any]) -> str:
         """生成一致性哈希"""
-        # 创建标准化的模型描述
-        normalized = {
-            "provider": model_info.get("provider", "").lower(),
-            "model_name": model_info.get("model_name", "").lower(),
-            "api_version": model_info.get("api_version", "v1"),
-            "dimension": model_info.get("dimension", 1536)
-        }
-        
-        content = json.dumps(normalized, sort_keys=True)
-        return hashlib.sha256(content.encode()).hexdigest()[:16]
-    
-    def _is_rule_applicable(self, rule: ConsistencyRule, operation_type: str) -> bool:
-        """检查规则是否适用于当前操作"""
-        # 根据一致性级别过滤规则
-        level_order = {
-            ConsistencyLevel.STRICT: 3,
-            ConsistencyLevel.COMPATIBLE: 2,
-            ConsistencyLevel.FLEXIBLE: 1
-        }
-        
-        return level_order[rule.level] <= level_order[self.consistency_level]
+        # 标准化后交给缓存的哈希函数，避免每次重新序列化JSON
+        return _hash_model(*self._normalize(model_info))
+    
+    def _normalize(self, model_info: Dict[str, Any]) -> Tuple[str, str, str, Union[int, str]]:
+        """将模型描述标准化为 (provider, model_name, api_version, dimension) 元组"""
+        dimension = model_info.get("dimension", 1536)
+        try:
+            dimension = int(dimension)
+        except (TypeError, ValueError):
+            # 缺失或非数值的维度（如None）保留原值参与哈希，由维度规则报告
+            dimension = repr(dimension)
+        return (
+            model_info.get("provider", "").lower(),
+            model_info.get("model_name", "").lower(),
+            model_info.get("api_version", "v1"),
+            dimension
+        )
+    
+    def _get_active_rules(self) -> List[ConsistencyRule]:
+        """获取当前一致性级别下适用的规则（已按优先级排序，惰性构建）"""
+        if self._active_rules_cache is None:
+            current_level = _LEVEL_ORDER[self.consistency_level]
+            self._active_rules_cache = sorted(
+                (rule for rule in self.rules if _LEVEL_ORDER[rule.level] <= current_level),
+                key=lambda r: r.priority
+            )
+        return self._active_rules_cache
     
     def _check_rule(self, rule: ConsistencyRule, proposed_model: Dict[str, Any], 
-                   current_model: Optional[ModelConfig], chromadb_version: str = None) -> Optional[Dict[str, Any]]:
+                   current_model: Optional[ModelConfig], current_record: Optional[ConsistencyRecord] = None,
+                   chromadb_version: str = None) -> Optional[Dict[str, Any]]:
         """检查特定规则"""
-        
-        if rule.rule_id == "exact_model_match":
-            if current_model:
-                if (proposed_model.get("provider") != current_model.provider or
-                    proposed_model.get("model_name") != current_model.model_name or
-                    proposed_model.get("api_version") != current_model.api_version):
-                    return {
-                        "rule_id": rule.rule_id,
-                        "message": f"模型不匹配: 期望 {current_model.provider}/{current_model.model_name}, 实际 {proposed_model.get('provider')}/{proposed_model.get('model_name')}",
-                        "severity": "high",
-                        "current": f"{current_model.provider}/{current_model.model_name}",
-                        "proposed": f"{proposed_model.get('provider')}/{proposed_model.get('model_name')}"
-                    }
-        
-        elif rule.rule_id == "provider_consistency":
-            if current_model and proposed_model.get("provider") != current_model.provider:
+        checker = self._rule_checkers.get(rule.rule_id)
+        return checker(proposed_model, current_model, current_record, chromadb_version) if checker else None
+    
+    def _check_exact_match(self, proposed_model: Dict[str, Any], current_model: Optional[ModelConfig],
+                           current_record: Optional[ConsistencyRecord] = None,
+                           chromadb_version: str = None) -> Optional[Dict[str, Any]]:
+        """精确模型匹配检查"""
+        if current_model:
+            if (proposed_model.get("provider") != current_model.provider or
+                proposed_model.get("model_name") != current_model.model_name or
+                proposed_model.get("api_version") != current_model.api_version):
                 return {
-                    "rule_id": rule.rule_id,
-                    "message": f"提供商不一致: 期望 {current_model.provider}, 实际 {proposed_model.get('provider')}",
-                    "severity": "medium",
-                    "current": current_model.provider,
-                    "proposed": proposed_model.get("provider")
+                    "rule_id": "exact_model_match",
+                    "message": f"模型不匹配: 期望 {current_model.provider}/{current_model.model_name}, 实际 {proposed_model.get('provider')}/{proposed_model.get('model_name')}",
+                    "severity": "high",
+                    "current": f"{current_model.provider}/{current_model.model_name}",
+                    "proposed": f"{proposed_model.get('provider')}/{proposed_model.get('model_name')}"
                 }
-        
-        elif rule.rule_id == "dimension_compatibility":
-            if current_model:
-                current_dim = current_model.dimension
-                proposed_dim = proposed_model.get("dimension", 1536)
+        return None
+    
+    def _check_provider(self, proposed_model: Dict[str, Any], current_model: Optional[ModelConfig],
+                        current_record: Optional[ConsistencyRecord] = None,
+                        chromadb_version: str = None) -> Optional[Dict[str, Any]]:
+        """提供商一致性检查"""
+        if current_model and proposed_model.get("provider") != current_model.provider:
+            return {
+                "rule_id": "provider_consistency",
+                "message": f"提供商不一致: 期望 {current_model.provider}, 实际 {proposed_model.get('provider')}",
+                "severity": "medium",
+                "current": current_model.provider,
+                "proposed": proposed_model.get("provider")
+            }
+        return None
+    
+    def _check_dimension(self, proposed_model: Dict[str, Any], current_model: Optional[ModelConfig],
+                         current_record: Optional[ConsistencyRecord] = None,
+                         chromadb_version: str = None) -> Optional[Dict[str, Any]]:
+        """向量维度兼容性检查"""
+        if current_model:
+            current_dim = current_model.dimension
+            proposed_dim = proposed_model.get("dimension", 1536)
+            
+            if current_dim != proposed_dim:
+                # 检查维度兼容性
+                providers = self._dim_provider_set.get(current_dim)
+                compatible = (providers is not None and
+                              current_model.provider.lower() in providers and
+                              (proposed_model.get("provider") or "").lower() in providers)
                 
-                if current_dim != proposed_dim:
-                    # 检查维度兼容性
-                    compatible = False
-                    for dim, providers in self.dimension_compatibility.items():
-                        if (current_dim == dim and 
-                            current_model.provider in providers and
-                            proposed_model.get("provider") in providers):
-                            compatible = True
-                            break
-                    
-                    if not compatible:
-                        return {
-                            "rule_id": rule.rule_id,
-                            "message": f"向量维度不兼容: {current_dim} vs {proposed_dim}",
-                            "severity": "high",
-                            "current": current_dim,
-                            "proposed": proposed_dim
-                        }
-        
-        elif rule.rule_id == "chromadb_version_match":
-            if chromadb_version and current_model and consistency_manager:
-                # 检查ChromaDB版本是否与当前模型关联
-                current_hash = consistency_manager.get_recommended_model()
-                if current_hash:
-                    record = consistency_manager.records.get(current_hash)
-                    if record and chromadb_version not in record.chromadb_versions:
-                        return {
-                            "rule_id": rule.rule_id,
-                            "message": f"ChromaDB版本 {chromadb_version} 与当前模型不匹配",
-                            "severity": "high",
-                            "chromadb_version": chromadb_version,
-                            "compatible_versions": record.chromadb_versions
-                        }
-        
+                if not compatible:
+                    return {
+                        "rule_id": "dimension_compatibility",
+                        "message": f"向量维度不兼容: {current_dim} vs {proposed_dim}",
+                        "severity": "high",
+                        "current": current_dim,
+                        "proposed": proposed_dim
+                    }
+        return None
+    
+    def _check_chromadb(self, proposed_model: Dict[str, Any], current_model: Optional[ModelConfig],
+                        current_record: Optional[ConsistencyRecord] = None,
+                        chromadb_version: str = None) -> Optional[Dict[str, Any]]:
+        """ChromaDB版本匹配检查"""
+        # 检查ChromaDB版本是否与当前模型关联
+        if (chromadb_version and current_model and current_record and
+                chromadb_version not in current_record.chromadb_versions):
+            return {
+                "rule_id": "chromadb_version_match",
+                "message": f"ChromaDB版本 {chromadb_version} 与当前模型不匹配",
+                "severity": "high",
+                "chromadb_version": chromadb_version,
+                "compatible_versions": current_record.chromadb_versions
+            }
         return None
     
     def _apply_auto_fix(self, rule: ConsistencyRule, violation: Dict[str, Any], 
-                       proposed_model: Dict[str, Any]) -> Optional[str]:
-        """应用自动修复"""
+                       proposed_model: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+        """应用自动修复，返回 (修复说明, 是否改动了哈希相关字段)"""
         
         if rule.rule_id == "provider_consistency":
             # 自动切换到当前推荐的提供商
             if "current" in violation:
                 old_provider = proposed_model.get("provider")
                 proposed_model["provider"] = violation["current"]
-                return f"自动切换提供商: {old_provider} → {violation['current']}"
+                return f"自动切换提供商: {old_provider} → {violation['current']}", True
         
         elif rule.rule_id == "dimension_compatibility":
             # 尝试查找兼容的维度
@@ -322,9 +409,9 @@ class ConsistencyFramework:
             
             if current_dim in self.dimension_compatibility:
                 proposed_model["dimension"] = current_dim
-                return f"自动调整向量维度: {proposed_dim} → {current_dim}"
+                return f"自动调整向量维度: {proposed_dim} → {current_dim}", True
         
-        return None
+        return None, False
     
     def _generate_recommendation(self, rule: ConsistencyRule, violation: Dict[str, Any]) -> Optional[str]:
         """生成修复建议"""
@@ -350,11 +437,13 @@ class ConsistencyFramework:
     def set_consistency_level(self, level: ConsistencyLevel):
         """设置一致性级别"""
         self.consistency_level = level
+        self._active_rules_cache = None
         logger.info(f"🔧 一致性级别设置为: {level.value}")
     
     def add_custom_rule(self, rule: ConsistencyRule):
         """添加自定义规则"""
         self.rules.append(rule)
+        self._active_rules_cache = None
         logger.info(f"➕ 添加自定义规则: {rule.name}")
     
     def block_operation(self, operation_type: str, reason: str = ""):
@@ -369,7 +458,8 @@ class ConsistencyFramework:
     
     def get_consistency_report(self) -> Dict[str, Any]:
         """获取一致性报告"""
-        recent_validations = [v for v in self.validation_history[-20:]]
+        history_len = len(self.validation_history)
+        recent_validations = list(itertools.islice(self.validation_history, max(0, history_len - 20), history_len))
         
         # 统计验证结果
         result_stats = {}
@@ -386,7 +476,7 @@ class ConsistencyFramework:
         
         return {
             "consistency_level": self.consistency_level.value,
-            "total_validations": len(self.validation_history),
+            "total_validations": self.total_validations,
             "recent_validations": len(recent_validations),
             "result_statistics": result_stats,
             "violation_statistics": violation_stats,
@@ -397,24 +487,30 @@ class ConsistencyFramework:
     
     def export_rules(self, filepath: str):
         """导出规则配置"""
-        rules_data = [asdict(rule) for rule in self.rules]
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump({
+        rules_data = []
+        for rule in self.rules:
+            rule_dict = self._rule_dict_cache.get(rule)
+            if rule_dict is None:
+                rule_dict = self._rule_dict_cache[rule] = asdict(rule)
+            rules_data.append(rule_dict)
+        with open(filepath, 'wb') as f:
+            f.write(_dumps({
                 "consistency_level": self.consistency_level.value,
                 "auto_fix_enabled": self.auto_fix_enabled,
                 "rules": rules_data
-            }, f, indent=2, ensure_ascii=False)
+            }))
         logger.info(f"📄 规则配置已导出: {filepath}")
     
     def import_rules(self, filepath: str):
         """导入规则配置"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(filepath, 'rb') as f:
+            data = _loads(f.read())
         
         self.consistency_level = ConsistencyLevel(data.get("consistency_level", "strict"))
         self.auto_fix_enabled = data.get("auto_fix_enabled", True)
         
         self.rules = []
+        self._rule_dict_cache.clear()
         for rule_data in data.get("rules", []):
             rule = ConsistencyRule(
                 rule_id=rule_data["rule_id"],
@@ -425,6 +521,7 @@ class ConsistencyFramework:
                 priority=rule_data["priority"]
             )
             self.rules.append(rule)
+        self._active_rules_cache = None
         
         logger.info(f"📄 规则配置已导入: {filepath}")
 
@@ -538,4 +635,5 @@ async def demo_consistency_framework():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(demo_consistency_framework())
\ No newline at end of file
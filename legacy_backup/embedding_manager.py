@@ -3,20 +3,23 @@
 """
 
 import asyncio
-from typing import List, Dict, Any, Optional
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
 from .unified_api_manager import UnifiedAPIManager, ModelProvider
 
 class EmbeddingManager:
     """向量化管理器 - 基于千问API"""
     
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, max_concurrency: int = 4):
         """
         初始化向量化管理器
         
         Args:
             config_manager: 配置管理器实例
+            max_concurrency: 同时进行的向量化API请求上限
         """
         self.config_manager = config_manager
+        self.max_concurrency = max_concurrency
         api_config = config_manager.api_config
         
         # 初始化统一API管理器（专注千问API）
@@ -42,7 +45,7 @@ class EmbeddingManager:
             "current_model": api_config.qwen_embedding_model
         }
     
-    async def embed_texts(self, texts: List[str], batch_size: int = 10) -> List[List[float]]:
+    async def embed_texts(self, texts: List[str], batch_size: int = 10) -> np.ndarray:
         """
         将文本列表转换为向量（异步版本）
         
@@ -51,61 +54,90 @@ class EmbeddingManager:
             batch_size: 批处理大小
             
         Returns:
-            向量列表
+            (len(texts), 维度) 的float32向量矩阵，失败批次对应的行为零向量
         """
         if not texts:
-            return []
+            return np.empty((0, getattr(self, '_last_embedding_dim', 1536)), dtype=np.float32)
         
-        embeddings = []
         self.embedding_stats["total_texts"] += len(texts)
         
         print(f"🔄 开始向量化 {len(texts)} 个文本，批次大小: {batch_size}")
         
-        # 分批处理
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_num = i//batch_size + 1
-            total_batches = (len(texts) + batch_size - 1) // batch_size
-            
-            try:
-                print(f"  📦 处理批次 {batch_num}/{total_batches} ({len(batch)} 个文本)")
-                
-                # 调用统一API管理器
-                result = await self.api_manager.create_embeddings(
-                    texts=batch, 
-                    provider=self.current_provider
-                )
-                
-                if result["success"]:
-                    batch_embeddings = result["embeddings"]
-                    embeddings.extend(batch_embeddings)
-                    self.embedding_stats["total_embeddings"] += len(batch_embeddings)
-                    
-                    print(f"  ✅ 批次 {batch_num} 完成 (提供商: {result['provider']}, 模型: {result['model']})")
-                else:
-                    raise Exception("API调用失败")
-                
-            except Exception as e:
-                print(f"  ❌ 批次 {batch_num} 失败: {e}")
-                self.embedding_stats["failed_embeddings"] += len(batch)
-                
-                # 为失败的文本添加零向量（维度根据模型确定）
-                embedding_dim = 1536  # 默认维度
-                if hasattr(self, '_last_embedding_dim'):
-                    embedding_dim = self._last_embedding_dim
-                
-                embeddings.extend([[0.0] * embedding_dim for _ in batch])
+        # 并发处理各批次，信号量限制同时在途的API请求数
+        total_batches = (len(texts) + batch_size - 1) // batch_size
+        semaphore = asyncio.Semaphore(self.max_concurrency)
         
-        # 记录嵌入维度用于后续失败处理
-        if embeddings and len(embeddings[0]) > 0:
-            self._last_embedding_dim = len(embeddings[0])
+        async def _bound(coro):
+            async with semaphore:
+                return await coro
+        
+        tasks = [
+            asyncio.create_task(_bound(self._embed_one_batch(texts[i:i + batch_size], i // batch_size, total_batches)))
+            for i in range(0, len(texts), batch_size)
+        ]
+        results = await asyncio.gather(*tasks)
+        
+        # 维度取自第一个成功的批次（全部失败时沿用上次的维度），并记录用于后续失败处理
+        embedding_dim = next(
+            (batch_embeddings.shape[1] for _, batch_embeddings in results if batch_embeddings is not None),
+            getattr(self, '_last_embedding_dim', 1536)
+        )
+        self._last_embedding_dim = embedding_dim
+        
+        # 结果矩阵按文本数预分配为零向量，成功的批次按序号写回对应区间
+        embeddings = np.zeros((len(texts), embedding_dim), dtype=np.float32)
+        for idx, batch_embeddings in results:
+            if batch_embeddings is None:
+                continue
+            if batch_embeddings.shape[1] != embedding_dim:
+                print(f"  ❌ 批次 {idx + 1} 向量维度 {batch_embeddings.shape[1]} 与 {embedding_dim} 不一致，按失败处理")
+                self.embedding_stats["failed_embeddings"] += len(batch_embeddings)
+                continue
+            start = idx * batch_size
+            embeddings[start:start + len(batch_embeddings)] = batch_embeddings
         
         success_rate = ((len(texts) - self.embedding_stats["failed_embeddings"]) / len(texts) * 100) if len(texts) > 0 else 0
         print(f"🎯 向量化完成，成功率: {success_rate:.1f}%")
         
         return embeddings
     
-    def embed_texts_sync(self, texts: List[str], batch_size: int = 10) -> List[List[float]]:
+    async def _embed_one_batch(self, batch: List[str], idx: int,
+                               total_batches: int) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        向量化单个批次，失败时返回None（由调用方填充零向量）
+        
+        Args:
+            batch: 批次文本
+            idx: 批次序号（从0开始）
+            total_batches: 批次总数
+            
+        Returns:
+            (批次序号, (len(batch), 维度) 向量矩阵或None)
+        """
+        batch_num = idx + 1
+        try:
+            print(f"  📦 处理批次 {batch_num}/{total_batches} ({len(batch)} 个文本)")
+            
+            # 调用统一API管理器
+            result = await self.api_manager.create_embeddings(texts=batch)
+            
+            if result["success"]:
+                batch_embeddings = np.asarray(result["embeddings"], dtype=np.float32)
+                if batch_embeddings.ndim != 2 or len(batch_embeddings) != len(batch):
+                    raise ValueError(f"返回 {len(batch_embeddings)} 条向量，请求了 {len(batch)} 条")
+                self.embedding_stats["total_embeddings"] += len(batch_embeddings)
+                
+                print(f"  ✅ 批次 {batch_num} 完成 (提供商: {result['provider']}, 模型: {result['model']})")
+                return idx, batch_embeddings
+            else:
+                raise Exception("API调用失败")
+            
+        except Exception as e:
+            print(f"  ❌ 批次 {batch_num} 失败: {e}")
+            self.embedding_stats["failed_embeddings"] += len(batch)
+            return idx, None
+    
+    def embed_texts_sync(self, texts: List[str], batch_size: int = 10) -> np.ndarray:
         """
         同步版本的文本向量化（向后兼容）
         
@@ -114,17 +146,19 @@ class EmbeddingManager:
             batch_size: 批处理大小
             
         Returns:
-            向量列表
+            (len(texts), 维度) 的float32向量矩阵
+            
+        Raises:
+            RuntimeError: 在已运行的事件循环中调用时（此时应直接 await embed_texts）
         """
         try:
-            loop = asyncio.get_event_loop()
+            asyncio.get_running_loop()
         except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            return asyncio.run(self.embed_texts(texts, batch_size))
         
-        return loop.run_until_complete(self.embed_texts(texts, batch_size))
+        raise RuntimeError("embed_texts_sync 不能在运行中的事件循环内调用，请改用 await embed_texts()")
     
-    def embed_single_text(self, text: str) -> List[float]:
+    def embed_single_text(self, text: str) -> np.ndarray:
         """
         将单个文本转换为向量
         
@@ -132,10 +166,9 @@ class EmbeddingManager:
             text: 输入文本
             
         Returns:
-            向量
+            (维度,) 的float32向量
         """
-        embeddings = self.embed_texts([text])
-        return embeddings[0] if embeddings else []
+        return self.embed_texts_sync([text])[0]
     
     def get_info(self) -> Dict[str, Any]:
         """获取向量化器信息"""
@@ -152,7 +185,7 @@ class EmbeddingManager:
             test_text = "这是一个测试文本，用于验证嵌入模型API的连通性。"
             embedding = self.embed_single_text(test_text)
             
-            if embedding and len(embedding) == 1536:
+            if len(embedding) == 1536:
                 print(f"✅ {self.platform.upper()} 嵌入模型连接成功")
                 print(f"📝 向量维度: {len(embedding)}")
                 print(f"🔧 使用模型: {self.model_name}")
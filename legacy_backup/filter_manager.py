@@ -2,17 +2,183 @@
 筛选管理模块
 """
 
+import asyncio
+import hashlib
 import json
+import logging
 import os
-from typing import List, Dict, Any, Optional
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import closing
+from pathlib import Path
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+import numpy as np
 import chromadb
 from chromadb.utils import embedding_functions
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+from .vector_backends import VectorBackend, save_npy_atomic, select_backend
+
+# 模型一致性管理器（可选）：关联新的ChromaDB版本时使语料缓存失效
+try:
+    from .model_consistency_manager import consistency_manager
+except ImportError:
+    consistency_manager = None
+
+logger = logging.getLogger(__name__)
+
+# JSON编解码（优先使用orjson，未安装时回退标准库）
+try:
+    import orjson
+
+    def _json_dumps(obj: Any, indent: bool = False) -> str:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode()
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj: Any, indent: bool = False) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+    _json_loads = json.loads
+
+# 多模式关键词匹配（优先使用hyperscan，未安装时回退正则）
+try:
+    import hyperscan
+    _HYPERSCAN_AVAILABLE = True
+except ImportError:
+    _HYPERSCAN_AVAILABLE = False
+
+# 按token截断提示词正文（优先使用tiktoken，未安装时按字符截断）
+try:
+    import tiktoken
+    _TIKTOKEN_AVAILABLE = True
+except ImportError:
+    _TIKTOKEN_AVAILABLE = False
+
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到最多max_tokens个token（无tiktoken时以字符数近似）"""
+    if not _TIKTOKEN_AVAILABLE:
+        return text[:max_tokens]
+    encoding = _get_token_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+class _FirstJsonObject:
+    """增量扫描流式文本，在第一个完整的JSON对象闭合时返回其文本"""
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> Optional[str]:
+        """输入一段文本；对象闭合时返回完整对象文本，否则返回None"""
+        for ch in text:
+            if self._depth == 0:
+                if ch != "{":
+                    continue  # 跳过对象前的说明文字
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                self._buffer.append(ch)
+                continue
+            elif ch == '"':
+                self._in_string = True
+            
+            self._buffer.append(ch)
+            if ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return "".join(self._buffer)
+        return None
+
+def _delta_text(chunk) -> str:
+    """取出流式响应块中的增量文本"""
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行L2归一化（零向量保持为零）"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# ChromaDB持久化目录与大模型接口地址
+CHROMA_DB_PATH = "data/chroma_db"
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+@lru_cache(maxsize=4)
+def _get_chroma(path: str):
+    """同一目录在进程内共享一个ChromaDB客户端"""
+    return chromadb.PersistentClient(path=path)
+
+@lru_cache(maxsize=4)
+def _get_openai(api_key: str, base_url: str) -> OpenAI:
+    """相同密钥和地址在进程内共享一个同步大模型客户端（复用连接池）"""
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+# 归一化语料向量的本地缓存（内存映射加载），文件名包含集合名、ChromaDB目录摘要、条数和写入序号
+CORPUS_CACHE_DIR = "data/corpus_cache"
+
+# 大模型筛选结果缓存
+LLM_CACHE_PATH = "data/llm_filter_cache.sqlite"
+LLM_CACHE_TTL_DAYS = 7
+LLM_CACHE_MAX_ROWS = 10000
+LLM_CACHE_TOUCH_SECONDS = 3600  # 命中时使用时间超过该间隔才写回，读多写少时命中不触发写盘
+
+# 候选文档预筛选：至少命中 PREFILTER_MIN_HITS 个不同关键词才送入大模型
+PREFILTER_KEYWORDS = ("信用", "征信", "评级", "金融监管", "信贷", "违约", "风险")
+PREFILTER_MIN_HITS = 2
+
+# 第final_count篇与第final_count+1篇的相似度差超过该值时，直接按相似度选择，不调用大模型
+SIMILARITY_MARGIN = 0.15
+
+# 提示词中每篇候选文档保留的正文token数
+PROMPT_CONTENT_TOKENS = 800
+
+# 异步大模型请求的重试策略（仅对429/5xx重试）
+LLM_MAX_ATTEMPTS = 5
+LLM_RETRY_BASE_DELAY = 1.0
+
+# 筛选结果只是一个很短的JSON对象，限制输出长度以控制最坏情况延迟
+LLM_MAX_TOKENS = 128
+
+# 当前进程中的筛选管理器，关联新的ChromaDB版本后统一使其语料缓存失效
+_instances: "weakref.WeakSet[FilterManager]" = weakref.WeakSet()
+
+def _on_chromadb_version(consistency_hash: str, chromadb_version: str):
+    for manager in list(_instances):
+        manager.invalidate_corpus_cache()
+
+if consistency_manager is not None:
+    consistency_manager.add_chromadb_listener(_on_chromadb_version)
 
 class FilterManager:
     """筛选管理器"""
     
-    def __init__(self, embedding_manager, llm_api_key: str, llm_platform: str = "llm"):
+    def __init__(self, embedding_manager, llm_api_key: str, llm_platform: str = "llm",
+                 llm_cache_path: Optional[str] = LLM_CACHE_PATH,
+                 max_concurrent: int = 10, max_tokens_per_minute: int = 100000):
         """
         初始化筛选管理器
         
@@ -20,32 +186,158 @@ class FilterManager:
             embedding_manager: 向量化管理器
             llm_api_key: 大模型API密钥
             llm_platform: 大模型平台 ("llm", "llm-claude", "llm-gpt")
+            llm_cache_path: 大模型筛选结果缓存路径（None表示不缓存）
+            max_concurrent: 异步筛选时同时进行的大模型请求上限
+            max_tokens_per_minute: 异步筛选时每分钟提示词token预算（按字符数估算）
         """
         self.embedding_manager = embedding_manager
         self.llm_api_key = llm_api_key
         self.llm_platform = llm_platform
+        self.max_concurrent = max_concurrent
+        self.max_tokens_per_minute = max_tokens_per_minute
         self.chroma_client = None
         self.collection = None
+        self._corpus_norm: Optional[np.ndarray] = None  # 归一化后的语料向量矩阵
+        self._backend: Optional[VectorBackend] = None   # 按语料规模选择的检索后端
+        self._corpus_cache_stem = ""  # 当前语料缓存文件路径（不含扩展名），FAISS索引与int8量化结果与之同名
+        self.llm_cache = None
+        self._llm_cache_lock = threading.Lock()
+        
+        # 异步限流状态（绑定到当前事件循环，首次使用时创建）
+        self._async_loop = None
+        self._llm_semaphore: Optional[asyncio.Semaphore] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._token_window: deque = deque()  # (时间戳, token数)
+        self._token_window_used = 0
         
         self._init_chromadb()
         self._init_llm_client()
+        self._init_prefilter()
+        if llm_cache_path:
+            self._init_llm_cache(llm_cache_path)
+        _instances.add(self)
+    
+    @classmethod
+    def clear_client_caches(cls):
+        """
+        清空共享ChromaDB和大模型客户端的缓存（测试隔离或切换配置时使用）
+        
+        只是让之后的实例重新创建客户端，不关闭已创建的客户端（现有实例可能仍在使用）
+        """
+        _get_chroma.cache_clear()
+        _get_openai.cache_clear()
     
     def _init_chromadb(self):
         """初始化ChromaDB"""
         try:
-            self.chroma_client = chromadb.PersistentClient(path="data/chroma_db")
+            self.chroma_client = _get_chroma(CHROMA_DB_PATH)
             self.collection = self.chroma_client.get_or_create_collection("creditmag")
-            print("✅ ChromaDB 初始化成功")
+            logger.info("✅ ChromaDB 初始化成功")
         except Exception as e:
-            print(f"❌ ChromaDB 初始化失败: {e}")
+            logger.error("❌ ChromaDB 初始化失败: %s", e)
             raise
+        
+        self._load_corpus_matrix()
+    
+    def _load_corpus_matrix(self):
+        """加载归一化语料向量矩阵，相似度计算直接在内存中完成"""
+        try:
+            self._corpus_norm = self._ensure_corpus_cache()
+            self._backend = select_backend(self._corpus_norm, self._corpus_cache_stem or None)
+            if self._corpus_norm is not None:
+                logger.info("📚 已加载语料向量矩阵: %s (后端: %s)", self._corpus_norm.shape, type(self._backend).__name__)
+        except Exception as e:
+            logger.warning("⚠️  语料向量加载失败，将使用ChromaDB查询: %s", e)
+            self._corpus_norm = None
+            self._backend = None
+    
+    def _corpus_cache_prefix(self) -> str:
+        """本集合语料缓存文件的路径前缀（不同集合、不同ChromaDB目录互不干扰）"""
+        path_digest = hashlib.blake2b(os.path.abspath(CHROMA_DB_PATH).encode("utf-8"), digest_size=6).hexdigest()
+        return os.path.join(CORPUS_CACHE_DIR, f"{self.collection.name}_{path_digest}_")
+    
+    def _collection_sequence(self) -> Optional[int]:
+        """
+        集合最新一次写入的序号（只读查询ChromaDB自身的元数据库，增删改都会递增）
+        
+        元数据库不可读或结构不同时返回None，此时只按条数校验缓存，依赖 invalidate_corpus_cache
+        """
+        db_path = Path(CHROMA_DB_PATH, "chroma.sqlite3").resolve()
+        try:
+            with closing(sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)) as db:
+                row = db.execute(
+                    "SELECT MAX(m.seq_id) FROM max_seq_id m JOIN segments s ON s.id = m.segment_id "
+                    "WHERE s.collection = ?",
+                    (str(self.collection.id),)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+    
+    def _remove_corpus_cache(self, keep_stem: Optional[str] = None):
+        """删除本集合的语料缓存及FAISS索引文件（保留文件名为 keep_stem.* 的当前版本）"""
+        prefix = self._corpus_cache_prefix()
+        directory, name_prefix = os.path.split(prefix)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(name_prefix) and not (keep_stem and path.startswith(keep_stem + ".")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def _ensure_corpus_cache(self) -> Optional[np.ndarray]:
+        """
+        返回内存映射的语料向量缓存，缓存缺失或集合条数、写入序号变化时从ChromaDB重建
+        
+        Returns:
+            归一化后的语料向量矩阵，集合为空时返回None
+        """
+        count = self.collection.count()
+        if count == 0:
+            return None
+        
+        # 缓存文件名包含条数与写入序号，集合有任何增删改后不会误用旧缓存
+        sequence = self._collection_sequence()
+        self._corpus_cache_stem = self._corpus_cache_prefix() + (
+            f"n{count}" if sequence is None else f"n{count}_s{sequence}"
+        )
+        cache_path = self._corpus_cache_stem + ".npy"
+        if os.path.exists(cache_path):
+            cached = np.load(cache_path, mmap_mode="r")
+            if cached.shape[0] == count:
+                return cached
+        
+        res = self.collection.get(include=["embeddings"])
+        embeddings = res.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        
+        corpus_norm = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        
+        save_npy_atomic(cache_path, corpus_norm)
+        self._remove_corpus_cache(keep_stem=self._corpus_cache_stem)
+        logger.info("💾 语料向量缓存已更新: %s", cache_path)
+        
+        return np.load(cache_path, mmap_mode="r")
+    
+    def invalidate_corpus_cache(self):
+        """删除语料向量缓存并重新加载（ChromaDB数据更新后调用，关联新的ChromaDB版本时自动调用）"""
+        self._corpus_norm = None
+        self._backend = None
+        self._remove_corpus_cache()
+        self._load_corpus_matrix()
     
     def _init_llm_client(self):
         """初始化大模型客户端"""
         if self.llm_platform == "llm":
-            self.llm_client = OpenAI(
+            self.llm_client = _get_openai(self.llm_api_key, DASHSCOPE_BASE_URL)
+            # 异步客户端的连接池绑定事件循环，不在实例间共享
+            self.async_llm_client = AsyncOpenAI(
                 api_key=self.llm_api_key,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+                base_url=DASHSCOPE_BASE_URL
             )
             self.llm_model = "qwen-turbo"
         # elif self.llm_platform == "deepseek":  # 已注释，专注千问
@@ -57,18 +349,124 @@ class FilterManager:
         else:
             raise ValueError(f"不支持的大模型平台: {self.llm_platform}")
     
-    def filter_by_vector_similarity(self, search_results: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
-        """
-        基于向量相似度筛选
+    def _init_prefilter(self):
+        """编译关键词预筛选器"""
+        if _HYPERSCAN_AVAILABLE:
+            self._prefilter_db = hyperscan.Database()
+            self._prefilter_db.compile(
+                expressions=[keyword.encode("utf-8") for keyword in PREFILTER_KEYWORDS],
+                ids=list(range(len(PREFILTER_KEYWORDS))),
+                elements=len(PREFILTER_KEYWORDS),
+                flags=[hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_SINGLEMATCH] * len(PREFILTER_KEYWORDS)
+            )
+            self._prefilter_re = None
+        else:
+            self._prefilter_db = None
+            self._prefilter_re = re.compile("|".join(map(re.escape, PREFILTER_KEYWORDS)))
+    
+    def _keyword_hits(self, text: str) -> int:
+        """统计文本命中的不同关键词数量"""
+        if self._prefilter_db is not None:
+            hits = set()
+            self._prefilter_db.scan(
+                text.encode("utf-8"),
+                match_event_handler=lambda keyword_id, *_: hits.add(keyword_id)
+            )
+            return len(hits)
+        return len(set(self._prefilter_re.findall(text)))
+    
+    def _prefilter_candidates(self, candidate_docs: List[Dict[str, Any]],
+                              final_count: int) -> List[Dict[str, Any]]:
+        """剔除明显无关的候选文档，减少发送给大模型的内容"""
+        kept = [doc for doc in candidate_docs if self._keyword_hits(doc["content"]) >= PREFILTER_MIN_HITS]
+        if len(kept) < final_count:
+            # 剩余文档不足时不做预筛选
+            return candidate_docs
+        if len(kept) < len(candidate_docs):
+            logger.info("🔎 关键词预筛选剔除 %d 篇无关文档", len(candidate_docs) - len(kept))
+        return kept
+    
+    def _shortcut_selection(self, candidate_docs: List[Dict[str, Any]],
+                            final_count: int) -> Optional[List[Dict[str, Any]]]:
+        """无需大模型即可确定结果时直接返回（候选数不足或相似度差距明显），否则返回None"""
+        if len(candidate_docs) <= final_count:
+            logger.info("⚡ 候选文档数 (%d) 不超过目标数量，跳过大模型筛选", len(candidate_docs))
+            return list(candidate_docs)
+        if final_count <= 0:
+            return None
         
-        Args:
-            search_results: 搜索结果列表
-            top_k: 返回的候选数量
-            
-        Returns:
-            筛选后的候选文档列表
-        """
-        # 提取有效内容
+        ranked = sorted(candidate_docs, key=lambda doc: doc["similarity"], reverse=True)
+        margin = ranked[final_count - 1]["similarity"] - ranked[final_count]["similarity"]
+        if margin > SIMILARITY_MARGIN:
+            logger.info("⚡ 相似度差距明显 (%.3f > %s)，按相似度直接选择", margin, SIMILARITY_MARGIN)
+            return ranked[:final_count]
+        return None
+    
+    def _init_llm_cache(self, cache_path: str):
+        """初始化大模型筛选结果缓存（SQLite），并清理过期记录"""
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self.llm_cache = sqlite3.connect(cache_path, check_same_thread=False)
+            self.llm_cache.execute(
+                "CREATE TABLE IF NOT EXISTS llm_filter_cache "
+                "(fingerprint TEXT PRIMARY KEY, result TEXT, ts REAL)"
+            )
+            self.llm_cache.execute(
+                "DELETE FROM llm_filter_cache WHERE ts < ?",
+                (time.time() - LLM_CACHE_TTL_DAYS * 86400,)
+            )
+            self.llm_cache.commit()
+        except sqlite3.Error as e:
+            logger.warning("⚠️  大模型筛选缓存不可用: %s", e)
+            self.llm_cache = None
+    
+    def _candidate_fingerprint(self, candidate_docs: List[Dict[str, Any]], final_count: int) -> str:
+        """计算候选文档集合的指纹（保持顺序，选中索引依赖于文档位置）"""
+        payload = [self.llm_model, final_count] + [
+            (doc["topic"], doc["content"][:256]) for doc in candidate_docs
+        ]
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+    
+    def _get_cached_selection(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """查询缓存的筛选结果，命中且使用时间早于 LLM_CACHE_TOUCH_SECONDS 时刷新"""
+        if self.llm_cache is None:
+            return None
+        with self._llm_cache_lock:
+            row = self.llm_cache.execute(
+                "SELECT result, ts FROM llm_filter_cache WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > LLM_CACHE_TTL_DAYS * 86400:
+                self.llm_cache.execute("DELETE FROM llm_filter_cache WHERE fingerprint = ?", (fingerprint,))
+                self.llm_cache.commit()
+                return None
+            if now - row[1] > LLM_CACHE_TOUCH_SECONDS:
+                self.llm_cache.execute(
+                    "UPDATE llm_filter_cache SET ts = ? WHERE fingerprint = ?", (now, fingerprint)
+                )
+                self.llm_cache.commit()
+        return _json_loads(row[0])
+    
+    def _store_cached_selection(self, fingerprint: str, selection_result: Dict[str, Any]):
+        """写入筛选结果，超过容量时淘汰最久未使用的记录"""
+        if self.llm_cache is None:
+            return
+        with self._llm_cache_lock:
+            self.llm_cache.execute(
+                "INSERT OR REPLACE INTO llm_filter_cache (fingerprint, result, ts) VALUES (?, ?, ?)",
+                (fingerprint, _json_dumps(selection_result), time.time())
+            )
+            self.llm_cache.execute(
+                "DELETE FROM llm_filter_cache WHERE fingerprint IN ("
+                "SELECT fingerprint FROM llm_filter_cache ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (LLM_CACHE_MAX_ROWS,)
+            )
+            self.llm_cache.commit()
+    
+    def _extract_valid_docs(self, search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """提取有效的搜索结果"""
         valid_docs = []
         for result in search_results:
             if result.get("success") and result.get("content"):
@@ -76,60 +474,101 @@ class FilterManager:
                     "topic": result["topic"],
                     "content": result["content"]
                 })
-        
-        if not valid_docs:
-            print("❌ 没有找到有效的搜索结果")
-            return []
-        
-        # 生成向量
-        texts = [doc["content"] for doc in valid_docs]
-        embeddings = self.embedding_manager.embed_texts(texts)
-        
-        if not embeddings:
-            print("❌ 向量化失败")
-            return []
-        
-        # 查询ChromaDB
+        return valid_docs
+    
+    def _rank_candidates(self, valid_docs: List[Dict[str, Any]], embeddings: np.ndarray,
+                         top_k: int) -> List[Dict[str, Any]]:
+        """根据与语料库的相似度选出候选文档"""
         try:
-            query_results = self.collection.query(
-                query_embeddings=embeddings,
-                n_results=top_k
-            )
+            # 每篇文档与语料库的最高相似度
+            if self._backend is not None:
+                query_norm = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+                _, sims = self._backend.search(query_norm, 1)
+                best_similarity = sims[:, 0]
+            else:
+                # 语料矩阵不可用时回退到ChromaDB查询（每个查询向量一行距离）
+                query_results = self.collection.query(
+                    query_embeddings=embeddings,
+                    n_results=top_k
+                )
+                best_similarity = np.array([
+                    1 - min(distances) if distances else 0.0
+                    for distances in query_results['distances']
+                ], dtype=np.float32)
+            
+            # 选出相似度最高的top_k篇文档（按相似度降序）
+            k = min(top_k, len(valid_docs))
+            top_idx = np.argpartition(-best_similarity, k - 1)[:k]
+            top_idx = top_idx[np.argsort(-best_similarity[top_idx])]
             
-            # 构建候选文档
+            # 构建候选文档（直接引用原始正文，截断推迟到构建提示词时）
             candidate_docs = []
-            for i, (doc, distance) in enumerate(zip(valid_docs, query_results['distances'][0])):
+            for i, doc_idx in enumerate(top_idx):
+                doc = valid_docs[doc_idx]
                 candidate_docs.append({
                     "index": i,
                     "topic": doc["topic"],
-                    "content": doc["content"][:1000],  # 限制长度
-                    "similarity": 1 - distance,  # 转换为相似度
-                    "original_content": doc["content"]
+                    "content": doc["content"],
+                    "similarity": float(best_similarity[doc_idx])
                 })
             
-            print(f"✅ 向量相似度筛选完成，找到 {len(candidate_docs)} 个候选文档")
+            logger.info("✅ 向量相似度筛选完成，找到 %d 个候选文档", len(candidate_docs))
             return candidate_docs
             
         except Exception as e:
-            print(f"❌ ChromaDB 查询失败: {e}")
+            logger.error("❌ ChromaDB 查询失败: %s", e)
             return []
     
-    def filter_by_llm(self, candidate_docs: List[Dict[str, Any]], final_count: int = 2) -> List[Dict[str, Any]]:
+    def filter_by_vector_similarity(self, search_results: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
         """
-        使用大模型进行智能筛选
+        基于向量相似度筛选
         
         Args:
-            candidate_docs: 候选文档列表
-            final_count: 最终选择数量
+            search_results: 搜索结果列表
+            top_k: 返回的候选数量
             
         Returns:
-            最终筛选结果
+            筛选后的候选文档列表
         """
-        if not candidate_docs:
+        valid_docs = self._extract_valid_docs(search_results)
+        if not valid_docs:
+            logger.error("❌ 没有找到有效的搜索结果")
+            return []
+        
+        # 生成向量
+        texts = [doc["content"] for doc in valid_docs]
+        embeddings = self.embedding_manager.embed_texts_sync(texts)
+        
+        if len(embeddings) == 0:
+            logger.error("❌ 向量化失败")
+            return []
+        
+        return self._rank_candidates(valid_docs, embeddings, top_k)
+    
+    async def afilter_by_vector_similarity(self, search_results: List[Dict[str, Any]],
+                                           top_k: int = 5) -> List[Dict[str, Any]]:
+        """基于向量相似度筛选（异步版本）"""
+        valid_docs = self._extract_valid_docs(search_results)
+        if not valid_docs:
+            logger.error("❌ 没有找到有效的搜索结果")
             return []
         
-        # 构建筛选提示
-        filter_prompt = f"""
+        texts = [doc["content"] for doc in valid_docs]
+        embeddings = await self.embedding_manager.embed_texts(texts)
+        
+        if len(embeddings) == 0:
+            logger.error("❌ 向量化失败")
+            return []
+        
+        return self._rank_candidates(valid_docs, embeddings, top_k)
+    
+    def _build_filter_prompt(self, candidate_docs: List[Dict[str, Any]], final_count: int) -> str:
+        """构建筛选提示（紧凑文本格式，只包含索引、标题和截断正文）"""
+        candidate_text = "\n\n".join(
+            f"[{doc['index']}] {doc['topic']}\n{_truncate_tokens(doc['content'], PROMPT_CONTENT_TOKENS)}"
+            for doc in candidate_docs
+        )
+        return f"""
 请从以下{len(candidate_docs)}篇关于信用评级和征信研究的文档中，选出最相关、最有价值的{final_count}篇。
 
 筛选标准：
@@ -137,61 +576,206 @@ class FilterManager:
 2. 信息时效性强，具有实际参考价值
 3. 来源权威，内容详实
 
-候选文档：
-{json.dumps(candidate_docs, ensure_ascii=False, indent=2)}
+候选文档（格式：[索引号] 标题，下一行为正文）：
+{candidate_text}
 
-请返回JSON格式的结果，包含选中的文档索引号和选择理由：
-{{"selected_indices": [0, 1], "reason": "选择理由"}}
+只返回如下JSON，不要输出其他内容：
+{{"selected_indices": [0, 1], "reason": "选择理由（不超过50字）"}}
 """
+    
+    def _select_documents(self, candidate_docs: List[Dict[str, Any]], selection_result: Dict[str, Any],
+                          final_count: int) -> List[Dict[str, Any]]:
+        """根据大模型返回的索引获取最终选中的文档"""
+        selected_indices = selection_result.get("selected_indices", [])
         
-        try:
-            response = self.llm_client.chat.completions.create(
-                model=self.llm_model,
-                messages=[{"role": "user", "content": filter_prompt}],
-                temperature=0.1
-            )
-            
-            # 解析大模型的选择结果
-            selection_result = json.loads(response.choices[0].message.content)
-            selected_indices = selection_result.get("selected_indices", [])
+        # 按候选文档的index字段匹配（预筛选后列表位置与index不再一致）
+        docs_by_index = {doc["index"]: doc for doc in candidate_docs}
+        final_results = []
+        for idx in selected_indices[:final_count]:
+            if idx in docs_by_index:
+                final_results.append(docs_by_index[idx])
+        
+        logger.info("✅ 大模型筛选完成，选中 %d 篇文档", len(final_results))
+        logger.info("📝 选择理由: %s", selection_result.get("reason", "未提供"))
+        
+        return final_results
+    
+    def _fallback_selection(self, candidate_docs: List[Dict[str, Any]], final_count: int,
+                            error: Exception) -> List[Dict[str, Any]]:
+        """降级方案：选择相似度最高的文档"""
+        logger.error("❌ 大模型筛选失败: %s", error)
+        sorted_docs = sorted(candidate_docs, key=lambda x: x["similarity"], reverse=True)
+        final_results = sorted_docs[:final_count]
+        logger.warning("⚠️  使用向量相似度降级方案，选中 %d 篇文档", len(final_results))
+        return final_results
+    
+    def filter_by_llm(self, candidate_docs: List[Dict[str, Any]], final_count: int = 2) -> List[Dict[str, Any]]:
+        """
+        使用大模型进行智能筛选
+        
+        Args:
+            candidate_docs: 候选文档列表
+            final_count: 最终选择数量
             
-            # 获取最终选中的文档
-            final_results = []
-            for idx in selected_indices[:final_count]:
-                if idx < len(candidate_docs):
-                    final_results.append(candidate_docs[idx])
+        Returns:
+            最终筛选结果
+        """
+        if not candidate_docs:
+            return []
+        
+        if len(candidate_docs) <= final_count:
+            return self._shortcut_selection(candidate_docs, final_count)
+        
+        candidate_docs = self._prefilter_candidates(candidate_docs, final_count)
+        shortcut = self._shortcut_selection(candidate_docs, final_count)
+        if shortcut is not None:
+            return shortcut
+        filter_prompt = self._build_filter_prompt(candidate_docs, final_count)
+        
+        try:
+            # 相同候选集合直接复用缓存的筛选结果
+            fingerprint = self._candidate_fingerprint(candidate_docs, final_count)
+            selection_result = self._get_cached_selection(fingerprint)
             
-            print(f"✅ 大模型筛选完成，选中 {len(final_results)} 篇文档")
-            print(f"📝 选择理由: {selection_result.get('reason', '未提供')}")
+            if selection_result is None:
+                stream = self.llm_client.chat.completions.create(
+                    model=self.llm_model,
+                    messages=[{"role": "user", "content": filter_prompt}],
+                    temperature=0.1,
+                    max_tokens=LLM_MAX_TOKENS,
+                    stream=True
+                )
+                
+                # 流式读取，第一个JSON对象闭合后立即关闭连接并解析
+                scanner = _FirstJsonObject()
+                selection_text = None
+                try:
+                    for chunk in stream:
+                        selection_text = scanner.feed(_delta_text(chunk))
+                        if selection_text is not None:
+                            break
+                finally:
+                    if hasattr(stream, "close"):
+                        stream.close()
+                
+                if selection_text is None:
+                    raise ValueError("大模型回复中没有完整的JSON结果")
+                selection_result = _json_loads(selection_text)
+                self._store_cached_selection(fingerprint, selection_result)
+            else:
+                logger.info("⚡ 命中大模型筛选缓存")
             
-            return final_results
+            return self._select_documents(candidate_docs, selection_result, final_count)
             
         except Exception as e:
-            print(f"❌ 大模型筛选失败: {e}")
-            # 降级方案：选择相似度最高的文档
-            sorted_docs = sorted(candidate_docs, key=lambda x: x["similarity"], reverse=True)
-            final_results = sorted_docs[:final_count]
-            print(f"⚠️  使用向量相似度降级方案，选中 {len(final_results)} 篇文档")
-            return final_results
+            return self._fallback_selection(candidate_docs, final_count, e)
     
-    def filter_documents(self, search_results: List[Dict[str, Any]], 
-                        vector_top_k: int = 5, final_count: int = 2) -> Dict[str, Any]:
+    def _ensure_async_limits(self):
+        """为当前事件循环创建并发信号量和token预算锁"""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_loop = loop
+            self._llm_semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._token_lock = asyncio.Lock()
+            self._token_window.clear()
+            self._token_window_used = 0
+    
+    async def _acquire_token_budget(self, tokens: int):
+        """等待直到最近一分钟内的token用量允许本次请求"""
+        while True:
+            async with self._token_lock:
+                now = time.monotonic()
+                while self._token_window and now - self._token_window[0][0] >= 60:
+                    self._token_window_used -= self._token_window.popleft()[1]
+                
+                if (not self._token_window or
+                        self._token_window_used + tokens <= self.max_tokens_per_minute):
+                    self._token_window.append((now, tokens))
+                    self._token_window_used += tokens
+                    return
+                
+                wait = 60 - (now - self._token_window[0][0])
+            await asyncio.sleep(wait)
+    
+    async def _rate_limited(self, make_request: Callable[[], Awaitable[Any]], tokens: int) -> Any:
         """
-        完整的文档筛选流程
+        在并发和token预算限制下执行大模型请求，429/5xx时指数退避重试
         
-        Args:
-            search_results: 搜索结果列表
-            vector_top_k: 向量相似度筛选数量
-            final_count: 最终选择数量
-            
-        Returns:
-            筛选结果字典
+        信号量在make_request返回后释放，流式请求应在make_request内读完响应
         """
-        print("🔍 开始文档筛选流程...")
+        self._ensure_async_limits()
+        await self._acquire_token_budget(tokens)
         
-        # 步骤1：向量相似度筛选
-        candidate_docs = self.filter_by_vector_similarity(search_results, vector_top_k)
+        async with self._llm_semaphore:
+            for attempt in range(LLM_MAX_ATTEMPTS):
+                try:
+                    return await make_request()
+                except Exception as e:
+                    status = getattr(e, "status_code", None)
+                    retryable = status is not None and (status == 429 or status >= 500)
+                    if not retryable or attempt == LLM_MAX_ATTEMPTS - 1:
+                        raise
+                    delay = LLM_RETRY_BASE_DELAY * (2 ** attempt)
+                    logger.warning("⚠️  大模型请求失败 (%s)，%.1f 秒后重试", status, delay)
+                    await asyncio.sleep(delay)
+    
+    async def afilter_by_llm(self, candidate_docs: List[Dict[str, Any]], final_count: int = 2) -> List[Dict[str, Any]]:
+        """使用大模型进行智能筛选（异步版本）"""
+        if not candidate_docs:
+            return []
         
+        if len(candidate_docs) <= final_count:
+            return self._shortcut_selection(candidate_docs, final_count)
+        
+        candidate_docs = self._prefilter_candidates(candidate_docs, final_count)
+        shortcut = self._shortcut_selection(candidate_docs, final_count)
+        if shortcut is not None:
+            return shortcut
+        filter_prompt = self._build_filter_prompt(candidate_docs, final_count)
+        
+        try:
+            fingerprint = self._candidate_fingerprint(candidate_docs, final_count)
+            # 缓存读写是阻塞的SQLite操作，放到线程池中执行，避免并发批次互相阻塞事件循环
+            selection_result = await asyncio.to_thread(self._get_cached_selection, fingerprint)
+            
+            if selection_result is None:
+                async def _stream_selection() -> Optional[str]:
+                    # 在并发信号量内读完流式响应，max_concurrent 限制的是进行中的完整请求
+                    stream = await self.async_llm_client.chat.completions.create(
+                        model=self.llm_model,
+                        messages=[{"role": "user", "content": filter_prompt}],
+                        temperature=0.1,
+                        max_tokens=LLM_MAX_TOKENS,
+                        stream=True
+                    )
+                    scanner = _FirstJsonObject()
+                    try:
+                        async for chunk in stream:
+                            selection_text = scanner.feed(_delta_text(chunk))
+                            if selection_text is not None:
+                                return selection_text
+                    finally:
+                        if hasattr(stream, "close"):
+                            await stream.close()
+                    return None
+                
+                selection_text = await self._rate_limited(_stream_selection, tokens=len(filter_prompt))
+                
+                if selection_text is None:
+                    raise ValueError("大模型回复中没有完整的JSON结果")
+                selection_result = _json_loads(selection_text)
+                await asyncio.to_thread(self._store_cached_selection, fingerprint, selection_result)
+            else:
+                logger.info("⚡ 命中大模型筛选缓存")
+            
+            return self._select_documents(candidate_docs, selection_result, final_count)
+            
+        except Exception as e:
+            return self._fallback_selection(candidate_docs, final_count, e)
+    
+    def _build_filter_result(self, candidate_docs: List[Dict[str, Any]],
+                             final_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """构建筛选结果字典"""
         if not candidate_docs:
             return {
                 "success": False,
@@ -203,10 +787,6 @@ class FilterManager:
                 }
             }
         
-        # 步骤2：大模型智能筛选
-        final_results = self.filter_by_llm(candidate_docs, final_count)
-        
-        # 构建结果
         result = {
             "success": True,
             "selected_documents": final_results,
@@ -220,14 +800,64 @@ class FilterManager:
             }
         }
         
-        print(f"✅ 文档筛选完成")
-        print(f"📊 统计信息:")
-        print(f"  - 候选文档数: {result['total_candidates']}")
-        print(f"  - 最终选择数: {result['final_selection']}")
-        print(f"  - 平均相似度: {result['statistics']['average_similarity']:.3f}")
+        logger.info("✅ 文档筛选完成")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "📊 统计信息:\n  - 候选文档数: %d\n  - 最终选择数: %d\n  - 平均相似度: %.3f",
+                result["total_candidates"], result["final_selection"],
+                result["statistics"]["average_similarity"]
+            )
         
         return result
     
+    def filter_documents(self, search_results: List[Dict[str, Any]], 
+                        vector_top_k: int = 5, final_count: int = 2) -> Dict[str, Any]:
+        """
+        完整的文档筛选流程
+        
+        Args:
+            search_results: 搜索结果列表
+            vector_top_k: 向量相似度筛选数量
+            final_count: 最终选择数量
+            
+        Returns:
+            筛选结果字典
+        """
+        logger.info("🔍 开始文档筛选流程...")
+        
+        # 步骤1：向量相似度筛选
+        candidate_docs = self.filter_by_vector_similarity(search_results, vector_top_k)
+        
+        # 步骤2：大模型智能筛选
+        final_results = self.filter_by_llm(candidate_docs, final_count) if candidate_docs else []
+        
+        return self._build_filter_result(candidate_docs, final_results)
+    
+    async def afilter_batch(self, search_results: List[Dict[str, Any]],
+                            vector_top_k: int = 5, final_count: int = 2) -> Dict[str, Any]:
+        """完整的文档筛选流程（异步版本，处理单批搜索结果）"""
+        candidate_docs = await self.afilter_by_vector_similarity(search_results, vector_top_k)
+        final_results = await self.afilter_by_llm(candidate_docs, final_count) if candidate_docs else []
+        return self._build_filter_result(candidate_docs, final_results)
+    
+    async def afilter_documents(self, search_batches: List[List[Dict[str, Any]]],
+                                vector_top_k: int = 5, final_count: int = 2) -> List[Dict[str, Any]]:
+        """
+        并发筛选多批互相独立的搜索结果
+        
+        Args:
+            search_batches: 多批搜索结果
+            vector_top_k: 向量相似度筛选数量
+            final_count: 最终选择数量
+            
+        Returns:
+            与输入批次一一对应的筛选结果字典列表
+        """
+        logger.info("🔍 开始并发筛选 %d 批搜索结果...", len(search_batches))
+        return await asyncio.gather(*[
+            self.afilter_batch(batch, vector_top_k, final_count) for batch in search_batches
+        ])
+    
     def save_filter_results(self, filter_results: Dict[str, Any], 
                           filepath: str = "data/filtered_results.json"):
         """
@@ -240,9 +870,9 @@ class FilterManager:
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
         with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(filter_results, f, ensure_ascii=False, indent=2)
+            f.write(_json_dumps(filter_results, indent=True))
         
-        print(f"📄 筛选结果已保存到: {filepath}")
+        logger.info("📄 筛选结果已保存到: %s", filepath)
     
     def test_components(self) -> Dict[str, bool]:
         """测试各个组件"""
@@ -256,9 +886,9 @@ class FilterManager:
         try:
             if self.collection:
                 test_results["chromadb"] = True
-                print("✅ ChromaDB 连接正常")
+                logger.info("✅ ChromaDB 连接正常")
         except Exception as e:
-            print(f"❌ ChromaDB 连接失败: {e}")
+            logger.error("❌ ChromaDB 连接失败: %s", e)
         
         # 测试向量化
         if self.embedding_manager.test_connection():
@@ -272,8 +902,8 @@ class FilterManager:
                 max_tokens=10
             )
             test_results["llm"] = True
-            print("✅ 大模型连接正常")
+            logger.info("✅ 大模型连接正常")
         except Exception as e:
-            print(f"❌ 大模型连接失败: {e}")
+            logger.error("❌ 大模型连接失败: %s", e)
         
         return test_results 
\ No newline at end of file
@@ -6,20 +6,60 @@
 确保ChromaDB训练和搜索向量化使用相同的模型
 """
 
+import atexit
 import json
 import hashlib
+import heapq
 import os
+import sys
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple
 from dataclasses import dataclass, asdict
+from functools import lru_cache
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+# 记录变更后延迟写盘的时间（秒），期间的多次变更合并为一次写入
+SAVE_DEBOUNCE_SECONDS = 0.5
+
+# JSON编解码（优先使用orjson，未安装时回退标准库）
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+    _loads = json.loads
+
+# msgspec（可选）：直接编解码dataclass，省去asdict和手工构造
+try:
+    import msgspec
+    _MSGSPEC_AVAILABLE = True
+except ImportError:
+    _MSGSPEC_AVAILABLE = False
+
+# dataclass(slots=True) 需要 Python 3.10+
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+def _batch_hash(configs: List[Tuple[str, str, str, int]]) -> List[str]:
+    """批量计算 (provider, model_name, api_version, dimension) 的一致性哈希"""
+    sha256 = hashlib.sha256
+    return [
+        sha256(f"{provider}:{model_name}:{api_version}:{dimension}".encode()).hexdigest()[:16]
+        for provider, model_name, api_version, dimension in configs
+    ]
+
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class ModelConfig:
     """模型配置"""
     provider: str  # "qwen", "deepseek", etc.
@@ -29,7 +69,7 @@ class ModelConfig:
     max_tokens: int  # 最大token数
     created_at: str  # 创建时间
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class ConsistencyRecord:
     """一致性记录"""
     consistency_hash: str
@@ -38,42 +78,99 @@ class ConsistencyRecord:
     last_used: str
     chromadb_versions: List[str]  # 使用此模型的ChromaDB版本
 
+if _MSGSPEC_AVAILABLE:
+    class _RecordPayload(msgspec.Struct):
+        """一致性文件中单条记录的结构（哈希作为外层键）"""
+        model_config: ModelConfig
+        usage_count: int
+        last_used: str
+        chromadb_versions: List[str] = []
+
 class ModelConsistencyManager:
     """模型一致性管理器"""
     
     def __init__(self, consistency_file: str = "model_consistency.json"):
         self.consistency_file = Path(consistency_file)
+        # 按注册顺序保存，cleanup_old_models 后按使用次数排序（推荐模型同分时、按提供商查找时均取排在前面的记录）
         self.records: Dict[str, ConsistencyRecord] = {}
         self.current_model: Optional[ModelConfig] = None
+        # (provider, model_name) -> 最早注册的一致性哈希
+        self._provider_index: Dict[Tuple[str, str], str] = {}
+        # 延迟写盘状态：_save_lock 保护记录变更、脏标记和定时器（可重入，变更过程中会调用 save_consistency_records），
+        # _write_lock 保证多次写盘按快照顺序执行
+        self._dirty = False
+        self._save_lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        # 关联新ChromaDB版本后的回调 (consistency_hash, chromadb_version)，用于使依赖集合内容的缓存失效
+        self._chromadb_listeners: List[Callable[[str, str], None]] = []
         self.load_consistency_records()
+        atexit.register(self._flush_now)
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _hash(provider: str, model_name: str, api_version: str, dimension: int) -> str:
+        """计算模型配置的一致性哈希（相同配置直接命中缓存）"""
+        return _batch_hash([(provider, model_name, api_version, dimension)])[0]
     
     def generate_consistency_hash(self, model_config: ModelConfig) -> str:
         """生成模型一致性哈希"""
-        config_str = f"{model_config.provider}:{model_config.model_name}:{model_config.api_version}:{model_config.dimension}"
-        return hashlib.sha256(config_str.encode()).hexdigest()[:16]
+        return self._hash(model_config.provider, model_config.model_name,
+                          model_config.api_version, model_config.dimension)
+    
+    def _rebuild_provider_index(self):
+        """按记录顺序重建 (provider, model_name) 反向索引"""
+        self._provider_index = {}
+        for hash_val, record in self.records.items():
+            model = record.model_config
+            self._provider_index.setdefault((model.provider, model.model_name), hash_val)
+    
+    def _verify_record_hashes(self):
+        """批量重算已加载记录的哈希，提示与配置不一致的记录"""
+        configs = [
+            (m.provider, m.model_name, m.api_version, m.dimension)
+            for m in (record.model_config for record in self.records.values())
+        ]
+        mismatched = [
+            hash_val for hash_val, expected in zip(self.records, _batch_hash(configs))
+            if hash_val != expected
+        ]
+        if mismatched:
+            logger.warning("⚠️  %d 个一致性记录的哈希与模型配置不符: %s", len(mismatched), ", ".join(mismatched))
+    
+    def find_hash(self, provider: str, model_name: str) -> Optional[str]:
+        """按提供商和模型名称查找一致性哈希"""
+        return self._provider_index.get((provider, model_name))
     
     def register_model(self, provider: str, model_name: str, api_version: str = "v1", 
                       dimension: int = 1536, max_tokens: int = 8192) -> str:
         """注册模型配置并返回一致性哈希"""
-        model_config = ModelConfig(
-            provider=provider,
-            model_name=model_name,
-            api_version=api_version,
-            dimension=dimension,
-            max_tokens=max_tokens,
-            created_at=datetime.now().isoformat()
-        )
-        
-        consistency_hash = self.generate_consistency_hash(model_config)
+        consistency_hash = self._hash(provider, model_name, api_version, dimension)
         
+        with self._save_lock:
+            return self._register_locked(consistency_hash, provider, model_name, api_version,
+                                         dimension, max_tokens)
+    
+    def _register_locked(self, consistency_hash: str, provider: str, model_name: str,
+                         api_version: str, dimension: int, max_tokens: int) -> str:
+        """在 _save_lock 内新建或更新记录"""
         if consistency_hash in self.records:
             # 更新现有记录
             record = self.records[consistency_hash]
             record.usage_count += 1
             record.last_used = datetime.now().isoformat()
-            logger.info(f"🔄 更新模型使用记录: {provider}/{model_name} (哈希: {consistency_hash})")
+            model_config = record.model_config
+            logger.info("🔄 更新模型使用记录: %s/%s (哈希: %s)", provider, model_name, consistency_hash)
         else:
             # 创建新记录
+            model_config = ModelConfig(
+                provider=provider,
+                model_name=model_name,
+                api_version=api_version,
+                dimension=dimension,
+                max_tokens=max_tokens,
+                created_at=datetime.now().isoformat()
+            )
             record = ConsistencyRecord(
                 consistency_hash=consistency_hash,
                 model_config=model_config,
@@ -82,7 +179,8 @@ class ModelConsistencyManager:
                 chromadb_versions=[]
             )
             self.records[consistency_hash] = record
-            logger.info(f"📝 注册新模型: {provider}/{model_name} (哈希: {consistency_hash})")
+            self._provider_index.setdefault((provider, model_name), consistency_hash)
+            logger.info("📝 注册新模型: %s/%s (哈希: %s)", provider, model_name, consistency_hash)
         
         self.current_model = model_config
         self.save_consistency_records()
@@ -103,11 +201,18 @@ class ModelConsistencyManager:
         if hash1 == hash2:
             return True, "模型完全一致"
         
-        if not self.validate_consistency(hash1) or not self.validate_consistency(hash2):
+        record1 = self.records.get(hash1)
+        record2 = self.records.get(hash2)
+        if record1 is None or record2 is None:
             return False, "哈希不存在"
         
-        model1 = self.get_model_info(hash1)
-        model2 = self.get_model_info(hash2)
+        model1 = record1.model_config
+        model2 = record2.model_config
+        
+        # 常见情况：一次元组比较即可判定兼容
+        if ((model1.provider, model1.model_name, model1.dimension) ==
+                (model2.provider, model2.model_name, model2.dimension)):
+            return True, "模型兼容"
         
         if model1.provider != model2.provider:
             return False, f"API提供商不一致: {model1.provider} vs {model2.provider}"
@@ -115,19 +220,28 @@ class ModelConsistencyManager:
         if model1.model_name != model2.model_name:
             return False, f"模型名称不一致: {model1.model_name} vs {model2.model_name}"
         
-        if model1.dimension != model2.dimension:
-            return False, f"向量维度不一致: {model1.dimension} vs {model2.dimension}"
-        
-        return True, "模型兼容"
+        return False, f"向量维度不一致: {model1.dimension} vs {model2.dimension}"
+    
+    def add_chromadb_listener(self, callback: Callable[[str, str], None]):
+        """注册关联新ChromaDB版本后的回调 callback(consistency_hash, chromadb_version)"""
+        self._chromadb_listeners.append(callback)
     
     def associate_chromadb_version(self, consistency_hash: str, chromadb_version: str):
-        """关联ChromaDB版本"""
-        if consistency_hash in self.records:
-            record = self.records[consistency_hash]
-            if chromadb_version not in record.chromadb_versions:
-                record.chromadb_versions.append(chromadb_version)
-                self.save_consistency_records()
-                logger.info(f"🔗 关联ChromaDB版本: {chromadb_version} ← {consistency_hash}")
+        """关联ChromaDB版本（新关联时通知已注册的回调）"""
+        with self._save_lock:
+            record = self.records.get(consistency_hash)
+            if record is None or chromadb_version in record.chromadb_versions:
+                return
+            record.chromadb_versions.append(chromadb_version)
+            self.save_consistency_records()
+            logger.info("🔗 关联ChromaDB版本: %s ← %s", chromadb_version, consistency_hash)
+        
+        # 在锁外回调，回调中可以继续访问本管理器
+        for callback in list(self._chromadb_listeners):
+            try:
+                callback(consistency_hash, chromadb_version)
+            except Exception as e:
+                logger.warning("⚠️ ChromaDB版本关联回调失败: %s", e)
     
     def get_recommended_model(self) -> Optional[str]:
         """获取推荐的模型哈希（使用最频繁的）"""
@@ -155,21 +269,20 @@ class ModelConsistencyManager:
         if len(self.records) <= keep_count:
             return
         
-        # 按使用次数和最后使用时间排序
-        sorted_records = sorted(
-            self.records.items(),
-            key=lambda x: (x[1].usage_count, x[1].last_used),
-            reverse=True
-        )
-        
-        # 保留前keep_count个
-        to_keep = dict(sorted_records[:keep_count])
-        removed_count = len(self.records) - len(to_keep)
-        
-        self.records = to_keep
-        self.save_consistency_records()
+        with self._save_lock:
+            # 按使用次数和最后使用时间保留前keep_count个（无需全量排序）
+            to_keep = dict(heapq.nlargest(
+                keep_count,
+                self.records.items(),
+                key=lambda x: (x[1].usage_count, x[1].last_used)
+            ))
+            removed_count = len(self.records) - len(to_keep)
+            
+            self.records = to_keep
+            self._rebuild_provider_index()
+            self.save_consistency_records()
         
-        logger.info(f"🧹 清理了 {removed_count} 个旧模型记录，保留 {len(to_keep)} 个")
+        logger.info("🧹 清理了 %d 个旧模型记录，保留 %d 个", removed_count, len(to_keep))
     
     def load_consistency_records(self):
         """加载一致性记录"""
@@ -178,9 +291,24 @@ class ModelConsistencyManager:
             return
         
         try:
-            with open(self.consistency_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            raw = self.consistency_file.read_bytes()
             
+            if _MSGSPEC_AVAILABLE:
+                payloads = msgspec.json.decode(raw, type=Dict[str, _RecordPayload])
+                for hash_val, payload in payloads.items():
+                    self.records[hash_val] = ConsistencyRecord(
+                        consistency_hash=hash_val,
+                        model_config=payload.model_config,
+                        usage_count=payload.usage_count,
+                        last_used=payload.last_used,
+                        chromadb_versions=payload.chromadb_versions
+                    )
+                self._rebuild_provider_index()
+                self._verify_record_hashes()
+                logger.info("📖 加载了 %d 个模型一致性记录", len(self.records))
+                return
+            
+            data = _loads(raw)
             for hash_val, record_data in data.items():
                 model_config = ModelConfig(**record_data['model_config'])
                 record = ConsistencyRecord(
@@ -192,34 +320,73 @@ class ModelConsistencyManager:
                 )
                 self.records[hash_val] = record
             
-            logger.info(f"📖 加载了 {len(self.records)} 个模型一致性记录")
+            self._rebuild_provider_index()
+            self._verify_record_hashes()
+            logger.info("📖 加载了 %d 个模型一致性记录", len(self.records))
             
         except Exception as e:
-            logger.error(f"❌ 加载一致性记录失败: {e}")
+            logger.error("❌ 加载一致性记录失败: %s", e)
             self.records = {}
+            self._provider_index = {}
     
     def save_consistency_records(self):
-        """保存一致性记录"""
-        try:
-            data = {}
-            for hash_val, record in self.records.items():
-                data[hash_val] = {
-                    'model_config': asdict(record.model_config),
-                    'usage_count': record.usage_count,
-                    'last_used': record.last_used,
-                    'chromadb_versions': record.chromadb_versions
-                }
-            
-            # 确保目录存在
-            self.consistency_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(self.consistency_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"💾 保存了 {len(self.records)} 个模型一致性记录")
+        """标记记录已变更，并在短暂延迟后合并写盘"""
+        with self._save_lock:
+            self._dirty = True
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DEBOUNCE_SECONDS, self._flush_now)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+    
+    def _serialize_records(self) -> bytes:
+        """把当前记录编码为文件内容（调用方需持有 _save_lock）"""
+        if _MSGSPEC_AVAILABLE:
+            # 记录对象直接编码（多出的consistency_hash字段在加载时忽略）
+            return msgspec.json.format(msgspec.json.encode(dict(self.records)), indent=2)
+        
+        data = {}
+        for hash_val, record in self.records.items():
+            data[hash_val] = {
+                'model_config': asdict(record.model_config),
+                'usage_count': record.usage_count,
+                'last_used': record.last_used,
+                'chromadb_versions': list(record.chromadb_versions)
+            }
+        return _dumps(data)
+    
+    def _flush_now(self):
+        """立即将一致性记录写入文件（原子替换），写入失败时保留脏标记，下次保存或退出时重试"""
+        with self._write_lock:
+            # 在锁内取快照，编码期间其他线程不会修改记录
+            with self._save_lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                try:
+                    content = self._serialize_records()
+                except Exception as e:
+                    logger.error("❌ 保存一致性记录失败: %s", e)
+                    return
+                record_count = len(self.records)
+                self._dirty = False
             
-        except Exception as e:
-            logger.error(f"❌ 保存一致性记录失败: {e}")
+            try:
+                # 确保目录存在
+                self.consistency_file.parent.mkdir(parents=True, exist_ok=True)
+                
+                # 先写临时文件再替换，避免读到不完整的文件
+                tmp_file = self.consistency_file.with_name(self.consistency_file.name + ".tmp")
+                tmp_file.write_bytes(content)
+                os.replace(tmp_file, self.consistency_file)
+                
+                logger.info("💾 保存了 %d 个模型一致性记录", record_count)
+                
+            except Exception as e:
+                with self._save_lock:
+                    self._dirty = True
+                logger.error("❌ 保存一致性记录失败: %s", e)
     
     def generate_consistency_report(self) -> Dict:
         """生成一致性报告"""
@@ -292,11 +459,7 @@ def validate_model_consistency(consistency_hash: str) -> bool:
 
 def get_model_consistency_hash(provider: str, model_name: str) -> Optional[str]:
     """获取现有模型的一致性哈希"""
-    for hash_val, record in consistency_manager.records.items():
-        model = record.model_config
-        if model.provider == provider and model.model_name == model_name:
-            return hash_val
-    return None
+    return consistency_manager.find_hash(provider, model_name)
 
 
 # 演示函数
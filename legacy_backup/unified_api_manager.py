@@ -2,19 +2,116 @@
 """
 统一API管理器
 整合千问和DeepSeek API支持，千问为主，DeepSeek为备选
+
+所有接口均为异步；入口程序安装了uvloop时建议在 asyncio.run 之前调用
+use_uvloop() 切换事件循环策略，降低大量小协程（合并嵌入、重试等）的调度开销
 """
 
+import array
 import asyncio
 import json
+import os
+import random
 import hashlib
-import urllib.request
+import re
+import http.client
+import sqlite3
+import threading
 import urllib.parse
-import urllib.error
-from typing import Dict, List, Any, Optional, Union
+import time
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import AsyncIterator, Callable, Dict, List, Any, NamedTuple, Optional, Set, Union
 from datetime import datetime
 from enum import Enum
 import logging
 
+import numpy as np
+
+# 请求体编码与响应解析（优先使用orjson，未安装时回退标准库）
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _loads = json.loads
+
+# msgspec（可选）：按结构直接解码嵌入响应，同时校验响应格式
+try:
+    import msgspec
+    _MSGSPEC_AVAILABLE = True
+except ImportError:
+    _MSGSPEC_AVAILABLE = False
+
+if _MSGSPEC_AVAILABLE:
+    class _EmbeddingItem(msgspec.Struct):
+        embedding: List[float]
+
+    class _QwenEmbeddingOutput(msgspec.Struct):
+        embeddings: List[_EmbeddingItem]
+
+    class _QwenEmbeddingResponse(msgspec.Struct):
+        """千问嵌入API响应"""
+        output: _QwenEmbeddingOutput
+
+    class _OpenAIEmbeddingResponse(msgspec.Struct):
+        """OpenAI兼容嵌入API响应"""
+        data: List[_EmbeddingItem]
+
+    _QWEN_EMBEDDING_DECODER = msgspec.json.Decoder(_QwenEmbeddingResponse)
+    _OPENAI_EMBEDDING_DECODER = msgspec.json.Decoder(_OpenAIEmbeddingResponse)
+
+def _decode_embeddings(provider: str, body: bytes) -> np.ndarray:
+    """从嵌入API响应体中取出向量矩阵 (N, dim) float32（千问格式，其余按OpenAI兼容格式）"""
+    if _MSGSPEC_AVAILABLE:
+        if provider == "qwen":
+            items = _QWEN_EMBEDDING_DECODER.decode(body).output.embeddings
+        else:
+            items = _OPENAI_EMBEDDING_DECODER.decode(body).data
+        return np.asarray([item.embedding for item in items], dtype=np.float32)
+    
+    result = _loads(body)
+    if provider == "qwen":
+        items = result["output"]["embeddings"]
+    else:
+        items = result["data"]
+    return np.asarray([item["embedding"] for item in items], dtype=np.float32)
+
+# 异步HTTP客户端（未安装aiohttp时在线程池中执行同步请求，避免阻塞事件循环）
+try:
+    import aiohttp
+    _AIOHTTP_AVAILABLE = True
+except ImportError:
+    _AIOHTTP_AVAILABLE = False
+
+# 无aiohttp时的同步请求连接池：每个工作线程按 (协议, 主机) 保持长连接
+_thread_local = threading.local()
+
+def _pooled_connection(scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+    """获取当前线程到目标主机的长连接"""
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    conn = connections.get((scheme, netloc))
+    if conn is None:
+        conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = connections[(scheme, netloc)] = conn_class(netloc, timeout=timeout)
+    else:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+    return conn
+
+def _drop_connection(scheme: str, netloc: str):
+    """关闭并移除当前线程到目标主机的长连接"""
+    conn = getattr(_thread_local, "connections", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
 # 导入模型一致性管理器
 try:
     from .model_consistency_manager import consistency_manager, register_embedding_model
@@ -30,12 +127,231 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def use_uvloop() -> bool:
+    """安装uvloop事件循环策略（未安装uvloop时保持默认策略），返回是否已切换"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+# 从切分结果中提取包含chunks字段的JSON对象
+_CHUNKS_RE = re.compile(r'\{.*"chunks".*\}', re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# 领域特定的切分提示模板与系统消息（模块级常量，调用间共享，不可修改）
+_DOMAIN_PROMPTS = {
+    "credit_research": """
+请将以下征信研究文本按照语义完整性进行智能切分，要求：
+
+1. 保持语义完整性，不在句子中间切断
+2. 每个文本块保持主题一致性
+3. 优先在段落、标题、列表等结构性标记处切分
+4. 每块大小控制在{max_chunk_size}字符以内
+5. 保留重要的上下文信息
+
+请返回JSON格式的切分结果，格式为：
+{{"chunks": ["文本块1", "文本块2", ...]}}
+
+待切分文本：
+{text}
+""",
+    "general": """
+请将以下文本进行智能切分，每块不超过{max_chunk_size}字符，
+保持语义完整性，返回JSON格式：{{"chunks": ["文本块1", "文本块2", ...]}}
+
+文本：
+{text}
+"""
+}
+
+_SEGMENTATION_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "你是一个专业的文本切分助手，擅长按照语义完整性进行文本切分。请严格按照要求返回JSON格式的结果。"
+}
+
+# 向量缓存：按 (模型ID, 文本) 精确匹配，LRU淘汰并设置过期时间
+EMBEDDING_CACHE_SIZE = 10000
+EMBEDDING_CACHE_TTL = 3600  # 秒
+EMBEDDING_CACHE_DB = None  # 持久化缓存库路径（如 "data/embedding_cache.db"），默认只用内存缓存
+
+# 嵌入请求合并：等待窗口内到达的文本合并为一次API调用（千问单次最多25条）
+EMBED_BATCH_MAX = 25
+EMBED_BATCH_DELAY = 0.02  # 秒
+
+# 瞬时错误（限流、5xx、网络错误）重试：指数退避加随机抖动
+RETRY_MAX_TRIES = 4
+RETRY_BASE_DELAY = 0.25  # 秒
+RETRY_MAX_DELAY = 4.0  # 秒
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class APIRequestError(Exception):
+    """API请求失败（status为HTTP状态码，网络错误时为None）"""
+    
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+    
+    @property
+    def retriable(self) -> bool:
+        return self.status is None or self.status in RETRY_STATUS
+
+
+@lru_cache(maxsize=8)
+def _consistency(qwen_model: str, provider_value: str, date: str) -> str:
+    """按（嵌入模型, 提供商, 日期）计算一致性哈希，同一天内命中缓存"""
+    return hashlib.sha256(f"{qwen_model}\0{provider_value}\0{date}".encode()).hexdigest()[:16]
+
+
+def _model_key(model_config) -> tuple:
+    """嵌入模型的标识：同一 model_id 在不同提供商或端点上是不同的模型（向量空间、维度都可能不同）"""
+    return (model_config.provider, model_config.model_id, model_config.base_url)
+
+
+class _EmbeddingCache:
+    """
+    文本向量的两级缓存：进程内LRU + 可选的SQLite持久化（均带过期时间，重启后可复用）
+    
+    内存缓存只在事件循环线程中访问；持久化库的读写通过 asyncio.to_thread 在线程池中执行，
+    连接由 _db_lock 串行化
+    """
+    
+    def __init__(self, maxsize: int = EMBEDDING_CACHE_SIZE, ttl: float = EMBEDDING_CACHE_TTL,
+                 db_path: Optional[str] = EMBEDDING_CACHE_DB):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[bytes, tuple]" = OrderedDict()  # 键 -> (写入时间, 向量)
+        self.hits = 0
+        self.misses = 0
+        self._db_lock = threading.Lock()
+        self._db = self._open_db(db_path) if db_path else None
+    
+    def _open_db(self, db_path: str) -> Optional[sqlite3.Connection]:
+        """打开持久化缓存库并清理过期记录，失败时只使用进程内缓存"""
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS emb (key BLOB PRIMARY KEY, vec BLOB NOT NULL, ts REAL NOT NULL)")
+            db.execute("DELETE FROM emb WHERE ts < ?", (time.time() - self.ttl,))
+            db.commit()
+            return db
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"⚠️ 向量缓存库不可用，仅使用内存缓存: {e}")
+            return None
+    
+    @staticmethod
+    def key(model_key: tuple, text: str) -> bytes:
+        """缓存键：模型标识 (provider, model_id, base_url) 与文本的摘要，不同端点的同名模型互不共享"""
+        return hashlib.sha256("\0".join((*model_key, text)).encode("utf-8")).digest()
+    
+    def _get_memory(self, key: bytes) -> Optional[np.ndarray]:
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+    
+    def _put_memory(self, key: bytes, embedding: np.ndarray, written: float):
+        self._data[key] = (written, embedding)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def _db_get(self, keys: List[bytes], now: float) -> List[tuple]:
+        """在工作线程中查询持久化库，返回未过期的 [(键, 向量字节, 写入时间), ...]"""
+        rows = []
+        with self._db_lock:
+            for start in range(0, len(keys), 500):  # 不超过SQLite参数个数上限
+                part = keys[start:start + 500]
+                rows.extend(self._db.execute(
+                    f"SELECT key, vec, ts FROM emb WHERE key IN ({','.join('?' * len(part))}) AND ts >= ?",
+                    (*part, now - self.ttl)
+                ))
+        return rows
+    
+    def _db_put(self, rows: List[tuple]):
+        """在工作线程中把 [(键, 向量字节, 写入时间), ...] 写入持久化库（一个事务）"""
+        try:
+            with self._db_lock, self._db:
+                self._db.executemany("INSERT OR REPLACE INTO emb (key, vec, ts) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 向量缓存写入失败: {e}")
+    
+    async def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """批量查询：先查内存，未命中的键一次性查询持久化库"""
+        result = [self._get_memory(key) for key in keys]
+        missing = [key for key, embedding in zip(keys, result) if embedding is None]
+        
+        if missing and self._db is not None:
+            now = time.time()
+            try:
+                rows = await asyncio.to_thread(self._db_get, missing, now)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 向量缓存读取失败: {e}")
+                rows = []
+            found = {}
+            for key, vec, ts in rows:
+                embedding = np.frombuffer(vec, dtype=np.float32)
+                # 按库中的写入时间折算到内存缓存，过期时间保持一致
+                self._put_memory(key, embedding, time.monotonic() - (now - ts))
+                found[key] = embedding
+            if found:
+                result = [embedding if embedding is not None else found.get(key)
+                          for key, embedding in zip(keys, result)]
+        
+        hits = sum(embedding is not None for embedding in result)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return result
+    
+    async def get(self, key: bytes) -> Optional[np.ndarray]:
+        return (await self.get_many([key]))[0]
+    
+    async def put_many(self, items: List[tuple]):
+        """批量写入 [(键, 向量), ...]，持久化库在一个事务中提交"""
+        written = time.monotonic()
+        for key, embedding in items:
+            self._put_memory(key, embedding, written)
+        
+        if self._db is not None and items:
+            now = time.time()
+            rows = [(key, np.asarray(embedding, dtype=np.float32).tobytes(), now) for key, embedding in items]
+            await asyncio.to_thread(self._db_put, rows)
+    
+    async def put(self, key: bytes, embedding: np.ndarray):
+        await self.put_many([(key, embedding)])
+
 class ModelProvider(Enum):
     """模型提供商枚举"""
     QWEN = "qwen"
     # DEEPSEEK = "deepseek"  # 已注释，专注千问API
     AUTO = "auto"  # 自动选择
 
+class ChatParams(NamedTuple):
+    """聊天生成参数"""
+    temperature: float = 0.7
+    top_p: float = 0.8
+    max_tokens: int = 2000
+
+
+DEFAULT_CHAT_PARAMS = ChatParams()
+_SEGMENTATION_CHAT_PARAMS = ChatParams(temperature=0.1)
+
+
+def _resolve_chat_params(params: Optional[ChatParams], kwargs: Dict[str, Any]) -> ChatParams:
+    """合并显式参数与关键字参数（兼容旧的 temperature=... 调用方式，忽略未知参数）"""
+    if params is None:
+        params = DEFAULT_CHAT_PARAMS
+    if kwargs:
+        params = params._replace(**{k: v for k, v in kwargs.items() if k in ChatParams._fields})
+    return params
+
 class APIEndpoint(Enum):
     """API端点枚举"""
     QWEN_CHAT = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
@@ -46,12 +362,13 @@ class APIEndpoint(Enum):
 class UnifiedAPIManager:
     """统一API管理器"""
     
-    def __init__(self, api_config):
+    def __init__(self, api_config, embedding_cache_db: Optional[str] = EMBEDDING_CACHE_DB):
         """
         初始化统一API管理器
         
         Args:
             api_config: APIConfig实例，包含模型注册表
+            embedding_cache_db: 向量缓存的SQLite持久化路径，None表示只用进程内缓存
         """
         self.api_config = api_config
         self.model_registry = api_config.model_registry
@@ -60,28 +377,181 @@ class UnifiedAPIManager:
         self.current_chat_model = api_config.default_chat_model
         self.current_embedding_model = api_config.default_embedding_model
         
-        # API调用统计 - 动态构建基于可用提供商
-        self.api_stats = {}
+        # API调用统计 - 动态构建基于可用提供商（按提供商下标存放在计数数组中）
+        self._stat_index: Dict[str, int] = {}
         for provider in self.api_config.get_available_providers().keys():
             if provider != "perplexity":  # Perplexity是搜索API，不在这里统计
-                self.api_stats[provider] = {"calls": 0, "success": 0, "errors": 0}
+                self._stat_index[provider] = len(self._stat_index)
+        self._stat_calls = array.array('Q', [0] * len(self._stat_index))
+        self._stat_success = array.array('Q', [0] * len(self._stat_index))
+        self._stat_errors = array.array('Q', [0] * len(self._stat_index))
         
         # 模型一致性哈希
         self.consistency_hash = self._generate_consistency_hash()
+        
+        # 文本向量缓存
+        self._emb_cache = _EmbeddingCache(db_path=embedding_cache_db)
+        
+        # 模型配置查找缓存（注册表变更后调用 invalidate_model_cache）
+        self._model_cache: Dict[str, Any] = {}
+        self._embedding_fallbacks: Optional[List[tuple]] = None
+        # 按模型预先构建的请求头（只读，请求间共享）
+        self._headers_cache: Dict[tuple, Dict[str, str]] = {}
+        
+        # 复用的HTTP会话（绑定到当前事件循环，首次请求时创建）
+        self._session = None
+        self._session_loop = None
+        
+        # 嵌入请求合并队列与后台任务（按模型区分，绑定到当前事件循环）
+        self._emb_loop = None
+        self._emb_queues: Dict[tuple, asyncio.Queue] = {}
+        self._emb_workers: Dict[tuple, asyncio.Task] = {}
+        self._emb_flushes: Set[asyncio.Task] = set()
     
-    def _generate_consistency_hash(self) -> str:
-        """生成模型一致性哈希"""
-        config_str = json.dumps({
-            "qwen_model": self.model_configs[ModelProvider.QWEN]["embedding_model"],
-            "current_provider": self.current_provider.value,
-            "timestamp": datetime.now().isoformat()[:10]  # 只使用日期部分
-        }, sort_keys=True)
+    def _get_model_config(self, model_alias: str):
+        """按别名获取模型配置（缓存注册表查找结果）"""
+        model_config = self._model_cache.get(model_alias)
+        if model_config is None:
+            model_config = self.model_registry.get_model(model_alias)
+            if model_config is not None:
+                self._model_cache[model_alias] = model_config
+        return model_config
+    
+    def _get_embedding_fallbacks(self) -> List[tuple]:
+        """已配置API密钥的备选嵌入模型 [(别名, 配置), ...]"""
+        if self._embedding_fallbacks is None:
+            self._embedding_fallbacks = [
+                (alias, config)
+                for alias, config in self.model_registry.get_models_by_type("embedding").items()
+                if config.api_key
+            ]
+        return self._embedding_fallbacks
+    
+    def _request_headers(self, model_config) -> Dict[str, str]:
+        """模型的请求头，每个配置只构建一次（调用方不得修改返回的dict）"""
+        key = (model_config.provider, model_config.model_id, model_config.base_url, model_config.api_key)
+        headers = self._headers_cache.get(key)
+        if headers is None:
+            headers = {
+                "Authorization": f"Bearer {model_config.api_key}",
+                "Content-Type": "application/json",
+                **model_config.custom_headers
+            }
+            self._headers_cache[key] = headers
+        return headers
+    
+    def invalidate_model_cache(self):
+        """清空模型配置缓存（注册表中的模型变更后调用）"""
+        self._model_cache.clear()
+        self._headers_cache.clear()
+        self._embedding_fallbacks = None
+    
+    async def _get_session(self):
+        """获取当前事件循环的aiohttp会话"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=64, limit_per_host=16,
+                    keepalive_timeout=60,  # 保持TCP+TLS连接，批量请求之间不重新握手
+                    ttl_dns_cache=300
+                )
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def close(self):
+        """关闭HTTP会话并停止嵌入合并任务（包括正在发送的批次）"""
+        tasks = [*self._emb_workers.values(), *self._emb_flushes]
+        for task in tasks:
+            task.cancel()
+        if self._emb_loop is asyncio.get_running_loop():
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._emb_queues = {}
+        self._emb_workers = {}
+        self._emb_flushes = set()
+        self._emb_loop = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+    
+    async def _post_json(self, url: str, payload: Dict[str, Any],
+                         headers: Dict[str, str], timeout: float,
+                         decode: Callable[[bytes], Any] = _loads) -> Any:
+        """发送JSON POST请求并用decode解析响应体"""
+        if not _AIOHTTP_AVAILABLE:
+            return await asyncio.to_thread(self._post_json_blocking, url, payload, headers, timeout, decode)
         
-        return hashlib.md5(config_str.encode()).hexdigest()[:8]
+        session = await self._get_session()
+        try:
+            async with session.post(url, data=_dumps(payload), headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise APIRequestError(f"HTTP错误 {response.status}: {error_text}", response.status)
+                return decode(await response.read())
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise APIRequestError(f"网络错误: {e}")
+    
+    @staticmethod
+    def _post_json_blocking(url: str, payload: Dict[str, Any],
+                            headers: Dict[str, str], timeout: float,
+                            decode: Callable[[bytes], Any] = _loads) -> Any:
+        """同步发送请求（仅在未安装aiohttp时于线程池中调用），复用本线程的长连接"""
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        body = _dumps(payload)
+        
+        # 复用的连接可能已被服务端关闭，此时新建连接重试一次
+        for attempt in range(2):
+            conn = _pooled_connection(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                _drop_connection(parts.scheme, parts.netloc)
+                if attempt == 0:
+                    continue
+                raise APIRequestError(f"网络错误: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                _drop_connection(parts.scheme, parts.netloc)
+                raise APIRequestError(f"网络错误: {e}")
+            
+            if response.will_close:
+                _drop_connection(parts.scheme, parts.netloc)
+            if response.status != 200:
+                raise APIRequestError(f"HTTP错误 {response.status}: {data.decode('utf-8', errors='replace')}",
+                                      response.status)
+            return decode(data)
+    
+    async def _with_retry(self, fn: Callable, *args, **kwargs) -> Any:
+        """执行异步请求，遇到限流、5xx或网络错误时退避后重试（不阻塞事件循环）"""
+        for attempt in range(RETRY_MAX_TRIES):
+            try:
+                return await fn(*args, **kwargs)
+            except APIRequestError as e:
+                if not e.retriable or attempt == RETRY_MAX_TRIES - 1:
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"⚠️ 请求失败，{delay:.2f}秒后重试 ({attempt + 1}/{RETRY_MAX_TRIES - 1}): {e}")
+                await asyncio.sleep(delay)
+    
+    def _generate_consistency_hash(self) -> str:
+        """生成模型一致性哈希（只使用日期部分，同一天内结果不变）"""
+        return _consistency(
+            self.model_configs[ModelProvider.QWEN]["embedding_model"],
+            self.current_provider.value,
+            datetime.now().strftime("%Y-%m-%d")
+        )
     
     async def chat_completion(self, 
                             messages: List[Dict[str, str]], 
                             provider: ModelProvider = None,
+                            params: Optional[ChatParams] = None,
                             **kwargs) -> Dict[str, Any]:
         """
         统一的聊天完成接口
@@ -89,98 +559,170 @@ class UnifiedAPIManager:
         Args:
             messages: 消息列表
             provider: 指定提供商，默认使用当前提供商
-            **kwargs: 其他参数
+            params: 生成参数，默认使用 DEFAULT_CHAT_PARAMS
+            **kwargs: 单独覆盖的生成参数（temperature、top_p、max_tokens）
             
         Returns:
             API响应结果
         """
         if provider is None:
             provider = self.current_provider
+        params = _resolve_chat_params(params, kwargs)
         
         if provider == ModelProvider.AUTO:
             # 自动选择：先尝试千问，失败则使用DeepSeek
             try:
-                return await self._call_chat_api(ModelProvider.QWEN, messages, **kwargs)
+                return await self._call_chat_api(ModelProvider.QWEN, messages, params)
             except Exception as e:
                 logger.warning(f"千问API调用失败，切换到DeepSeek: {e}")
                 if self.deepseek_api_key:
-                    return await self._call_chat_api(ModelProvider.DEEPSEEK, messages, **kwargs)
+                    return await self._call_chat_api(ModelProvider.DEEPSEEK, messages, params)
                 else:
                     raise Exception("千问API失败且未配置DeepSeek API密钥")
         else:
-            return await self._call_chat_api(provider, messages, **kwargs)
+            return await self._call_chat_api(provider, messages, params)
+    
+    async def chat_completion_stream(self,
+                                     messages: List[Dict[str, str]],
+                                     provider: ModelProvider = None,
+                                     params: Optional[ChatParams] = None,
+                                     **kwargs) -> AsyncIterator[str]:
+        """
+        流式聊天接口：模型生成过程中逐段产出文本
+        
+        Args:
+            messages: 消息列表
+            provider: 指定提供商，默认使用当前提供商（AUTO时使用千问）
+            params: 生成参数，默认使用 DEFAULT_CHAT_PARAMS
+            **kwargs: 单独覆盖的生成参数
+            
+        Yields:
+            增量文本片段
+        """
+        if provider is None:
+            provider = self.current_provider
+        if provider == ModelProvider.AUTO:
+            provider = ModelProvider.QWEN
+        params = _resolve_chat_params(params, kwargs)
+        
+        # 未安装aiohttp时退化为一次性返回完整结果
+        if not _AIOHTTP_AVAILABLE:
+            result = await self._call_chat_api(provider, messages, params)
+            yield result["content"]
+            return
+        
+        config = self.model_configs[provider]
+        slot = self._stat_index.get(provider.value)
+        if slot is not None:
+            self._stat_calls[slot] += 1
+        
+        payload = self._build_chat_payload(provider, config, messages, params)
+        headers = dict(config["headers"])
+        if provider == ModelProvider.QWEN:
+            payload["parameters"]["incremental_output"] = True
+            headers["X-DashScope-SSE"] = "enable"
+        else:
+            payload["stream"] = True
+        
+        try:
+            session = await self._get_session()
+            async with session.post(config["chat_endpoint"], data=_dumps(payload), headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=60)) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise APIRequestError(f"HTTP错误 {response.status}: {error_text}", response.status)
+                
+                # SSE：每个事件一行 "data: {...}"，OpenAI兼容格式以 [DONE] 结束
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    
+                    event = _loads(data)
+                    if provider == ModelProvider.QWEN:
+                        text = event["output"].get("text")
+                    else:
+                        choices = event.get("choices")
+                        text = choices[0]["delta"].get("content") if choices else None
+                    if text:
+                        yield text
+            
+            if slot is not None:
+                self._stat_success[slot] += 1
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if slot is not None:
+                self._stat_errors[slot] += 1
+            logger.error(f"{provider.value} 流式聊天API调用失败: {e}")
+            raise APIRequestError(f"网络错误: {e}")
+        except Exception as e:
+            if slot is not None:
+                self._stat_errors[slot] += 1
+            logger.error(f"{provider.value} 流式聊天API调用失败: {e}")
+            raise
+    
+    @staticmethod
+    def _build_chat_payload(provider: ModelProvider, config: Dict[str, Any],
+                            messages: List[Dict[str, str]], params: ChatParams) -> Dict[str, Any]:
+        """按提供商格式构建聊天请求体"""
+        if provider == ModelProvider.QWEN:
+            # 千问API格式
+            return {
+                "model": config["chat_model"],
+                "input": {
+                    "messages": messages
+                },
+                "parameters": {
+                    "temperature": params.temperature,
+                    "top_p": params.top_p,
+                    "max_tokens": params.max_tokens
+                }
+            }
+        # DeepSeek API格式（兼容OpenAI）
+        return {
+            "model": config["chat_model"],
+            "messages": messages,
+            "temperature": params.temperature,
+            "top_p": params.top_p,
+            "max_tokens": params.max_tokens
+        }
     
     async def _call_chat_api(self, 
                            provider: ModelProvider, 
                            messages: List[Dict[str, str]], 
-                           **kwargs) -> Dict[str, Any]:
+                           params: ChatParams = DEFAULT_CHAT_PARAMS) -> Dict[str, Any]:
         """调用聊天API"""
         config = self.model_configs[provider]
-        self.api_stats[provider]["calls"] += 1
+        slot = self._stat_index.get(provider.value)
+        if slot is not None:
+            self._stat_calls[slot] += 1
         
         try:
+            payload = self._build_chat_payload(provider, config, messages, params)
+            result = await self._with_retry(self._post_json, config["chat_endpoint"], payload, config["headers"],
+                                            timeout=60)
+            if slot is not None:
+                self._stat_success[slot] += 1
+            
+            # 统一响应格式
             if provider == ModelProvider.QWEN:
-                # 千问API格式
-                payload = {
-                    "model": config["chat_model"],
-                    "input": {
-                        "messages": messages
-                    },
-                    "parameters": {
-                        "temperature": kwargs.get("temperature", 0.7),
-                        "top_p": kwargs.get("top_p", 0.8),
-                        "max_tokens": kwargs.get("max_tokens", 2000)
-                    }
-                }
+                content = result["output"]["text"]
             else:
-                # DeepSeek API格式（兼容OpenAI）
-                payload = {
-                    "model": config["chat_model"],
-                    "messages": messages,
-                    "temperature": kwargs.get("temperature", 0.7),
-                    "top_p": kwargs.get("top_p", 0.8),
-                    "max_tokens": kwargs.get("max_tokens", 2000)
-                }
+                content = result["choices"][0]["message"]["content"]
             
-            # 使用urllib进行同步HTTP请求（在异步函数中）
-            request_data = json.dumps(payload).encode('utf-8')
-            req = urllib.request.Request(
-                config["chat_endpoint"],
-                data=request_data,
-                headers=config["headers"]
-            )
-            
-            try:
-                with urllib.request.urlopen(req, timeout=60) as response:
-                    if response.status == 200:
-                        result_data = response.read().decode('utf-8')
-                        result = json.loads(result_data)
-                        self.api_stats[provider]["success"] += 1
-                        
-                        # 统一响应格式
-                        if provider == ModelProvider.QWEN:
-                            content = result["output"]["text"]
-                        else:
-                            content = result["choices"][0]["message"]["content"]
-                        
-                        return {
-                            "content": content,
-                            "provider": provider.value,
-                            "model": config["chat_model"],
-                            "consistency_hash": self.consistency_hash,
-                            "success": True
-                        }
-                    else:
-                        error_text = response.read().decode('utf-8')
-                        raise Exception(f"API返回错误 {response.status}: {error_text}")
-            except urllib.error.HTTPError as e:
-                error_text = e.read().decode('utf-8') if hasattr(e, 'read') else str(e)
-                raise Exception(f"HTTP错误 {e.code}: {error_text}")
-            except urllib.error.URLError as e:
-                raise Exception(f"网络错误: {e.reason}")
+            return {
+                "content": content,
+                "provider": provider.value,
+                "model": config["chat_model"],
+                "consistency_hash": self.consistency_hash,
+                "success": True
+            }
                         
         except Exception as e:
-            self.api_stats[provider]["errors"] += 1
+            if slot is not None:
+                self._stat_errors[slot] += 1
             logger.error(f"{provider.value} 聊天API调用失败: {e}")
             raise
     
@@ -195,22 +737,35 @@ class UnifiedAPIManager:
             model_alias: 指定的模型别名，如果为None则使用默认embedding模型
             
         Returns:
-            嵌入向量结果
+            嵌入向量结果（embeddings 为 (N, dim) 的float32矩阵）
         """
         if model_alias is None:
             model_alias = self.current_embedding_model
             
         # 获取模型配置
-        model_config = self.model_registry.get_model(model_alias)
+        model_config = self._get_model_config(model_alias)
         if not model_config:
             raise ValueError(f"模型 {model_alias} 未找到在注册表中")
         
         if model_config.model_type != "embedding":
             raise ValueError(f"模型 {model_alias} 不是向量化模型")
-            
-        # 注册模型到一致性管理器
+        
         try:
-            from .model_consistency_manager import register_embedding_model
+            return await self._embed_for_alias(texts, model_alias, model_config)
+        except Exception as e:
+            print(f"❌ {model_alias}向量化失败: {e}")
+            # 尝试切换到同类型的其他模型（按注册表顺序，取第一个成功的结果）
+            backups = [(alias, config) for alias, config in self._get_embedding_fallbacks()
+                       if alias != model_alias]
+            if not backups:
+                raise
+            print(f"🔄 尝试切换到备选模型: {', '.join(alias for alias, _ in backups)}")
+            return await self._first_successful_embedding(texts, backups)
+    
+    async def _embed_for_alias(self, texts: List[str], model_alias: str, model_config) -> Dict[str, Any]:
+        """使用指定模型生成向量，并附上一致性哈希和模型别名"""
+        # 注册模型到一致性管理器（模块导入时已解析，未安装时跳过）
+        if register_embedding_model is not None:
             model_hash = register_embedding_model(
                 provider=model_config.provider,
                 model_name=model_config.model_id,
@@ -218,23 +773,140 @@ class UnifiedAPIManager:
                 dimension=1536,  # 根据模型实际维度调整
                 max_tokens=model_config.max_tokens
             )
-        except ImportError:
+        else:
             model_hash = "no_consistency_manager"
         
+        result = await self._embed_with_cache(model_config, texts)
+        result['model_consistency_hash'] = model_hash
+        result['model_alias'] = model_alias
+        return result
+    
+    async def _first_successful_embedding(self, texts: List[str], backups: List[tuple]) -> Dict[str, Any]:
+        """
+        按注册表顺序依次尝试备选模型，返回第一个成功的结果
+        
+        不同模型的向量空间互不兼容，因此不并发竞速：结果所属的模型只取决于配置顺序，
+        且只有前面的模型失败后才会请求（并计费）下一个
+        """
+        last_error = None
+        for alias, config in backups:
+            try:
+                return await self._embed_for_alias(texts, alias, config)
+            except Exception as e:
+                print(f"❌ 备选模型 {alias} 向量化失败: {e}")
+                last_error = e
+        raise last_error
+    
+    async def _embed_with_cache(self, model_config, texts: List[str]) -> Dict[str, Any]:
+        """先查向量缓存，只把未命中的（去重后）文本发送给嵌入API"""
+        cache = self._emb_cache
+        model_key = _model_key(model_config)
+        keys = [cache.key(model_key, text) for text in texts]
+        embeddings = await cache.get_many(keys)
+        
+        # 未命中的文本按键去重，同一批次中的重复文本只请求一次
+        pending: Dict[bytes, str] = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None and key not in pending:
+                pending[key] = text
+        
+        if pending:
+            fetched = dict(zip(pending.keys(), await self._coalesced_embed(model_config, list(pending.values()))))
+            await cache.put_many(list(fetched.items()))
+            embeddings = [
+                embedding if embedding is not None else fetched[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
+        
+        result = {
+            "provider": model_config.provider,
+            "model": model_config.model_id,
+            "success": True
+        }
+        # 缓存中按行保存，返回时拼成连续的float32矩阵
+        result["embeddings"] = np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+        result["embedding_count"] = len(embeddings)
+        result["cache_hits"] = len(texts) - len(pending)
+        return result
+    
+    async def _coalesced_embed(self, model_config, texts: List[str]) -> List[np.ndarray]:
+        """将文本放入该模型的合并队列，等待后台任务批量请求后返回向量"""
+        loop = asyncio.get_running_loop()
+        if self._emb_loop is not loop:
+            self._emb_loop = loop
+            self._emb_queues = {}
+            self._emb_workers = {}
+            self._emb_flushes = set()
+        
+        model_key = _model_key(model_config)
+        queue = self._emb_queues.get(model_key)
+        if queue is None:
+            queue = self._emb_queues[model_key] = asyncio.Queue()
+            self._emb_workers[model_key] = loop.create_task(self._emb_worker(queue))
+        
+        # 每条请求携带调用时的模型配置，密钥轮换或请求头变更后的批次使用新配置
+        futures = [loop.create_future() for _ in texts]
+        for text, future in zip(texts, futures):
+            queue.put_nowait((text, future, model_config))
+        return list(await asyncio.gather(*futures))
+    
+    async def _emb_worker(self, queue: asyncio.Queue):
+        """收集等待窗口内的嵌入请求（最多EMBED_BATCH_MAX条），合并后并发发送"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + EMBED_BATCH_DELAY
+            while len(batch) < EMBED_BATCH_MAX:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            flush = loop.create_task(self._flush_emb_batch(batch))
+            self._emb_flushes.add(flush)
+            flush.add_done_callback(self._emb_flushes.discard)
+    
+    async def _flush_emb_batch(self, batch: List[tuple]):
+        """发送一批合并后的 (文本, 等待者, 模型配置) 请求，并把结果分发给各自的等待者"""
+        # 等待者都已取消（如调用方超时）时不再发送请求
+        if all(future.done() for _, future, _ in batch):
+            return
+        
+        # 同一队列中的请求属于同一模型，使用最近一条请求的配置（注册表更新后立即生效）
+        model_config = batch[-1][2]
+        
+        # 请求进行中等待者全部取消时，取消底层HTTP请求
+        request = asyncio.ensure_future(self._call_embedding_api(model_config, [text for text, _, _ in batch]))
+        
+        def _cancel_if_abandoned(_):
+            if not request.done() and all(future.done() for _, future, _ in batch):
+                request.cancel()
+        
+        for _, future, _ in batch:
+            future.add_done_callback(_cancel_if_abandoned)
+        
         try:
-            result = await self._call_embedding_api(model_config, texts)
-            result['model_consistency_hash'] = model_hash
-            result['model_alias'] = model_alias
-            return result
-        except Exception as e:
-            print(f"❌ {model_alias}向量化失败: {e}")
-            # 尝试切换到同类型的其他模型
-            fallback_models = self.model_registry.get_models_by_type("embedding")
-            for alias, config in fallback_models.items():
-                if alias != model_alias and config.api_key:
-                    print(f"🔄 尝试切换到备选模型: {alias}")
-                    return await self.create_embeddings(texts, alias)
+            result = await request
+            embeddings = result["embeddings"]
+            if len(embeddings) != len(batch):
+                raise ValueError(f"嵌入API返回 {len(embeddings)} 条向量，请求了 {len(batch)} 条")
+        except asyncio.CancelledError:
+            for _, future, _ in batch:
+                future.cancel()
             raise
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
     
     async def _call_embedding_api(self, 
                                 model_config, 
@@ -242,8 +914,9 @@ class UnifiedAPIManager:
         """调用嵌入API"""
         # 更新统计信息
         provider = model_config.provider
-        if provider in self.api_stats:
-            self.api_stats[provider]["calls"] += 1
+        slot = self._stat_index.get(provider)
+        if slot is not None:
+            self._stat_calls[slot] += 1
         
         try:
             # 根据提供商构建请求
@@ -274,57 +947,26 @@ class UnifiedAPIManager:
                     "input": texts
                 }
             
-            # 构建请求头
-            headers = {
-                "Authorization": f"Bearer {model_config.api_key}",
-                "Content-Type": "application/json"
-            }
-            headers.update(model_config.custom_headers)
-            
-            # 使用urllib进行同步HTTP请求
-            request_data = json.dumps(payload).encode('utf-8')
-            req = urllib.request.Request(
-                model_config.base_url,
-                data=request_data,
-                headers=headers
+            # 统一响应格式（千问格式，其余按OpenAI兼容格式）
+            embeddings = await self._with_retry(
+                self._post_json,
+                model_config.base_url, payload, self._request_headers(model_config), timeout=120,
+                decode=partial(_decode_embeddings, provider)
             )
+            if slot is not None:
+                self._stat_success[slot] += 1
             
-            try:
-                with urllib.request.urlopen(req, timeout=120) as response:
-                    if response.status == 200:
-                        result_data = response.read().decode('utf-8')
-                        result = json.loads(result_data)
-                        if provider in self.api_stats:
-                            self.api_stats[provider]["success"] += 1
-                        
-                        # 统一响应格式
-                        if provider == "qwen":
-                            embeddings = [item["embedding"] for item in result["output"]["embeddings"]]
-                        elif provider == "openai":
-                            embeddings = [item["embedding"] for item in result["data"]]
-                        else:
-                            # 通用格式，假设和OpenAI兼容
-                            embeddings = [item["embedding"] for item in result["data"]]
-                        
-                        return {
-                            "embeddings": embeddings,
-                            "provider": provider,
-                            "model": model_config.model_id,
-                            "embedding_count": len(embeddings),
-                            "success": True
-                        }
-                    else:
-                        error_text = response.read().decode('utf-8')
-                        raise Exception(f"API返回错误 {response.status}: {error_text}")
-            except urllib.error.HTTPError as e:
-                error_text = e.read().decode('utf-8') if hasattr(e, 'read') else str(e)
-                raise Exception(f"HTTP错误 {e.code}: {error_text}")
-            except urllib.error.URLError as e:
-                raise Exception(f"网络错误: {e.reason}")
+            return {
+                "embeddings": embeddings,
+                "provider": provider,
+                "model": model_config.model_id,
+                "embedding_count": len(embeddings),
+                "success": True
+            }
                         
         except Exception as e:
-            if provider in self.api_stats:
-                self.api_stats[provider]["errors"] += 1
+            if slot is not None:
+                self._stat_errors[slot] += 1
             print(f"❌ {provider} 嵌入API调用失败: {e}")
             raise
     
@@ -345,55 +987,32 @@ class UnifiedAPIManager:
         Returns:
             切分后的文本块列表
         """
+        # 一块即可容纳时无需切分
+        if len(text) <= max_chunk_size:
+            stripped = text.strip()
+            return [stripped] if len(stripped) > 10 else []
         
-        # 构建领域特定的切分提示
-        domain_prompts = {
-            "credit_research": """
-请将以下征信研究文本按照语义完整性进行智能切分，要求：
-
-1. 保持语义完整性，不在句子中间切断
-2. 每个文本块保持主题一致性
-3. 优先在段落、标题、列表等结构性标记处切分
-4. 每块大小控制在{max_chunk_size}字符以内
-5. 保留重要的上下文信息
-
-请返回JSON格式的切分结果，格式为：
-{{"chunks": ["文本块1", "文本块2", ...]}}
-
-待切分文本：
-{text}
-""",
-            "general": """
-请将以下文本进行智能切分，每块不超过{max_chunk_size}字符，
-保持语义完整性，返回JSON格式：{{"chunks": ["文本块1", "文本块2", ...]}}
-
-文本：
-{text}
-"""
-        }
-        
-        prompt_template = domain_prompts.get(domain, domain_prompts["general"])
-        prompt = prompt_template.format(max_chunk_size=max_chunk_size, text=text)
+        # 较短文本先按句子本地切分：每块都不超长、且拼接后与原文一致（没有丢弃短句或补出句号，
+        # 块边界的空白除外）时直接使用，省去一次LLM调用
+        if len(text) < 2 * max_chunk_size:
+            chunks = self._fallback_segmentation(text, max_chunk_size)
+            if (chunks and all(len(chunk) <= max_chunk_size for chunk in chunks)
+                    and _WHITESPACE_RE.sub("", "".join(chunks)) == _WHITESPACE_RE.sub("", text)):
+                return chunks
         
+        prompt_template = _DOMAIN_PROMPTS.get(domain, _DOMAIN_PROMPTS["general"])
         messages = [
-            {
-                "role": "system",
-                "content": "你是一个专业的文本切分助手，擅长按照语义完整性进行文本切分。请严格按照要求返回JSON格式的结果。"
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
+            _SEGMENTATION_SYSTEM_MESSAGE,
+            {"role": "user", "content": prompt_template.format(max_chunk_size=max_chunk_size, text=text)}
         ]
         
         try:
-            result = await self.chat_completion(messages, provider, temperature=0.1)
+            result = await self.chat_completion(messages, provider, _SEGMENTATION_CHAT_PARAMS)
             
             # 解析JSON结果
-            import re
-            json_match = re.search(r'\{.*"chunks".*\}', result["content"], re.DOTALL)
+            json_match = _CHUNKS_RE.search(result["content"])
             if json_match:
-                chunks_data = json.loads(json_match.group())
+                chunks_data = _loads(json_match.group())
                 chunks = chunks_data.get("chunks", [])
                 
                 # 验证和清理切分结果
@@ -414,21 +1033,29 @@ class UnifiedAPIManager:
     def _fallback_segmentation(self, text: str, max_chunk_size: int) -> List[str]:
         """备用切分方法"""
         chunks = []
+        current = []      # 当前块的句子
+        current_len = 0   # 当前块长度（含句号）
+        
+        # 以句号结尾的文本切分后末尾是空串，不再为它补出一个多余的句号
         sentences = text.split('。')
-        current_chunk = ""
+        if len(sentences) > 1 and not sentences[-1].strip():
+            sentences.pop()
         
+        # 只累计长度，块结束时一次性拼接，避免反复拼接字符串
         for sentence in sentences:
-            if len(current_chunk + sentence) <= max_chunk_size:
-                current_chunk += sentence + "。"
+            if current_len + len(sentence) <= max_chunk_size:
+                current.append(sentence)
+                current_len += len(sentence) + 1
             else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + "。"
+                if current:
+                    chunks.append(("。".join(current) + "。").strip())
+                current = [sentence]
+                current_len = len(sentence) + 1
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        if current:
+            chunks.append(("。".join(current) + "。").strip())
         
-        return [chunk for chunk in chunks if len(chunk.strip()) > 10]
+        return [chunk for chunk in chunks if len(chunk) > 10]
     
     def switch_provider(self, provider: ModelProvider) -> Dict[str, Any]:
         """
@@ -447,6 +1074,7 @@ class UnifiedAPIManager:
         
         self.current_provider = provider
         self.consistency_hash = self._generate_consistency_hash()
+        self.invalidate_model_cache()
         
         logger.info(f"API提供商已从 {old_provider.value} 切换到 {provider.value}")
         
@@ -457,6 +1085,18 @@ class UnifiedAPIManager:
             "switch_time": datetime.now().isoformat()
         }
     
+    @property
+    def api_stats(self) -> Dict[str, Dict[str, int]]:
+        """各提供商的调用计数 {提供商: {"calls", "success", "errors"}}（读取时生成）"""
+        return {
+            provider: {
+                "calls": self._stat_calls[slot],
+                "success": self._stat_success[slot],
+                "errors": self._stat_errors[slot]
+            }
+            for provider, slot in self._stat_index.items()
+        }
+    
     def get_api_statistics(self) -> Dict[str, Any]:
         """获取API调用统计"""
         stats = {}
@@ -464,7 +1104,7 @@ class UnifiedAPIManager:
             total_calls = data["calls"]
             success_rate = (data["success"] / total_calls * 100) if total_calls > 0 else 0
             
-            stats[provider.value] = {
+            stats[provider] = {
                 "total_calls": total_calls,
                 "successful_calls": data["success"],
                 "failed_calls": data["errors"],
@@ -478,33 +1118,27 @@ class UnifiedAPIManager:
             "generated_at": datetime.now().isoformat()
         }
     
-    async def health_check(self) -> Dict[str, Any]:
-        """健康检查"""
-        health_status = {
-            "qwen": {"available": False, "response_time": None, "error": None},
-            "deepseek": {"available": False, "response_time": None, "error": None}
-        }
-        
-        # 测试千问API
+    async def _probe(self, provider: ModelProvider) -> Dict[str, Any]:
+        """探测单个提供商的聊天接口"""
         try:
             start_time = datetime.now()
-            await self.chat_completion([{"role": "user", "content": "Hello"}], ModelProvider.QWEN)
+            await self.chat_completion([{"role": "user", "content": "Hello"}], provider)
             response_time = (datetime.now() - start_time).total_seconds()
-            health_status["qwen"] = {"available": True, "response_time": response_time, "error": None}
+            return {"available": True, "response_time": response_time, "error": None}
         except Exception as e:
-            health_status["qwen"]["error"] = str(e)
-        
-        # 测试DeepSeek API（如果配置了）
+            return {"available": False, "response_time": None, "error": str(e)}
+    
+    async def health_check(self) -> Dict[str, Any]:
+        """健康检查"""
+        # 千问和DeepSeek（如果配置了）的探测并行执行
+        probes = {"qwen": self._probe(ModelProvider.QWEN)}
         if self.deepseek_api_key:
-            try:
-                start_time = datetime.now()
-                await self.chat_completion([{"role": "user", "content": "Hello"}], ModelProvider.DEEPSEEK)
-                response_time = (datetime.now() - start_time).total_seconds()
-                health_status["deepseek"] = {"available": True, "response_time": response_time, "error": None}
-            except Exception as e:
-                health_status["deepseek"]["error"] = str(e)
-        else:
-            health_status["deepseek"]["error"] = "API密钥未配置"
+            probes["deepseek"] = self._probe(ModelProvider.DEEPSEEK)
+        results = await asyncio.gather(*probes.values())
+        
+        health_status = dict(zip(probes.keys(), results))
+        if "deepseek" not in health_status:
+            health_status["deepseek"] = {"available": False, "response_time": None, "error": "API密钥未配置"}
         
         return {
             "current_provider": self.current_provider.value,
@@ -566,4 +1200,6 @@ if __name__ == "__main__":
     print("实际使用时请配置真实的API密钥")
     print()
     
+    if use_uvloop():
+        print("⚡ 已启用uvloop事件循环")
     # asyncio.run(demo_unified_api())
\ No newline at end of file
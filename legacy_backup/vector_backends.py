@@ -0,0 +1,266 @@
+"""
+向量检索后端
+按语料规模选择暴力NumPy检索、int8量化检索或FAISS近似检索，输入输出均为归一化向量的余弦相似度
+"""
+
+import os
+import tempfile
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+    _FAISS_AVAILABLE = True
+except ImportError:
+    _FAISS_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+# 语料规模阈值：超过INT8_MIN_VECTORS后语料以int8量化常驻内存，
+# 超过FAISS_MIN_VECTORS后（且安装了faiss）改用IVF-PQ近似检索
+INT8_MIN_VECTORS = 1_000_000
+FAISS_MIN_VECTORS = 5_000_000
+FAISS_INDEX_PATH = "data/corpus_faiss.index"
+FAISS_TRAIN_SAMPLE = 100_000
+FAISS_NPROBE = 16
+
+
+if _NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _merge_topk(sims, start, out_idx, out_sim, worst):
+        """编译后的top-k合并内核：单次扫描相似度块，原地更新每个查询的top-k（无序）"""
+        k = out_sim.shape[1]
+        for i in prange(sims.shape[0]):
+            w = worst[i]
+            wv = out_sim[i, w]
+            for j in range(sims.shape[1]):
+                s = sims[i, j]
+                if s > wv:
+                    out_sim[i, w] = s
+                    out_idx[i, w] = start + j
+                    # 重新定位当前最小值的位置
+                    w = 0
+                    wv = out_sim[i, 0]
+                    for t in range(1, k):
+                        if out_sim[i, t] < wv:
+                            w = t
+                            wv = out_sim[i, t]
+            worst[i] = w
+
+
+class VectorBackend:
+    """向量检索后端接口"""
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索每个查询向量最相似的k个语料向量
+
+        Args:
+            queries: 归一化后的查询矩阵 (n_queries, dim)
+            k: 每个查询返回的数量
+
+        Returns:
+            (索引矩阵, 相似度矩阵)，形状均为 (n_queries, k)，按相似度降序
+        """
+        raise NotImplementedError
+
+
+def save_npy_atomic(path: str, array: np.ndarray):
+    """先写同目录下的唯一临时文件再替换，其他进程不会读到不完整的文件"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp.npy", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def quantize_int8(matrix: np.ndarray, block_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按行对称量化为int8
+
+    Returns:
+        (int8矩阵, 每行缩放系数)，满足 matrix ≈ quantized * scales[:, None]
+    """
+    n, dim = matrix.shape
+    quantized = np.empty((n, dim), dtype=np.int8)
+    scales = np.empty(n, dtype=np.float32)
+
+    # 分块量化，避免对内存映射的语料一次性生成float32临时矩阵
+    for start in range(0, n, block_size):
+        block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+        block_scales = np.abs(block).max(axis=1) / 127.0
+        block_scales[block_scales == 0] = 1.0
+        quantized[start:start + block.shape[0]] = np.rint(block / block_scales[:, None])
+        scales[start:start + block.shape[0]] = block_scales
+
+    return quantized, scales
+
+
+class NumpyBackend(VectorBackend):
+    """暴力矩阵乘法检索，按块遍历语料以限制峰值内存"""
+
+    def __init__(self, corpus_norm: np.ndarray, block_size: int = 65536):
+        self.corpus_norm = corpus_norm
+        self.block_size = block_size
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.corpus_norm.shape[0])
+        if _NUMBA_AVAILABLE:
+            best_idx, best_sim = self._search_compiled(queries, k)
+        else:
+            best_idx, best_sim = self._search_argpartition(queries, k)
+
+        order = np.argsort(-best_sim, axis=1)
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
+
+    def _search_compiled(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """矩阵乘法后由编译内核单次扫描合并top-k，不生成中间拼接数组"""
+        n_queries = queries.shape[0]
+        best_idx = np.full((n_queries, k), -1, dtype=np.int64)
+        best_sim = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        worst = np.zeros(n_queries, dtype=np.int64)
+
+        for start in range(0, self.corpus_norm.shape[0], self.block_size):
+            sims = self._block_similarity(queries, start, start + self.block_size)
+            _merge_topk(np.asarray(sims, dtype=np.float32), start, best_idx, best_sim, worst)
+
+        return best_idx, best_sim
+
+    def _search_argpartition(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """逐块argpartition后与已有结果拼接再取top-k（未安装numba时使用）"""
+        best_idx = np.empty((queries.shape[0], 0), dtype=np.int64)
+        best_sim = np.empty((queries.shape[0], 0), dtype=np.float32)
+
+        for start in range(0, self.corpus_norm.shape[0], self.block_size):
+            sims = self._block_similarity(queries, start, start + self.block_size)
+
+            # 当前块的top-k与已有结果合并后再取top-k
+            kb = min(k, sims.shape[1])
+            part = np.argpartition(-sims, kb - 1, axis=1)[:, :kb]
+            best_sim = np.concatenate([best_sim, np.take_along_axis(sims, part, axis=1)], axis=1)
+            best_idx = np.concatenate([best_idx, part + start], axis=1)
+
+            if best_sim.shape[1] > k:
+                keep = np.argpartition(-best_sim, k - 1, axis=1)[:, :k]
+                best_sim = np.take_along_axis(best_sim, keep, axis=1)
+                best_idx = np.take_along_axis(best_idx, keep, axis=1)
+
+        return best_idx, best_sim
+
+    def _block_similarity(self, queries: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """查询向量与语料[start:stop]的相似度矩阵"""
+        return queries @ self.corpus_norm[start:stop].T
+
+
+class Int8Backend(NumpyBackend):
+    """
+    语料按行量化为int8（约为float32的1/4），查询保持float32
+
+    传入cache_stem时量化结果保存为 cache_stem.i8.npy / cache_stem.scales.npy，
+    之后直接内存映射加载，不再重新量化整个语料
+    """
+
+    def __init__(self, corpus_norm: np.ndarray, block_size: int = 65536, cache_stem: Optional[str] = None):
+        n, dim = corpus_norm.shape
+        loaded = self._load_quantized(cache_stem, n, dim) if cache_stem else None
+        if loaded is None:
+            corpus_i8, scales = quantize_int8(corpus_norm, block_size)
+            if cache_stem:
+                save_npy_atomic(cache_stem + ".i8.npy", corpus_i8)
+                save_npy_atomic(cache_stem + ".scales.npy", scales)
+        else:
+            corpus_i8, scales = loaded
+        super().__init__(corpus_i8, block_size)
+        self.scales = scales
+
+    @staticmethod
+    def _load_quantized(cache_stem: str, n: int, dim: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """内存映射加载已保存的量化结果，文件缺失或形状不符时返回None"""
+        try:
+            corpus_i8 = np.load(cache_stem + ".i8.npy", mmap_mode="r")
+            scales = np.load(cache_stem + ".scales.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if corpus_i8.shape != (n, dim) or corpus_i8.dtype != np.int8 or scales.shape != (n,):
+            return None
+        return corpus_i8, scales
+
+    def _block_similarity(self, queries: np.ndarray, start: int, stop: int) -> np.ndarray:
+        # 逐块反量化为float32后走BLAS矩阵乘法，再乘以每行缩放系数
+        block = self.corpus_norm[start:stop].astype(np.float32)
+        return (queries @ block.T) * self.scales[start:stop]
+
+
+class FaissBackend(VectorBackend):
+    """
+    FAISS IVF-PQ 近似检索（内积即余弦相似度），索引训练一次后持久化
+
+    已有索引只校验条数和维度，调用方应传入随语料条数与写入序号命名的index_path，语料变化后不会误用旧索引
+    """
+
+    def __init__(self, corpus_norm: np.ndarray, index_path: str = FAISS_INDEX_PATH):
+        n, dim = corpus_norm.shape
+        self.index = None
+
+        if os.path.exists(index_path):
+            index = faiss.read_index(index_path)
+            if index.ntotal == n and index.d == dim:
+                self.index = index
+
+        if self.index is None:
+            nlist = max(1, min(1024, n // 39))
+            pq = f"PQ{48 if dim % 48 == 0 else 16}" if dim % 16 == 0 else "Flat"
+            self.index = faiss.index_factory(dim, f"IVF{nlist},{pq}", faiss.METRIC_INNER_PRODUCT)
+
+            rng = np.random.default_rng(0)
+            sample = corpus_norm[np.sort(rng.choice(n, size=min(n, FAISS_TRAIN_SAMPLE), replace=False))]
+            self.index.train(np.ascontiguousarray(sample, dtype=np.float32))
+            for start in range(0, n, FAISS_TRAIN_SAMPLE):
+                self.index.add(np.ascontiguousarray(corpus_norm[start:start + FAISS_TRAIN_SAMPLE], dtype=np.float32))
+
+            # 先写同目录下的唯一临时文件再替换，多个进程同时构建时互不覆盖半成品
+            directory = os.path.dirname(index_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp.index", dir=directory)
+            os.close(fd)
+            try:
+                faiss.write_index(self.index, tmp_path)
+                os.replace(tmp_path, index_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        faiss.extract_index_ivf(self.index).nprobe = FAISS_NPROBE
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sims, idx = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return idx, sims
+
+
+def select_backend(corpus_norm: Optional[np.ndarray],
+                   cache_stem: Optional[str] = None) -> Optional[VectorBackend]:
+    """
+    按语料规模选择检索后端
+
+    Args:
+        corpus_norm: 归一化后的语料矩阵
+        cache_stem: 语料缓存文件路径（不含扩展名），FAISS索引（.faiss）与int8量化结果与之同名保存；
+                    None时FAISS索引使用FAISS_INDEX_PATH，int8量化结果不落盘
+    """
+    if corpus_norm is None or corpus_norm.shape[0] == 0:
+        return None
+    if _FAISS_AVAILABLE and corpus_norm.shape[0] > FAISS_MIN_VECTORS:
+        return FaissBackend(corpus_norm, cache_stem + ".faiss" if cache_stem else FAISS_INDEX_PATH)
+    if corpus_norm.shape[0] > INT8_MIN_VECTORS:
+        return Int8Backend(corpus_norm, cache_stem=cache_stem)
+    return NumpyBackend(corpus_norm)
@@ -9,7 +9,10 @@
 import asyncio
 import json
 import hashlib
+import itertools
+import os
 import shutil
+import time
 import numpy as np
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
@@ -19,13 +22,239 @@ from enum import Enum
 import logging
 
 from .model_consistency_manager import consistency_manager, ModelConfig
-from .unified_api_manager import UnifiedAPIManager, ModelProvider
+from .unified_api_manager import UnifiedAPIManager
 from .progress_manager import ProgressManager, TaskType
+from .vector_backends import quantize_int8
+from .vector_ops import dot_matrix, warmup as warmup_vector_ops
+
+# JSON读写：安装orjson时使用（解析与序列化均快数倍），否则使用标准库
+try:
+    import orjson
+    
+    def _read_json(path: Path) -> Any:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    
+    def _write_json(path: Path, data: Any, indent: bool = False):
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0))
+except ImportError:
+    def _read_json(path: Path) -> Any:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _write_json(path: Path, data: Any, indent: bool = False):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2 if indent else None, ensure_ascii=False)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 列式存储的初始容量（行数），写满后按2倍扩容
+STORE_INITIAL_CAPACITY = 1024
+_OFFSETS_FILES = {"ids": "id_offsets.npy", "texts": "text_offsets.npy"}
+# 向量落盘格式：float16 体积为float32的一半；int8 按行对称量化，另存每行缩放系数
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# 完全重建迁移：每次嵌入请求的文本数与同时在途的请求数
+REBUILD_BATCH_SIZE = 64
+REBUILD_CONCURRENCY = 8
+
+# 并行构建迁移：每组文本数与工作协程数（即同时在途的请求数上限）
+PARALLEL_BATCH_SIZE = 32
+PARALLEL_WORKERS = 8
+
+
+class _ColumnarStore:
+    """
+    单个版本目录下的列式向量存储，所有批次追加到同一组文件中：
+    
+    vectors.npy       (容量, 维度) 向量矩阵（float32/float16/int8），内存映射写入
+    scales.npy        (容量,) int8存储时每行的缩放系数
+    created_at.npy    (容量,) 写入时间戳（秒）
+    ids.bin / texts.bin                 text_id 与文本内容的UTF-8字节串
+    id_offsets.npy / text_offsets.npy   (容量+1,) 每条记录在对应 .bin 中的起始偏移
+    store.json        描述信息：条数、容量、维度、存储类型、各批次元数据（每次追加后原子替换）
+    
+    文件只追加：同一text_id再次写入时追加新行，读取和评分时只取每个text_id最后写入的一行
+    （顺序为text_id首次写入的顺序，与内存中 VersionStore 原地覆盖的结果一致）
+    """
+    
+    def __init__(self, version_dir: Path, dtype: str = "float32"):
+        self.dir = version_dir
+        descriptor_file = version_dir / "store.json"
+        if descriptor_file.exists():
+            self.descriptor = _read_json(descriptor_file)
+            self.descriptor.setdefault("dtype", "float32")  # 早期存储均为float32
+        else:
+            self.descriptor = {"count": 0, "capacity": 0, "dimension": None, "dtype": dtype, "batches": []}
+        # 有效行号缓存（按计算时的条数失效）
+        self._live_rows: Optional[np.ndarray] = None
+        self._live_rows_count = 0
+    
+    @property
+    def dtype(self) -> str:
+        return self.descriptor["dtype"]
+    
+    def __len__(self) -> int:
+        """已写入的行数（含被覆盖的旧行）"""
+        return self.descriptor["count"]
+    
+    def live_rows(self) -> Optional[np.ndarray]:
+        """每个text_id最后写入的行号（按text_id首次写入的顺序），没有重复写入时返回None"""
+        count = self.descriptor["count"]
+        if self._live_rows_count != count:
+            latest: Dict[str, int] = {}
+            for row, text_id in enumerate(self._read_strings("ids", count)):
+                latest[text_id] = row  # 覆盖取值但保留首次插入的位置
+            self._live_rows = (None if len(latest) == count
+                               else np.fromiter(latest.values(), dtype=np.int64, count=len(latest)))
+            self._live_rows_count = count
+        return self._live_rows
+    
+    def append(self, text_ids: List[str], texts: List[str], vectors: np.ndarray,
+               metadata: Dict[str, Any], created_at: int):
+        """追加一批记录"""
+        count = self.descriptor["count"]
+        k = len(text_ids)
+        if k == 0:
+            return
+        
+        dimension = self.descriptor["dimension"]
+        if dimension is None:
+            dimension = vectors.shape[1]
+        elif vectors.shape[1] != dimension:
+            raise ValueError(f"向量维度不匹配: {vectors.shape[1]} != {dimension}")
+        
+        self._ensure_capacity(count + k, dimension)
+        
+        if self.dtype == "int8":
+            vectors, scales = quantize_int8(vectors)
+            column = np.lib.format.open_memmap(self.dir / "scales.npy", mode='r+')
+            column[count:count + k] = scales
+            column.flush()
+            del column
+        
+        # 赋值时按存储类型转换（float16 直接截断精度）
+        matrix = np.lib.format.open_memmap(self.dir / "vectors.npy", mode='r+')
+        matrix[count:count + k] = vectors
+        matrix.flush()
+        del matrix
+        
+        created = np.lib.format.open_memmap(self.dir / "created_at.npy", mode='r+')
+        created[count:count + k] = created_at
+        created.flush()
+        del created
+        
+        self._append_strings("ids", text_ids, count)
+        self._append_strings("texts", texts, count)
+        
+        self.descriptor["count"] = count + k
+        self.descriptor["dimension"] = dimension
+        self.descriptor["batches"].append({"start": count, "count": k, "metadata": metadata})
+        self._write_descriptor()
+    
+    def load(self) -> Tuple[List[str], List[str], np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+        """
+        读取全部有效记录（每个text_id取最后写入的一行）
+        
+        Returns:
+            (text_id列表, 文本列表, float32向量矩阵, 写入时间戳, 批次元数据列表)
+            float32存储且没有重复写入时向量矩阵为只读内存映射，其余情况为新数组；
+            批次元数据中的行号指原始行
+        """
+        count = self.descriptor["count"]
+        if count == 0:
+            vectors = np.empty((0, self.descriptor["dimension"] or 0), dtype=np.float32)
+            return [], [], vectors, np.empty(0, dtype=np.int64), []
+        
+        matrix, scales = self.load_matrix()
+        created_at = np.load(self.dir / "created_at.npy")[:count]
+        text_ids = self._read_strings("ids", count)
+        texts = self._read_strings("texts", count)
+        
+        rows = self.live_rows()
+        if rows is not None:
+            matrix = matrix[rows]
+            scales = scales[rows] if scales is not None else None
+            created_at = created_at[rows]
+            row_list = rows.tolist()
+            text_ids = [text_ids[row] for row in row_list]
+            texts = [texts[row] for row in row_list]
+        
+        vectors = np.asarray(matrix, dtype=np.float32)
+        if scales is not None:
+            vectors *= scales[:, None]
+        return text_ids, texts, vectors, created_at, self.descriptor["batches"]
+    
+    def load_matrix(self) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """按存储类型读取全部原始行的向量矩阵（只读内存映射，含被覆盖的旧行），int8存储时同时返回每行缩放系数"""
+        count = self.descriptor["count"]
+        matrix = np.load(self.dir / "vectors.npy", mmap_mode='r')[:count]
+        scales = None
+        if self.dtype == "int8":
+            scales = np.load(self.dir / "scales.npy")[:count]
+        return matrix, scales
+    
+    def _ensure_capacity(self, rows: int, dimension: int):
+        """容量不足时按2倍扩容：新建更大的文件、复制已有数据后原子替换"""
+        capacity = self.descriptor["capacity"]
+        if rows <= capacity:
+            return
+        new_capacity = max(STORE_INITIAL_CAPACITY, capacity * 2, rows)
+        count = self.descriptor["count"]
+        
+        columns = [
+            ("vectors.npy", np.dtype(self.dtype), (new_capacity, dimension)),
+            ("created_at.npy", np.int64, (new_capacity,)),
+            ("id_offsets.npy", np.uint64, (new_capacity + 1,)),
+            ("text_offsets.npy", np.uint64, (new_capacity + 1,)),
+        ]
+        if self.dtype == "int8":
+            columns.append(("scales.npy", np.float32, (new_capacity,)))
+        for name, dtype, shape in columns:
+            path = self.dir / name
+            tmp_path = self.dir / f"{name}.tmp"
+            column = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+            if capacity:
+                old = np.load(path, mmap_mode='r')
+                keep = count + 1 if name in _OFFSETS_FILES.values() else count
+                column[:keep] = old[:keep]
+                del old
+            column.flush()
+            del column
+            os.replace(tmp_path, path)
+        
+        self.descriptor["capacity"] = new_capacity
+    
+    def _append_strings(self, column: str, values: List[str], count: int):
+        """把字符串追加到 .bin 文件并写入偏移（从已提交的末尾写起，覆盖未提交的残留数据）"""
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.lib.format.open_memmap(self.dir / _OFFSETS_FILES[column], mode='r+')
+        end = int(offsets[count])
+        offsets[count + 1:count + 1 + len(encoded)] = end + np.cumsum([len(b) for b in encoded], dtype=np.uint64)
+        offsets.flush()
+        del offsets
+        
+        blob_path = self.dir / f"{column}.bin"
+        with open(blob_path, 'r+b' if blob_path.exists() else 'w+b') as f:
+            f.seek(end)
+            f.write(b"".join(encoded))
+            f.truncate()
+    
+    def _read_strings(self, column: str, count: int) -> List[str]:
+        offsets = np.load(self.dir / _OFFSETS_FILES[column], mmap_mode='r')[:count + 1]
+        with open(self.dir / f"{column}.bin", 'rb') as f:
+            blob = f.read(int(offsets[count]))
+        bounds = offsets.tolist()
+        return [blob[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(count)]
+    
+    def _write_descriptor(self):
+        tmp_path = self.dir / "store.json.tmp"
+        _write_json(tmp_path, self.descriptor)
+        os.replace(tmp_path, self.dir / "store.json")
+
 class MigrationStrategy(Enum):
     """迁移策略"""
     FULL_REBUILD = "full_rebuild"       # 完全重建
@@ -53,17 +282,102 @@ class ModelVersion:
     deprecated_at: Optional[str] = None
     migration_path: Optional[str] = None
     compatibility_score: float = 1.0
+    storage_dtype: str = "float16"  # 向量落盘格式，见 STORAGE_DTYPES
 
 @dataclass
 class VectorData:
     """向量数据"""
     text_id: str
     text_content: str
-    vector: List[float]
+    vector: np.ndarray  # VersionStore 中对应矩阵行的视图
     model_version: str
     created_at: str
     metadata: Dict[str, Any]
 
+class VersionStore:
+    """
+    单个版本的内存向量存储（结构数组）：向量保存在一个连续矩阵中，
+    text_id、文本、写入时间和元数据按行号并列保存
+    """
+    
+    def __init__(self, dimension: int, dtype=np.float16):
+        self._buffer = np.empty((0, dimension), dtype=dtype)
+        self._count = 0
+        self.text_ids: List[str] = []
+        self.texts: List[str] = []
+        self.created_at: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.id_to_row: Dict[str, int] = {}
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """(N, 维度) 向量矩阵（内部缓冲区的视图）"""
+        return self._buffer[:self._count]
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __contains__(self, text_id: str) -> bool:
+        return text_id in self.id_to_row
+    
+    def add(self, text_ids: List[str], texts: List[str], vectors: np.ndarray,
+            created_at: str, metadata: Any):
+        """
+        批量写入记录，已存在的text_id原地覆盖
+        
+        Args:
+            metadata: 整批共用的元数据dict，或与text_ids等长的元数据列表
+        """
+        vectors = np.asarray(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self._buffer.shape[1]:
+            raise ValueError(f"向量维度不匹配: {vectors.shape[1:]} != {self._buffer.shape[1]}")
+        per_row_metadata = isinstance(metadata, list)
+        
+        for i, text_id in enumerate(text_ids):
+            row = self.id_to_row.get(text_id)
+            row_metadata = metadata[i] if per_row_metadata else metadata
+            if row is None:
+                row = self._append_row()
+                self.id_to_row[text_id] = row
+                self.text_ids.append(text_id)
+                self.texts.append(texts[i])
+                self.created_at.append(created_at)
+                self.metadata.append(row_metadata)
+            else:
+                self.texts[row] = texts[i]
+                self.created_at[row] = created_at
+                self.metadata[row] = row_metadata
+            self._buffer[row] = vectors[i]
+    
+    def _append_row(self) -> int:
+        """占用下一行，容量不足时按2倍扩容（均摊O(1)）"""
+        if self._count == self._buffer.shape[0]:
+            grown = np.empty((max(16, self._count * 2), self._buffer.shape[1]), dtype=self._buffer.dtype)
+            grown[:self._count] = self._buffer[:self._count]
+            self._buffer = grown
+        self._count += 1
+        return self._count - 1
+    
+    def _record(self, row: int, version_id: str) -> VectorData:
+        return VectorData(
+            text_id=self.text_ids[row],
+            text_content=self.texts[row],
+            vector=self._buffer[row],
+            model_version=version_id,
+            created_at=self.created_at[row],
+            metadata=self.metadata[row]
+        )
+    
+    def get(self, text_id: str, version_id: str = "") -> Optional[VectorData]:
+        """按text_id构造记录（向量为矩阵行的视图）"""
+        row = self.id_to_row.get(text_id)
+        return None if row is None else self._record(row, version_id)
+    
+    def items(self, version_id: str = ""):
+        """按行顺序产出 (text_id, VectorData)，兼容原先的 dict 接口"""
+        for row in range(self._count):
+            yield self.text_ids[row], self._record(row, version_id)
+
 @dataclass
 class MigrationTask:
     """迁移任务"""
@@ -81,28 +395,43 @@ class MigrationTask:
 class VectorModelVersioning:
     """向量模型版本管理器"""
     
-    def __init__(self, storage_path: str = "vector_versions"):
+    def __init__(self, storage_path: str = "vector_versions", warmup_kernels: bool = True):
+        """
+        Args:
+            storage_path: 版本数据目录
+            warmup_kernels: 构造时预编译点积内核（模块级实例不预编译，首次调用 dot_scores 时再编译）
+        """
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
         
         self.model_versions: Dict[str, ModelVersion] = {}
-        self.vector_storage: Dict[str, Dict[str, VectorData]] = {}  # version_id -> {text_id -> VectorData}
+        self.vector_storage: Dict[str, VersionStore] = {}  # version_id -> 内存向量存储
         self.migration_tasks: List[MigrationTask] = []
         self.progress_manager = ProgressManager()
+        self._stores: Dict[str, _ColumnarStore] = {}  # version_id -> 列式存储
+        self._storage_size_cache: Dict[str, Tuple[int, float]] = {}  # version_id -> (目录修改时间, MB)
+        # (提供商, 模型, API版本, 维度) -> version_id，已注册的版本（含旧的SHA-256 ID）直接复用
+        self._version_index: Dict[Tuple[str, str, str, int], str] = {}
         
         # 加载现有版本
         self._load_versions()
+        
+        # 预编译点积内核，避免首次检索时的编译延迟
+        if warmup_kernels:
+            warmup_vector_ops()
     
     def _load_versions(self):
         """加载现有版本信息"""
         versions_file = self.storage_path / "versions.json"
         if versions_file.exists():
             try:
-                with open(versions_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = _read_json(versions_file)
                 
                 for version_id, version_data in data.items():
-                    self.model_versions[version_id] = ModelVersion(**version_data)
+                    version = ModelVersion(**version_data)
+                    self.model_versions[version_id] = version
+                    self._version_index[(version.provider, version.model_name,
+                                         version.api_version, version.dimension)] = version_id
                 
                 logger.info(f"📖 加载了 {len(self.model_versions)} 个模型版本")
             except Exception as e:
@@ -113,21 +442,29 @@ class VectorModelVersioning:
         versions_file = self.storage_path / "versions.json"
         try:
             data = {vid: asdict(version) for vid, version in self.model_versions.items()}
-            with open(versions_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            _write_json(versions_file, data, indent=True)
             logger.info(f"💾 保存了 {len(self.model_versions)} 个模型版本")
         except Exception as e:
             logger.error(f"❌ 保存版本信息失败: {e}")
     
     def register_model_version(self, provider: str, model_name: str, 
                              api_version: str = "v1", dimension: int = 1536,
-                             compatibility_score: float = 1.0) -> str:
+                             compatibility_score: float = 1.0,
+                             storage_dtype: str = "float16") -> str:
         """注册新的模型版本"""
-        # 生成版本ID
-        version_content = f"{provider}:{model_name}:{api_version}:{dimension}"
-        version_id = hashlib.sha256(version_content.encode()).hexdigest()[:16]
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError(f"不支持的向量存储类型: {storage_dtype}")
         
-        if version_id not in self.model_versions:
+        # 已注册的版本直接返回原ID（早期版本的ID为SHA-256前缀，保持不变）
+        key = (provider, model_name, api_version, dimension)
+        version_id = self._version_index.get(key)
+        
+        if version_id is None:
+            # 生成版本ID（仅作标识，用8字节BLAKE2b即可）
+            version_content = f"{provider}:{model_name}:{api_version}:{dimension}"
+            version_id = hashlib.blake2b(version_content.encode(), digest_size=8).hexdigest()
+            self._version_index[key] = version_id
+            
             model_version = ModelVersion(
                 version_id=version_id,
                 provider=provider,
@@ -135,11 +472,11 @@ class VectorModelVersioning:
                 api_version=api_version,
                 dimension=dimension,
                 created_at=datetime.now().isoformat(),
-                compatibility_score=compatibility_score
+                compatibility_score=compatibility_score,
+                storage_dtype=storage_dtype
             )
             
             self.model_versions[version_id] = model_version
-            self.vector_storage[version_id] = {}
             
             # 创建版本目录
             version_dir = self.storage_path / version_id
@@ -159,45 +496,73 @@ class VectorModelVersioning:
         if metadata is None:
             metadata = {}
         
+        # 整批共用一个写入时间
+        now = datetime.now()
+        
+        # 持久化存储（先写磁盘，维度不匹配时不会留下内存中的脏数据）
+        self._save_vector_batch(version_id, text_data, metadata, int(now.timestamp()))
+        
         # 存储到内存
-        for text_id, text_content, vector in text_data:
-            vector_data = VectorData(
-                text_id=text_id,
-                text_content=text_content,
-                vector=vector,
-                model_version=version_id,
-                created_at=datetime.now().isoformat(),
-                metadata=metadata
-            )
-            self.vector_storage[version_id][text_id] = vector_data
+        if text_data:
+            text_ids, texts, vectors = zip(*text_data)
+            self._memory_store(version_id).add(text_ids, texts, np.asarray(vectors, dtype=np.float32),
+                                               now.isoformat(), metadata)
         
-        # 持久化存储
-        self._save_vector_batch(version_id, text_data, metadata)
         logger.info(f"💾 存储了 {len(text_data)} 个向量到版本 {version_id}")
     
+    def _memory_store(self, version_id: str) -> VersionStore:
+        """获取（必要时创建）版本的内存向量存储"""
+        store = self.vector_storage.get(version_id)
+        if store is None:
+            version = self.model_versions[version_id]
+            dtype = np.float32 if version.storage_dtype == "float32" else np.float16
+            store = self.vector_storage[version_id] = VersionStore(version.dimension, dtype)
+        return store
+    
+    def _get_store(self, version_id: str) -> _ColumnarStore:
+        """获取版本的列式存储"""
+        store = self._stores.get(version_id)
+        if store is None:
+            version_dir = self.storage_path / version_id
+            version_dir.mkdir(exist_ok=True)
+            store = self._stores[version_id] = _ColumnarStore(
+                version_dir, self.model_versions[version_id].storage_dtype
+            )
+        return store
+    
     def _save_vector_batch(self, version_id: str, text_data: List[Tuple[str, str, List[float]]], 
-                          metadata: Dict[str, Any]):
-        """批量保存向量数据"""
-        version_dir = self.storage_path / version_id
-        
-        # 保存向量到numpy文件
-        vectors = np.array([vector for _, _, vector in text_data])
-        vectors_file = version_dir / f"vectors_{int(datetime.now().timestamp())}.npy"
-        np.save(vectors_file, vectors)
-        
-        # 保存文本和元数据
-        text_data_file = version_dir / f"texts_{int(datetime.now().timestamp())}.json"
-        text_info = [
-            {
-                "text_id": text_id,
-                "text_content": text_content,
-                "metadata": metadata
-            }
-            for text_id, text_content, _ in text_data
-        ]
+                          metadata: Dict[str, Any], created_at: Optional[int] = None):
+        """批量保存向量数据（追加到版本的列式存储），created_at 为整批共用的时间戳（秒）"""
+        if not text_data:
+            return
+        text_ids, texts, vectors = zip(*text_data)
+        self._get_store(version_id).append(
+            list(text_ids), list(texts), np.asarray(vectors, dtype=np.float32),
+            metadata, int(time.time()) if created_at is None else created_at
+        )
+    
+    def load_stored_vectors(self, version_id: str) -> Tuple[List[str], List[str], np.ndarray]:
+        """从磁盘读取版本的全部向量（向量矩阵为只读内存映射）"""
+        text_ids, texts, vectors, _, _ = self._get_store(version_id).load()
+        return text_ids, texts, vectors
+    
+    def dot_scores(self, version_id: str, query: np.ndarray) -> np.ndarray:
+        """
+        计算查询向量与版本中全部已存储向量的点积（向量已归一化时即余弦相似度）
         
-        with open(text_data_file, 'w', encoding='utf-8') as f:
-            json.dump(text_info, f, indent=2, ensure_ascii=False)
+        Returns:
+            (N,) float32 分数，顺序与 load_stored_vectors 返回的记录一致
+        """
+        if version_id not in self.model_versions:
+            raise ValueError(f"模型版本 {version_id} 不存在")
+        store = self._get_store(version_id)
+        if len(store) == 0:
+            return np.empty(0, dtype=np.float32)
+        matrix, scales = store.load_matrix()
+        scores = dot_matrix(matrix, query, scales)
+        # 重复写入的text_id只保留最后一行的分数
+        rows = store.live_rows()
+        return scores if rows is None else scores[rows]
     
     def analyze_migration_requirements(self, from_version: str, to_version: str) -> Dict[str, Any]:
         """分析迁移需求"""
@@ -357,68 +722,56 @@ class VectorModelVersioning:
             return False
     
     async def _execute_full_rebuild(self, task: MigrationTask, api_manager: UnifiedAPIManager) -> bool:
-        """执行完全重建迁移"""
-        from_vectors = self.vector_storage.get(task.from_version, {})
-        to_version = task.to_version
+        """执行完全重建迁移：按批调用嵌入API，有限并发，结果一次性写入目标版本"""
+        items = list(self._memory_store(task.from_version).items(task.from_version))
+        to_model = self.model_versions[task.to_version]
         
-        if to_version not in self.vector_storage:
-            self.vector_storage[to_version] = {}
+        total = len(items)
+        new_vectors = np.empty((total, to_model.dimension), dtype=np.float32)
+        succeeded = np.zeros(total, dtype=bool)
+        semaphore = asyncio.Semaphore(REBUILD_CONCURRENCY)
         
-        processed = 0
-        failed = 0
+        async def _rebuild_batch(start: int):
+            batch = items[start:start + REBUILD_BATCH_SIZE]
+            stop = start + len(batch)
+            async with semaphore:
+                try:
+                    vectors = await self._embed_batch(task, batch, to_model, api_manager)
+                    if vectors is None:
+                        logger.warning(f"⚠️ 向量生成失败: 第 {start}-{stop} 条")
+                        return
+                    new_vectors[start:stop] = vectors
+                    succeeded[start:stop] = True
+                except Exception as e:
+                    logger.error(f"❌ 处理向量批次失败: 第 {start}-{stop} 条 - {e}")
+                finally:
+                    # 按批次更新进度
+                    ok = int(succeeded[start:stop].sum())
+                    task.stats["processed_vectors"] += ok
+                    task.stats["failed_vectors"] += len(batch) - ok
+                    task.progress = (task.stats["processed_vectors"] / total) * 100
         
-        for text_id, vector_data in from_vectors.items():
-            try:
-                # 使用新模型重新生成向量
-                if api_manager:
-                    # 调用API重新生成向量
-                    to_model = self.model_versions[to_version]
-                    # provider = ModelProvider.QWEN if to_model.provider == "qwen" else ModelProvider.DEEPSEEK  # 原代码保留
-                    provider = ModelProvider.QWEN  # 当前专注千问API
-                    
-                    embedding_result = await api_manager.create_embeddings(
-                        texts=[vector_data.text_content],
-                        provider=provider
-                    )
-                    
-                    if embedding_result.get("success"):
-                        new_vector = embedding_result["embeddings"][0]
-                        task.stats["api_calls"] += 1
-                    else:
-                        logger.warning(f"⚠️ 向量生成失败: {text_id}")
-                        failed += 1
-                        continue
-                else:
-                    # 模拟新向量（用于测试）
-                    to_model = self.model_versions[to_version]
-                    new_vector = np.random.random(to_model.dimension).tolist()
-                
-                # 存储新向量
-                new_vector_data = VectorData(
-                    text_id=text_id,
-                    text_content=vector_data.text_content,
-                    vector=new_vector,
-                    model_version=to_version,
-                    created_at=datetime.now().isoformat(),
-                    metadata=vector_data.metadata
-                )
-                
-                self.vector_storage[to_version][text_id] = new_vector_data
-                processed += 1
-                
-                # 更新进度
-                task.progress = (processed / len(from_vectors)) * 100
-                task.stats["processed_vectors"] = processed
-                task.stats["failed_vectors"] = failed
-                
-                # 模拟处理延迟
-                await asyncio.sleep(0.01)
-                
-            except Exception as e:
-                logger.error(f"❌ 处理向量失败: {text_id} - {e}")
-                failed += 1
+        await asyncio.gather(*(_rebuild_batch(start) for start in range(0, total, REBUILD_BATCH_SIZE)))
         
-        return failed == 0
+        # 存储新向量：内存记录 + 一次追加到目标版本的列式存储
+        rows = np.flatnonzero(succeeded)
+        self._store_migrated(task, [items[row] for row in rows], new_vectors[rows])
+        return len(rows) == total
+    
+    def _store_migrated(self, task: MigrationTask, batch: List[Tuple[str, VectorData]], vectors: np.ndarray):
+        """把迁移生成的一批向量写入目标版本（内存 + 列式存储），保留各条记录原有的元数据"""
+        if not batch:
+            return
+        text_ids = [text_id for text_id, _ in batch]
+        texts = [vector_data.text_content for _, vector_data in batch]
+        now = datetime.now()
+        self._memory_store(task.to_version).add(
+            text_ids, texts, vectors, now.isoformat(),
+            [vector_data.metadata for _, vector_data in batch]
+        )
+        self._save_vector_batch(task.to_version, list(zip(text_ids, texts, vectors)),
+                                {"migration_task": task.task_id, "from_version": task.from_version},
+                                int(now.timestamp()))
     
     async def _execute_incremental_migration(self, task: MigrationTask, api_manager: UnifiedAPIManager) -> bool:
         """执行增量迁移"""
@@ -426,44 +779,87 @@ class VectorModelVersioning:
         # 这里简化实现
         return await self._execute_full_rebuild(task, api_manager)
     
+    @staticmethod
+    def _embedding_alias(to_model: ModelVersion, api_manager: UnifiedAPIManager) -> Optional[str]:
+        """在API管理器的注册表中查找目标版本对应的嵌入模型别名，找不到时返回None（使用默认嵌入模型）"""
+        for alias, config in api_manager.model_registry.get_models_by_type("embedding").items():
+            if config.provider == to_model.provider and config.model_id == to_model.model_name:
+                return alias
+        logger.warning(f"⚠️ 注册表中没有 {to_model.provider}/{to_model.model_name}，使用默认嵌入模型")
+        return None
+    
+    async def _embed_batch(self, task: MigrationTask, batch: List[Tuple[str, VectorData]],
+                           to_model: ModelVersion, api_manager: UnifiedAPIManager) -> Optional[np.ndarray]:
+        """为一批文本生成目标模型的向量 (len(batch), 维度)，API返回失败时为None"""
+        if not api_manager:
+            # 模拟新向量（用于测试）
+            return np.random.random((len(batch), to_model.dimension)).astype(np.float32)
+        
+        embedding_result = await api_manager.create_embeddings(
+            texts=[vector_data.text_content for _, vector_data in batch],
+            model_alias=self._embedding_alias(to_model, api_manager)
+        )
+        if not embedding_result.get("success"):
+            return None
+        task.stats["api_calls"] += 1
+        return np.asarray(embedding_result["embeddings"], dtype=np.float32)
+    
     async def _execute_parallel_build(self, task: MigrationTask, api_manager: UnifiedAPIManager) -> bool:
-        """执行并行构建迁移"""
-        # 并行处理向量
-        from_vectors = self.vector_storage.get(task.from_version, {})
-        
-        # 分批处理
-        batch_size = 10
-        batches = [list(from_vectors.items())[i:i + batch_size] 
-                  for i in range(0, len(from_vectors), batch_size)]
-        
-        for batch in batches:
-            # 并行处理当前批次
-            tasks_batch = []
-            for text_id, vector_data in batch:
-                tasks_batch.append(self._process_single_vector(
-                    task, text_id, vector_data, api_manager
-                ))
-            
-            await asyncio.gather(*tasks_batch, return_exceptions=True)
-            
-            # 更新进度
-            task.stats["processed_vectors"] += len(batch)
-            task.progress = (task.stats["processed_vectors"] / len(from_vectors)) * 100
+        """
+        执行并行构建迁移
         
-        return True
+        固定数量的工作协程从队列中领取文本分组并批量请求嵌入API，
+        写入协程按完成顺序落盘并立即更新进度，不会被同批次中最慢的请求阻塞
+        """
+        items = list(self._memory_store(task.from_version).items(task.from_version))
+        to_model = self.model_versions[task.to_version]
+        total = len(items)
+        
+        groups: asyncio.Queue = asyncio.Queue()
+        for start in range(0, total, PARALLEL_BATCH_SIZE):
+            groups.put_nowait(items[start:start + PARALLEL_BATCH_SIZE])
+        group_count = groups.qsize()
+        results: asyncio.Queue = asyncio.Queue()
+        
+        async def _worker():
+            while True:
+                try:
+                    batch = groups.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    vectors = await self._embed_batch(task, batch, to_model, api_manager)
+                except Exception as e:
+                    logger.error(f"❌ 处理向量批次失败: {batch[0][0]} 等 {len(batch)} 条 - {e}")
+                    vectors = None
+                await results.put((batch, vectors))
+        
+        async def _writer():
+            for _ in range(group_count):
+                batch, vectors = await results.get()
+                if vectors is None or vectors.shape != (len(batch), to_model.dimension):
+                    task.stats["failed_vectors"] += len(batch)
+                    continue
+                self._store_migrated(task, batch, vectors)
+                
+                # 更新进度
+                task.stats["processed_vectors"] += len(batch)
+                task.progress = (task.stats["processed_vectors"] / total) * 100
+        
+        await asyncio.gather(_writer(), *(_worker() for _ in range(min(PARALLEL_WORKERS, group_count))))
+        return task.stats["failed_vectors"] == 0
     
     async def _process_single_vector(self, task: MigrationTask, text_id: str, 
-                                   vector_data: VectorData, api_manager: UnifiedAPIManager):
-        """处理单个向量"""
+                                   vector_data: VectorData, api_manager: UnifiedAPIManager,
+                                   created_at: Optional[str] = None):
+        """处理单个向量（循环调用时由调用方传入统一的写入时间）"""
         try:
             to_model = self.model_versions[task.to_version]
             
             if api_manager:
-                # provider = ModelProvider.QWEN if to_model.provider == "qwen" else ModelProvider.DEEPSEEK  # 原代码保留
-                provider = ModelProvider.QWEN  # 当前专注千问API
                 embedding_result = await api_manager.create_embeddings(
                     texts=[vector_data.text_content],
-                    provider=provider
+                    model_alias=self._embedding_alias(to_model, api_manager)
                 )
                 
                 if embedding_result.get("success"):
@@ -475,21 +871,12 @@ class VectorModelVersioning:
             else:
                 new_vector = np.random.random(to_model.dimension).tolist()
             
-            # 存储新向量
-            new_vector_data = VectorData(
-                text_id=text_id,
-                text_content=vector_data.text_content,
-                vector=new_vector,
-                model_version=task.to_version,
-                created_at=datetime.now().isoformat(),
-                metadata=vector_data.metadata
+            # 存储新向量（只写内存）
+            self._memory_store(task.to_version).add(
+                [text_id], [vector_data.text_content], np.asarray([new_vector], dtype=np.float32),
+                created_at or datetime.now().isoformat(), vector_data.metadata
             )
             
-            if task.to_version not in self.vector_storage:
-                self.vector_storage[task.to_version] = {}
-            
-            self.vector_storage[task.to_version][text_id] = new_vector_data
-            
         except Exception as e:
             logger.error(f"❌ 处理向量失败: {text_id} - {e}")
             task.stats["failed_vectors"] += 1
@@ -497,16 +884,17 @@ class VectorModelVersioning:
     async def _execute_selective_migration(self, task: MigrationTask, api_manager: UnifiedAPIManager) -> bool:
         """执行选择性迁移"""
         # 只迁移重要的向量
-        from_vectors = self.vector_storage.get(task.from_version, {})
+        from_vectors = self._memory_store(task.from_version)
         
-        # 选择性条件（这里简化为选择前50%）
-        selected_vectors = dict(list(from_vectors.items())[:len(from_vectors)//2])
+        # 选择性条件（这里简化为选择前50%），直接在迭代器上截取，不复制记录
+        selected_count = len(from_vectors) // 2
         
         processed = 0
-        for text_id, vector_data in selected_vectors.items():
-            await self._process_single_vector(task, text_id, vector_data, api_manager)
+        created_at = datetime.now().isoformat()
+        for text_id, vector_data in itertools.islice(from_vectors.items(task.from_version), selected_count):
+            await self._process_single_vector(task, text_id, vector_data, api_manager, created_at)
             processed += 1
-            task.progress = (processed / len(selected_vectors)) * 100
+            task.progress = (processed / selected_count) * 100
         
         return True
     
@@ -543,17 +931,31 @@ class VectorModelVersioning:
         }
     
     def _calculate_storage_size(self, version_id: str) -> float:
-        """计算存储大小(MB)"""
-        version_dir = self.storage_path / version_id
-        if not version_dir.exists():
+        """计算存储大小(MB)，版本目录未变化时复用上次结果"""
+        version_dir = os.path.join(self.storage_path, version_id)
+        try:
+            # 列式存储每次追加都会原子替换 store.json，目录的修改时间随之变化
+            mtime = os.stat(version_dir).st_mtime_ns
+        except FileNotFoundError:
             return 0.0
         
+        cached = self._storage_size_cache.get(version_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
         total_size = 0
-        for file_path in version_dir.rglob("*"):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
+        stack = [version_dir]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total_size += entry.stat(follow_symlinks=False).st_size
         
-        return total_size / (1024 * 1024)  # 转换为MB
+        size_mb = total_size / (1024 * 1024)  # 转换为MB
+        self._storage_size_cache[version_id] = (mtime, size_mb)
+        return size_mb
     
     def list_versions(self) -> List[Dict[str, Any]]:
         """列出所有版本"""
@@ -581,16 +983,19 @@ class VectorModelVersioning:
                 
                 # 删除内存数据
                 del self.model_versions[version_id]
+                self._version_index.pop((version.provider, version.model_name,
+                                         version.api_version, version.dimension), None)
                 if version_id in self.vector_storage:
                     del self.vector_storage[version_id]
+                self._stores.pop(version_id, None)
                 
                 logger.info(f"🧹 清理旧版本: {version_id}")
         
         self._save_versions()
 
 
-# 全局版本管理器实例
-version_manager = VectorModelVersioning()
+# 全局版本管理器实例（导入模块时不编译numba内核）
+version_manager = VectorModelVersioning(warmup_kernels=False)
 
 def register_model(provider: str, model_name: str, dimension: int = 1536) -> str:
     """注册模型版本（简化接口）"""
@@ -0,0 +1,73 @@
+"""
+向量运算内核
+语料矩阵与查询向量的点积：安装numba时使用编译后的并行内核，否则退化为NumPy矩阵乘法
+"""
+
+from typing import Optional
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+# float16矩阵及非编译路径下每次转换为float32的行数，避免对内存映射的大矩阵一次性生成临时副本
+DOT_BLOCK_ROWS = 65536
+
+_warmed_up = False
+
+
+if _NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _dot_matrix_kernel(matrix, query, out):
+        """逐行点积，行间并行，行内由编译器向量化"""
+        for i in prange(matrix.shape[0]):
+            s = 0.0
+            for k in range(matrix.shape[1]):
+                s += matrix[i, k] * query[k]
+            out[i] = s
+
+
+def dot_matrix(matrix: np.ndarray, query: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    计算矩阵每一行与查询向量的点积
+
+    Args:
+        matrix: (N, dim) 向量矩阵，支持 float32 / float16 / int8（可为内存映射）
+        query: (dim,) 查询向量
+        scales: int8矩阵的每行缩放系数
+
+    Returns:
+        (N,) float32 点积结果
+    """
+    query = np.ascontiguousarray(query, dtype=np.float32)
+    out = np.empty(matrix.shape[0], dtype=np.float32)
+
+    if _NUMBA_AVAILABLE and matrix.dtype in (np.float32, np.int8):
+        _dot_matrix_kernel(np.asarray(matrix), query, out)
+    elif _NUMBA_AVAILABLE:
+        # numba不支持float16运算：逐块转换为float32后交给同一个编译内核
+        for start in range(0, matrix.shape[0], DOT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + DOT_BLOCK_ROWS], dtype=np.float32)
+            _dot_matrix_kernel(block, query, out[start:start + block.shape[0]])
+    else:
+        for start in range(0, matrix.shape[0], DOT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + DOT_BLOCK_ROWS], dtype=np.float32)
+            out[start:start + block.shape[0]] = block @ query
+
+    if scales is not None:
+        out *= scales
+    return out
+
+
+def warmup():
+    """预先编译（或从磁盘缓存加载）float32与int8两种矩阵的内核（float16分块后使用float32内核），只在进程内执行一次"""
+    global _warmed_up
+    if _warmed_up or not _NUMBA_AVAILABLE:
+        return
+    query = np.zeros(2, dtype=np.float32)
+    for dtype in (np.float32, np.int8):
+        dot_matrix(np.zeros((1, 2), dtype=dtype), query)
+    _warmed_up = True
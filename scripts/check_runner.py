@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+自检脚本共用的运行器
+把仓库根目录加入导入路径，依次运行检查函数并汇总结果（有失败时以状态码1退出）
+"""
+
+import os
+import sys
+import asyncio
+import inspect
+import logging
+import tempfile
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+# legacy_backup 中的部分模块按包内相对路径导入进度管理器，使用 oop 中的实现
+import oop.progress_manager
+sys.modules.setdefault("legacy_backup.progress_manager", oop.progress_manager)
+
+logging.getLogger("legacy_backup").setLevel(logging.WARNING)
+
+
+class SkipCheck(Exception):
+    """当前环境无法执行的检查（如缺少可选依赖）"""
+
+
+@contextmanager
+def temporary_cwd() -> Iterator[Path]:
+    """在临时目录中执行（导入时会在当前目录创建数据文件的模块在此导入）"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(cwd)
+
+
+def run_checks(title: str, checks: List[Callable]):
+    """
+    依次运行检查函数并打印结果
+
+    检查函数声明了参数时传入独立的临时目录；async函数用 asyncio.run 执行
+    """
+    print(f"🧪 {title}")
+    print("=" * 50)
+
+    failed = skipped = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, check in enumerate(checks):
+            workdir = Path(tmp) / f"case_{i}"
+            workdir.mkdir()
+            args = (workdir,) if inspect.signature(check).parameters else ()
+            try:
+                if inspect.iscoroutinefunction(check):
+                    asyncio.run(check(*args))
+                else:
+                    check(*args)
+                print(f"✅ {check.__name__}")
+            except SkipCheck as e:
+                skipped += 1
+                print(f"⏭️  {check.__name__}: {e}")
+            except Exception:
+                failed += 1
+                print(f"❌ {check.__name__}")
+                traceback.print_exc()
+
+    print("=" * 50)
+    if failed:
+        print(f"⚠️  {failed}/{len(checks)} 项检查失败")
+        sys.exit(1)
+    print(f"🎉 {len(checks) - skipped} 项检查通过" + (f"，{skipped} 项跳过" if skipped else ""))
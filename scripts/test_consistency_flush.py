@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+一致性记录延迟写盘自检脚本
+检查 ModelConsistencyManager 合并多次变更为一次写盘，以及写盘失败后保留脏标记并重试
+用法: python scripts/test_consistency_flush.py
+"""
+
+import time
+from pathlib import Path
+
+from check_runner import run_checks
+
+from legacy_backup import model_consistency_manager as mcm
+
+
+def test_debounced_flush(workdir: Path):
+    """连续注册只在延迟结束后写一次盘，重新加载后记录与顺序完整"""
+    consistency_file = workdir / "model_consistency.json"
+    debounce = mcm.SAVE_DEBOUNCE_SECONDS
+    mcm.SAVE_DEBOUNCE_SECONDS = 0.2
+    try:
+        manager = mcm.ModelConsistencyManager(str(consistency_file))
+        hashes = [manager.register_model("qwen", f"model-{i}", dimension=8) for i in range(5)]
+        manager.register_model("qwen", "model-0", dimension=8)
+        assert not consistency_file.exists()
+
+        time.sleep(0.5)
+        assert consistency_file.exists() and not manager._dirty
+
+        reloaded = mcm.ModelConsistencyManager(str(consistency_file))
+        assert list(reloaded.records) == hashes
+        assert reloaded.records[hashes[0]].usage_count == manager.records[hashes[0]].usage_count == 2
+    finally:
+        mcm.SAVE_DEBOUNCE_SECONDS = debounce
+
+
+def test_flush_retry_after_failure(workdir: Path):
+    """写盘失败时保留脏标记，下次写盘时重试成功"""
+    blocker = workdir / "blocked"
+    blocker.write_text("占位文件，使一致性文件的目录无法创建")
+    consistency_file = blocker / "model_consistency.json"
+
+    manager = mcm.ModelConsistencyManager(str(consistency_file))
+    manager.register_model("qwen", "model", dimension=8)
+    manager._flush_now()
+    assert manager._dirty and not consistency_file.exists()
+
+    blocker.unlink()
+    manager._flush_now()
+    assert not manager._dirty and consistency_file.exists()
+    assert len(mcm.ModelConsistencyManager(str(consistency_file)).records) == 1
+
+
+if __name__ == "__main__":
+    run_checks("一致性记录延迟写盘自检", [
+        test_debounced_flush,
+        test_flush_retry_after_failure,
+    ])
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+语料向量缓存自检脚本
+检查 FilterManager 的语料缓存按集合条数与写入序号复用或重建，以及关联ChromaDB版本时的失效
+用法: python scripts/test_corpus_cache.py
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from check_runner import SkipCheck, run_checks
+
+# 依赖chromadb与openai，未安装时跳过
+try:
+    from legacy_backup import filter_manager
+    from legacy_backup.model_consistency_manager import ModelConsistencyManager
+except ImportError as e:
+    filter_manager = None
+    _IMPORT_ERROR = e
+
+
+def _vectors(seed: int, n: int, dim: int = 4) -> list:
+    return np.random.default_rng(seed).standard_normal((n, dim)).tolist()
+
+
+class _CorpusEnv:
+    """把ChromaDB目录和语料缓存目录指向临时目录"""
+
+    def __init__(self, workdir: Path):
+        if filter_manager is None:
+            raise SkipCheck(f"未安装依赖: {_IMPORT_ERROR}")
+        self.workdir = workdir
+
+    def __enter__(self):
+        self.saved = filter_manager.CHROMA_DB_PATH, filter_manager.CORPUS_CACHE_DIR
+        filter_manager.CHROMA_DB_PATH = str(self.workdir / "chroma_db")
+        filter_manager.CORPUS_CACHE_DIR = str(self.workdir / "corpus_cache")
+        filter_manager.FilterManager.clear_client_caches()
+        return self
+
+    def __exit__(self, *exc):
+        filter_manager.CHROMA_DB_PATH, filter_manager.CORPUS_CACHE_DIR = self.saved
+        filter_manager.FilterManager.clear_client_caches()
+
+    @staticmethod
+    def manager():
+        return filter_manager.FilterManager(None, "test-key", llm_cache_path=None)
+
+    @staticmethod
+    def cache_files() -> list:
+        return sorted(os.listdir(filter_manager.CORPUS_CACHE_DIR))
+
+
+def _assert_matches_collection(fm):
+    """缓存矩阵与集合中的向量（归一化后）一致"""
+    res = fm.collection.get(include=["embeddings"])
+    expected = np.asarray(res["embeddings"], dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(fm._corpus_norm, expected, rtol=1e-6)
+
+
+def test_reuse_and_rebuild(workdir: Path):
+    """内容未变时新实例复用缓存；条数不变的覆盖写入（含只改向量）、增删文档后重建并清理旧文件"""
+    with _CorpusEnv(workdir) as env:
+        fm = env.manager()
+        assert fm._corpus_norm is None
+
+        collection = fm.collection
+        collection.add(ids=[f"d{i}" for i in range(5)], embeddings=_vectors(0, 5),
+                       documents=[f"文档{i}" for i in range(5)])
+        fm._load_corpus_matrix()
+        _assert_matches_collection(fm)
+        first_cache = fm._corpus_cache_stem + ".npy"
+        assert env.cache_files() == [os.path.basename(first_cache)]
+
+        mtime = os.stat(first_cache).st_mtime_ns
+        assert env.manager()._corpus_cache_stem == fm._corpus_cache_stem
+        assert os.stat(first_cache).st_mtime_ns == mtime
+
+        updates = [
+            lambda: collection.upsert(ids=["d0"], embeddings=_vectors(1, 1), documents=["文档0"]),
+            lambda: collection.upsert(ids=["d2"], embeddings=_vectors(2, 1), documents=["文档2（修订）"]),
+            lambda: (collection.delete(ids=["d4"]),
+                     collection.add(ids=["d5"], embeddings=_vectors(3, 1), documents=["文档5"])),
+        ]
+        for update in updates:
+            stem = fm._corpus_cache_stem
+            update()
+            fm._load_corpus_matrix()
+            assert fm._corpus_cache_stem != stem
+            _assert_matches_collection(fm)
+            assert env.cache_files() == [os.path.basename(fm._corpus_cache_stem + ".npy")]
+
+
+def test_invalidate_on_chromadb_version(workdir: Path):
+    """关联新的ChromaDB版本时，进程内的筛选管理器重新加载语料缓存"""
+    with _CorpusEnv(workdir) as env:
+        fm = env.manager()
+        fm.collection.add(ids=["a", "b"], embeddings=_vectors(4, 2), documents=["甲", "乙"])
+        fm._load_corpus_matrix()
+        cache_file = fm._corpus_cache_stem + ".npy"
+        mtime = os.stat(cache_file).st_mtime_ns
+
+        consistency = ModelConsistencyManager(str(workdir / "model_consistency.json"))
+        consistency.add_chromadb_listener(filter_manager._on_chromadb_version)
+        model_hash = consistency.register_model("qwen", "text-embedding-v2", dimension=4)
+        consistency.associate_chromadb_version(model_hash, "v1")
+
+        assert os.stat(cache_file).st_mtime_ns != mtime
+        _assert_matches_collection(fm)
+        consistency._flush_now()
+
+
+def test_keep_only_current_stem(workdir: Path):
+    """清理旧缓存时只保留当前文件名，前缀相同的其他版本（如 _s3 与 _s30）一并删除"""
+    with _CorpusEnv(workdir) as env:
+        fm = env.manager()
+        fm.collection.add(ids=["a"], embeddings=_vectors(5, 1), documents=["甲"])
+        fm._load_corpus_matrix()
+        stem = fm._corpus_cache_stem
+        stale = stem + "0.npy"
+        Path(stale).write_bytes(b"")
+
+        fm._remove_corpus_cache(keep_stem=stem)
+        assert env.cache_files() == [os.path.basename(stem + ".npy")]
+
+
+if __name__ == "__main__":
+    run_checks("语料向量缓存自检", [
+        test_reuse_and_rebuild,
+        test_invalidate_on_chromadb_version,
+        test_keep_only_current_stem,
+    ])
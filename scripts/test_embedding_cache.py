@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+向量缓存自检脚本
+检查 UnifiedAPIManager 的文本向量缓存：过期与LRU淘汰、按提供商/模型/端点区分的缓存键、批内去重与命中，
+以及SQLite持久化库的跨实例复用与过期清理
+用法: python scripts/test_embedding_cache.py
+"""
+
+import time
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from check_runner import run_checks
+
+from legacy_backup import unified_api_manager as uam
+
+DIM = 4
+QWEN = SimpleNamespace(provider="qwen", model_id="text-embedding-v2", base_url="http://embedding.test/qwen")
+MODEL_KEY = uam._model_key(QWEN)
+
+
+def _vector(text: str) -> np.ndarray:
+    """文本对应的确定性向量"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()[:DIM]
+    return np.frombuffer(digest, dtype=np.uint8).astype(np.float32)
+
+
+class _CountingManager(uam.UnifiedAPIManager):
+    """只初始化向量缓存的管理器，未命中的文本由本地函数生成向量并记录"""
+
+    def __init__(self):
+        self._emb_cache = uam._EmbeddingCache(db_path=None)
+        self.requested = []  # 每次发往嵌入API的文本列表
+
+    async def _coalesced_embed(self, model_config, texts):
+        self.requested.append(list(texts))
+        return [_vector(text) for text in texts]
+
+
+async def test_ttl_expiry():
+    """条目过期后不再命中并被删除，命中/未命中计数正确"""
+    cache = uam._EmbeddingCache(ttl=0.2, db_path=None)
+    key = cache.key(MODEL_KEY, "文本")
+    await cache.put(key, _vector("文本"))
+    assert await cache.get(key) is not None
+    time.sleep(0.3)
+    assert await cache.get(key) is None
+    assert key not in cache._data
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+async def test_lru_eviction():
+    """超过容量时淘汰最久未使用的条目（读取会刷新位置）"""
+    cache = uam._EmbeddingCache(maxsize=2, db_path=None)
+    a, b, c = (cache.key(MODEL_KEY, text) for text in "abc")
+    await cache.put_many([(a, _vector("a")), (b, _vector("b"))])
+    assert await cache.get(a) is not None
+    await cache.put(c, _vector("c"))
+    found = await cache.get_many([a, b, c])
+    assert [embedding is not None for embedding in found] == [True, False, True]
+    assert list(cache._data) == [a, c]
+
+
+def test_key_separates_endpoints():
+    """同一 model_id 在不同提供商或端点上使用不同的缓存键"""
+    keys = {
+        uam._EmbeddingCache.key(uam._model_key(config), "文本")
+        for config in (
+            QWEN,
+            SimpleNamespace(provider="openai", model_id=QWEN.model_id, base_url=QWEN.base_url),
+            SimpleNamespace(provider=QWEN.provider, model_id=QWEN.model_id, base_url="http://other.test"),
+        )
+    }
+    assert len(keys) == 3
+
+
+async def test_dedup_and_hits():
+    """批内重复文本只请求一次，再次请求全部命中缓存，结果为按输入顺序的矩阵"""
+    manager = _CountingManager()
+    texts = ["x", "y", "x"]
+
+    first = await manager._embed_with_cache(QWEN, texts)
+    assert manager.requested == [["x", "y"]]
+    assert first["cache_hits"] == 1
+    np.testing.assert_array_equal(first["embeddings"], np.stack([_vector(text) for text in texts]))
+
+    second = await manager._embed_with_cache(QWEN, texts + ["z"])
+    assert manager.requested == [["x", "y"], ["z"]]
+    assert second["cache_hits"] == 3
+    assert second["embeddings"].shape == (4, DIM)
+
+    empty = await manager._embed_with_cache(QWEN, [])
+    assert empty["embedding_count"] == 0
+
+
+async def test_persistence(workdir: Path):
+    """持久化库跨实例复用；过期记录查询不到，并在下次打开时清理"""
+    assert uam._EmbeddingCache()._db is None  # 默认不落盘
+
+    db_path = str(workdir / "cache" / "embedding_cache.db")
+    writer = uam._EmbeddingCache(ttl=1.0, db_path=db_path)
+    key, other = writer.key(MODEL_KEY, "a"), writer.key(MODEL_KEY, "b")
+    await writer.put_many([(key, _vector("a")), (other, _vector("b"))])
+
+    # 新实例从库中读取，并按库中的写入时间折算内存缓存的过期时间
+    time.sleep(0.6)
+    reader = uam._EmbeddingCache(ttl=1.0, db_path=db_path)
+    np.testing.assert_array_equal(await reader.get(key), _vector("a"))
+    assert key in reader._data
+    time.sleep(0.5)
+    assert await reader.get(key) is None
+
+    reopened = uam._EmbeddingCache(ttl=1.0, db_path=db_path)
+    assert reopened._db.execute("SELECT COUNT(*) FROM emb").fetchone()[0] == 0
+
+
+if __name__ == "__main__":
+    run_checks("向量缓存自检", [
+        test_ttl_expiry,
+        test_lru_eviction,
+        test_key_separates_endpoints,
+        test_dedup_and_hits,
+        test_persistence,
+    ])
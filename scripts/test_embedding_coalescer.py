@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+嵌入请求合并自检脚本
+检查 UnifiedAPIManager 的嵌入合并队列：批次大小、按模型分队列、错误与返回条数不符时的分发、
+调用方超时、close() 时取消进行中的请求，以及每个批次使用最新的模型配置
+嵌入API由本地函数模拟，不发送网络请求
+用法: python scripts/test_embedding_coalescer.py
+"""
+
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+
+from check_runner import run_checks
+
+from legacy_backup import unified_api_manager as uam
+
+DIM = 16
+QWEN = SimpleNamespace(provider="qwen", model_id="text-embedding-v2",
+                       base_url="http://embedding.test/qwen", api_key="key-1")
+OTHER = SimpleNamespace(provider="openai", model_id="text-embedding-3-small",
+                        base_url="http://embedding.test/openai", api_key="key-2")
+
+
+def _vector(model_id: str, text: str) -> np.ndarray:
+    """文本对应的确定性向量"""
+    digest = hashlib.sha256(f"{model_id}:{text}".encode("utf-8")).digest()[:DIM]
+    return np.frombuffer(digest, dtype=np.uint8).astype(np.float32)
+
+
+class FakeEmbeddingManager(uam.UnifiedAPIManager):
+    """只初始化嵌入合并与缓存状态的管理器，_call_embedding_api 由本地函数代替"""
+
+    def __init__(self, delay: float = 0.0, drop_last: bool = False, error: Exception = None):
+        self._emb_cache = uam._EmbeddingCache(db_path=None)
+        self._emb_loop = None
+        self._emb_queues = {}
+        self._emb_workers = {}
+        self._emb_flushes = set()
+        self._session = None
+        self._session_loop = None
+
+        self.delay = delay
+        self.drop_last = drop_last
+        self.error = error
+        self.calls = []        # 每次请求的 (模型, 文本列表)
+        self.api_keys = []     # 每次请求使用的密钥
+        self.cancelled = 0     # 被取消的请求数
+
+    async def _call_embedding_api(self, model_config, texts):
+        self.calls.append((model_config.model_id, list(texts)))
+        self.api_keys.append(model_config.api_key)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        embeddings = np.stack([_vector(model_config.model_id, text) for text in texts])
+        if self.drop_last:
+            embeddings = embeddings[:-1]
+        return {"embeddings": embeddings, "provider": model_config.provider,
+                "model": model_config.model_id, "embedding_count": len(embeddings), "success": True}
+
+
+async def test_batches_concurrent_requests():
+    """并发的单条请求合并为不超过 EMBED_BATCH_MAX 条的批次，结果按文本分发"""
+    manager = FakeEmbeddingManager(delay=0.01)
+    count = 2 * uam.EMBED_BATCH_MAX + 10
+    texts = [f"文本{i}" for i in range(count)]
+
+    results = await asyncio.gather(*(manager._coalesced_embed(QWEN, [text]) for text in texts))
+
+    sizes = [len(batch) for _, batch in manager.calls]
+    assert sizes == [uam.EMBED_BATCH_MAX, uam.EMBED_BATCH_MAX, 10], sizes
+    for text, (embedding,) in zip(texts, results):
+        np.testing.assert_array_equal(embedding, _vector(QWEN.model_id, text))
+    await manager.close()
+    assert not manager._emb_workers and not manager._emb_flushes
+
+
+async def test_models_use_separate_queues():
+    """不同模型的请求不会合并到同一批次"""
+    manager = FakeEmbeddingManager()
+    qwen, other = await asyncio.gather(
+        manager._coalesced_embed(QWEN, ["a", "b"]),
+        manager._coalesced_embed(OTHER, ["a", "c"]),
+    )
+
+    assert sorted(manager.calls) == [(OTHER.model_id, ["a", "c"]), (QWEN.model_id, ["a", "b"])]
+    np.testing.assert_array_equal(qwen[0], _vector(QWEN.model_id, "a"))
+    np.testing.assert_array_equal(other[0], _vector(OTHER.model_id, "a"))
+    await manager.close()
+
+
+async def test_short_response_fails_batch():
+    """返回条数少于请求条数时整批报错，不分发错位的向量，也不写入缓存"""
+    manager = FakeEmbeddingManager(drop_last=True)
+    outcomes = await asyncio.gather(
+        manager._embed_with_cache(QWEN, ["a"]),
+        manager._embed_with_cache(QWEN, ["b", "c"]),
+        return_exceptions=True,
+    )
+
+    assert len(manager.calls) == 1
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes), outcomes
+    keys = [manager._emb_cache.key(uam._model_key(QWEN), text) for text in "abc"]
+    assert await manager._emb_cache.get_many(keys) == [None, None, None]
+    await manager.close()
+
+
+async def test_api_error_reaches_every_waiter():
+    """嵌入API失败时同批次的所有等待者都收到同一个异常，后续批次不受影响"""
+    error = RuntimeError("服务不可用")
+    manager = FakeEmbeddingManager(error=error)
+    outcomes = await asyncio.gather(
+        manager._coalesced_embed(QWEN, ["a"]),
+        manager._coalesced_embed(QWEN, ["b"]),
+        return_exceptions=True,
+    )
+    assert outcomes == [error, error]
+
+    manager.error = None
+    (embedding,) = await manager._coalesced_embed(QWEN, ["a"])
+    np.testing.assert_array_equal(embedding, _vector(QWEN.model_id, "a"))
+    await manager.close()
+
+
+async def test_caller_timeout_cancels_request():
+    """等待者全部超时后取消进行中的HTTP请求"""
+    manager = FakeEmbeddingManager(delay=10)
+    try:
+        await asyncio.wait_for(manager._coalesced_embed(QWEN, ["a", "b"]), 0.1)
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("应当超时")
+
+    await asyncio.sleep(0.05)
+    assert manager.cancelled == 1
+    assert not manager._emb_flushes
+    await manager.close()
+
+
+async def test_partial_timeout_keeps_request():
+    """只有部分等待者超时时请求继续进行，其余等待者正常拿到结果"""
+    manager = FakeEmbeddingManager(delay=0.2)
+    impatient = asyncio.ensure_future(asyncio.wait_for(manager._coalesced_embed(QWEN, ["a"]), 0.05))
+    patient = asyncio.ensure_future(manager._coalesced_embed(QWEN, ["b"]))
+
+    outcomes = await asyncio.gather(impatient, patient, return_exceptions=True)
+    assert isinstance(outcomes[0], asyncio.TimeoutError)
+    np.testing.assert_array_equal(outcomes[1][0], _vector(QWEN.model_id, "b"))
+    assert manager.cancelled == 0 and len(manager.calls) == 1
+    await manager.close()
+
+
+async def test_close_cancels_inflight_batch():
+    """close() 取消后台任务和正在发送的批次，等待者收到取消"""
+    manager = FakeEmbeddingManager(delay=10)
+    caller = asyncio.ensure_future(manager._coalesced_embed(QWEN, ["a"]))
+    await asyncio.sleep(uam.EMBED_BATCH_DELAY * 3)
+    assert len(manager._emb_flushes) == 1
+
+    await manager.close()
+    assert manager.cancelled == 1
+    assert not manager._emb_workers and not manager._emb_flushes
+    try:
+        await caller
+    except asyncio.CancelledError:
+        pass
+    else:
+        raise AssertionError("等待者应被取消")
+
+
+async def test_batch_uses_latest_config():
+    """密钥轮换后，同一模型队列中的后续批次使用新的模型配置"""
+    manager = FakeEmbeddingManager()
+    await manager._coalesced_embed(QWEN, ["a"])
+    rotated = SimpleNamespace(**{**vars(QWEN), "api_key": "key-rotated"})
+    await manager._coalesced_embed(rotated, ["b"])
+
+    assert len(manager._emb_queues) == 1
+    assert manager.api_keys == [QWEN.api_key, "key-rotated"]
+    await manager.close()
+
+
+if __name__ == "__main__":
+    run_checks("嵌入请求合并自检", [
+        test_batches_concurrent_requests,
+        test_models_use_separate_queues,
+        test_short_response_fails_batch,
+        test_api_error_reaches_every_waiter,
+        test_caller_timeout_cancels_request,
+        test_partial_timeout_keeps_request,
+        test_close_cancels_inflight_batch,
+        test_batch_uses_latest_config,
+    ])
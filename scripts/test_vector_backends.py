@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+向量检索后端自检脚本
+检查分块top-k合并（编译内核与argpartition两条路径）与整体排序的结果一致
+用法: python scripts/test_vector_backends.py
+"""
+
+import numpy as np
+
+from check_runner import run_checks
+
+from legacy_backup import vector_backends
+
+
+def test_merge_topk():
+    """k 小于、跨越和等于分块大小及语料规模时，两条路径与整体排序选出相同的结果"""
+    rng = np.random.default_rng(5)
+    corpus = rng.standard_normal((1000, 8)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = corpus[rng.choice(1000, 7, replace=False)] + 0.1 * rng.standard_normal((7, 8)).astype(np.float32)
+    backend = vector_backends.NumpyBackend(corpus, block_size=256)
+    sims = queries @ corpus.T
+
+    search_paths = [backend._search_argpartition]
+    if vector_backends._NUMBA_AVAILABLE:
+        search_paths.append(backend._search_compiled)
+
+    for k in (1, 10, 300, 1000):
+        expected_idx = np.argsort(-sims, axis=1)[:, :k]
+        for search in search_paths:
+            idx, sim = search(queries, k)
+            assert idx.shape == (7, k)
+            assert all(set(row) == set(exp) for row, exp in zip(idx.tolist(), expected_idx.tolist())), \
+                f"{search.__name__} k={k} 结果不一致"
+            np.testing.assert_allclose(sim, np.take_along_axis(sims, idx, axis=1), rtol=1e-5)
+
+        idx, sim = backend.search(queries, k)
+        np.testing.assert_array_equal(idx, expected_idx)
+        assert np.all(np.diff(sim, axis=1) <= 0)
+
+
+if __name__ == "__main__":
+    run_checks("向量检索后端自检", [
+        test_merge_topk,
+    ])
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+向量存储自检脚本
+检查 legacy_backup 中列式向量存储的追加、扩容、重新加载（float32/float16/int8 各存储类型）与覆盖写入，以及点积内核
+用法: python scripts/test_vector_storage.py
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from check_runner import run_checks, temporary_cwd
+
+# 模块级实例会在当前目录创建数据目录，在临时目录中导入
+with temporary_cwd():
+    from legacy_backup import vector_model_versioning as vmv
+    from legacy_backup import vector_backends, vector_ops
+
+DIM = 8
+
+
+def _random_vectors(rng, n: int, dim: int = DIM) -> np.ndarray:
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def _tolerance(dtype: str, vectors: np.ndarray) -> float:
+    """各存储类型读回向量的最大误差"""
+    if dtype == "float32":
+        return 0.0
+    if dtype == "float16":
+        return float(np.abs(vectors).max()) * 1e-3
+    return float(np.abs(vectors).max(axis=1).max()) / 127.0
+
+
+def test_columnar_round_trip(workdir: Path):
+    """多批追加（跨过初始容量触发扩容）后重新打开，读回的记录与写入一致"""
+    rng = np.random.default_rng(0)
+    sizes = (700, 700, 5)
+    total = sum(sizes)
+
+    for dtype in vmv.STORAGE_DTYPES:
+        version_dir = workdir / dtype
+        version_dir.mkdir()
+        store = vmv._ColumnarStore(version_dir, dtype)
+        text_ids, texts, batches = [], [], []
+        start = 0
+        for b, size in enumerate(sizes):
+            ids = [f"doc-{start + i}" for i in range(size)]
+            contents = [f"第{start + i}篇 信用研究 ✅" for i in range(size)]
+            vectors = _random_vectors(rng, size)
+            store.append(ids, contents, vectors, {"batch": b}, created_at=1000 + b)
+            text_ids += ids
+            texts += contents
+            batches.append(vectors)
+            start += size
+        expected = np.concatenate(batches)
+
+        assert len(store) == total
+        assert store.descriptor["capacity"] == 2 * vmv.STORE_INITIAL_CAPACITY
+        assert store.live_rows() is None
+
+        # 重新打开，只依赖磁盘上的文件
+        reopened = vmv._ColumnarStore(version_dir)
+        assert reopened.dtype == dtype
+        ids, contents, vectors, created_at, meta = reopened.load()
+        assert ids == text_ids
+        assert contents == texts
+        assert vectors.dtype == np.float32 and vectors.shape == (total, DIM)
+        np.testing.assert_allclose(vectors, expected, rtol=0, atol=_tolerance(dtype, expected))
+        np.testing.assert_array_equal(created_at, np.repeat([1000, 1001, 1002], sizes))
+        assert [(m["start"], m["count"], m["metadata"]) for m in meta] == [
+            (0, 700, {"batch": 0}), (700, 700, {"batch": 1}), (1400, 5, {"batch": 2})
+        ]
+
+
+def test_columnar_overwrite_matches_memory(workdir: Path):
+    """同一text_id重复写入：磁盘保留全部行，读取结果与内存 VersionStore 原地覆盖一致"""
+    rng = np.random.default_rng(1)
+    batches = [
+        (["a", "b", "c"], ["A1", "B1", "C1"]),
+        (["b", "d"], ["B2", "D1"]),
+        (["a", "b"], ["A2", "B3"]),
+    ]
+
+    store = vmv._ColumnarStore(workdir, "float32")
+    memory = vmv.VersionStore(DIM, np.float32)
+    for i, (ids, texts) in enumerate(batches):
+        vectors = _random_vectors(rng, len(ids))
+        store.append(ids, texts, vectors, {}, created_at=i)
+        memory.add(ids, texts, vectors, str(i), {})
+
+    assert len(store) == 7
+    np.testing.assert_array_equal(store.live_rows(), [5, 6, 2, 4])
+
+    ids, texts, vectors, created_at, _ = vmv._ColumnarStore(workdir).load()
+    assert ids == memory.text_ids == ["a", "b", "c", "d"]
+    assert texts == memory.texts == ["A2", "B3", "C1", "D1"]
+    np.testing.assert_array_equal(vectors, memory.vectors)
+    np.testing.assert_array_equal(created_at, [2, 2, 0, 1])
+
+    # 追加后有效行号缓存随条数失效
+    store.append(["c"], ["C2"], _random_vectors(rng, 1), {}, created_at=3)
+    np.testing.assert_array_equal(store.live_rows(), [5, 6, 7, 4])
+
+
+def test_columnar_dimension_mismatch(workdir: Path):
+    """维度不一致的批次被拒绝，已写入的数据不受影响"""
+    rng = np.random.default_rng(2)
+    store = vmv._ColumnarStore(workdir, "float16")
+    store.append(["a"], ["A"], _random_vectors(rng, 1), {}, created_at=0)
+
+    try:
+        store.append(["b"], ["B"], _random_vectors(rng, 1, DIM + 1), {}, created_at=1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("维度不匹配时应抛出 ValueError")
+
+    ids, _, vectors, _, _ = vmv._ColumnarStore(workdir).load()
+    assert ids == ["a"] and vectors.shape == (1, DIM)
+
+
+def test_dot_scores(workdir: Path):
+    """dot_scores 与读回的向量矩阵直接相乘结果一致（含覆盖写入的版本）"""
+    rng = np.random.default_rng(3)
+    manager = vmv.VectorModelVersioning(storage_path=str(workdir / "versions"))
+    query = rng.standard_normal(DIM).astype(np.float32)
+
+    for dtype in vmv.STORAGE_DTYPES:
+        version_id = manager.register_model_version("qwen", f"test-{dtype}", dimension=DIM, storage_dtype=dtype)
+        assert manager.dot_scores(version_id, query).shape == (0,)
+
+        for ids in (["a", "b", "c"], ["b", "d"]):
+            vectors = _random_vectors(rng, len(ids))
+            manager.store_vectors(version_id, [(i, f"text {i}", v.tolist()) for i, v in zip(ids, vectors)])
+
+        ids, _, vectors = manager.load_stored_vectors(version_id)
+        assert ids == ["a", "b", "c", "d"]
+        np.testing.assert_allclose(manager.dot_scores(version_id, query), vectors @ query, rtol=1e-4, atol=1e-4)
+
+
+def test_dot_matrix_dtypes():
+    """float32/float16/int8 矩阵的点积与NumPy结果一致（缩小分块行数以覆盖分块路径）"""
+    rng = np.random.default_rng(4)
+    matrix = _random_vectors(rng, 1000)
+    query = rng.standard_normal(DIM).astype(np.float32)
+    quantized, scales = vector_backends.quantize_int8(matrix)
+
+    block_rows = vector_ops.DOT_BLOCK_ROWS
+    vector_ops.DOT_BLOCK_ROWS = 128
+    try:
+        np.testing.assert_allclose(vector_ops.dot_matrix(matrix, query), matrix @ query, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(vector_ops.dot_matrix(matrix.astype(np.float16), query),
+                                   matrix.astype(np.float16).astype(np.float32) @ query, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(vector_ops.dot_matrix(quantized, query, scales),
+                                   (quantized * scales[:, None]) @ query, rtol=1e-4, atol=1e-4)
+    finally:
+        vector_ops.DOT_BLOCK_ROWS = block_rows
+
+
+if __name__ == "__main__":
+    run_checks("向量存储自检", [
+        test_columnar_round_trip,
+        test_columnar_overwrite_matches_memory,
+        test_columnar_dimension_mismatch,
+        test_dot_scores,
+        test_dot_matrix_dtypes,
+    ])